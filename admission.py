@@ -0,0 +1,184 @@
+"""
+Admission control for upstream AI calls.
+
+Caps concurrent AI provider requests and paces them with token buckets
+sized to each provider's requests-per-minute and tokens-per-minute quota:
+every provider has its own pair of buckets, since each has its own account
+limits. Callers that cannot be admitted before their deadline, or that find
+the wait queue full, get `AdmissionRejected` right away so they can serve the
+fallback analysis.
+
+The controller lives in one process, so with several gunicorn workers each
+one paces against its own buckets: the configured rates are that worker's
+share of the account quota.
+"""
+import threading
+import time
+
+
+class AdmissionRejected(Exception):
+    """Raised when a call cannot be admitted within its deadline"""
+
+
+class TokenBucket:
+    """Classic token bucket; `rate_per_minute` of 0 disables it"""
+
+    def __init__(self, rate_per_minute):
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def enabled(self):
+        return self.capacity > 0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` tokens are available (0 if available now)"""
+        if not self.enabled:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount):
+        if self.enabled:
+            self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount):
+        if self.enabled and amount > 0:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class AdmissionTicket:
+    """Held while an upstream call is in flight"""
+
+    def __init__(self, controller, tokens, provider=None):
+        self.controller = controller
+        self.tokens = tokens
+        self.provider = provider
+        self._released = False
+
+    def release(self, actual_tokens=None):
+        """Free the concurrency slot; refund the token estimate if actual usage was lower"""
+        if self._released:
+            return
+        self._released = True
+        self.controller._release(self, actual_tokens)
+
+
+class AdmissionController:
+    """Concurrency limit + per-provider RPM/TPM token buckets with a bounded wait queue"""
+
+    def __init__(self, max_concurrent=8, requests_per_minute=0, tokens_per_minute=0,
+                 max_queue=50, default_timeout=5.0, provider_limits=None):
+        # requests_per_minute / tokens_per_minute apply to each provider without its own
+        # entry in provider_limits ({name: (requests_per_minute, tokens_per_minute)})
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.default_timeout = default_timeout
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.provider_limits = dict(provider_limits or {})
+        self._buckets = {}
+        self._cond = threading.Condition()
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    def _buckets_for(self, provider):
+        buckets = self._buckets.get(provider)
+        if buckets is None:
+            requests_per_minute, tokens_per_minute = self.provider_limits.get(
+                provider, (self.requests_per_minute, self.tokens_per_minute)
+            )
+            buckets = self._buckets[provider] = (TokenBucket(requests_per_minute), TokenBucket(tokens_per_minute))
+        return buckets
+
+    def _rate_wait(self, buckets, tokens, now):
+        requests_bucket, tokens_bucket = buckets
+        return max(
+            requests_bucket.wait_time(1, now),
+            tokens_bucket.wait_time(tokens, now)
+        )
+
+    def acquire(self, tokens=0, timeout=None, provider=None):
+        """Block until admitted and return a ticket, or raise AdmissionRejected
+
+        `provider` selects the rate buckets the call is paced against.
+        """
+        timeout = self.default_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        with self._cond:
+            if self.waiting >= self.max_queue:
+                self.rejected_queue_full += 1
+                raise AdmissionRejected('AI admission queue is full')
+            self.waiting += 1
+            buckets = self._buckets_for(provider)
+            try:
+                while True:
+                    now = time.monotonic()
+                    remaining = deadline - now
+                    if self.in_flight < self.max_concurrent:
+                        rate_wait = self._rate_wait(buckets, tokens, now)
+                        if rate_wait == 0:
+                            buckets[0].consume(1)
+                            buckets[1].consume(tokens)
+                            self.in_flight += 1
+                            self.admitted += 1
+                            waited_ms = (now - started) * 1000
+                            self.total_wait_ms += waited_ms
+                            self.max_wait_ms = max(self.max_wait_ms, waited_ms)
+                            return AdmissionTicket(self, tokens, provider)
+                        if rate_wait > remaining:
+                            # Quota will not recover before the deadline - do not make the caller wait
+                            self.rejected_timeout += 1
+                            raise AdmissionRejected('AI rate limit budget exhausted')
+                        self._cond.wait(rate_wait)
+                    else:
+                        if remaining <= 0:
+                            self.rejected_timeout += 1
+                            raise AdmissionRejected('No AI concurrency slot available before deadline')
+                        self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+
+    def _release(self, ticket, actual_tokens):
+        with self._cond:
+            self.in_flight -= 1
+            if actual_tokens is not None:
+                self._buckets_for(ticket.provider)[1].refund(ticket.tokens - actual_tokens)
+            self._cond.notify_all()
+
+    def stats(self):
+        """Return queue length, in-flight count, wait times, rejections and each provider's remaining budget"""
+        with self._cond:
+            budgets = {}
+            for provider, (requests_bucket, tokens_bucket) in self._buckets.items():
+                budgets[provider or 'default'] = {
+                    'requests_available': round(requests_bucket.tokens, 2) if requests_bucket.enabled else None,
+                    'tokens_available': round(tokens_bucket.tokens) if tokens_bucket.enabled else None
+                }
+            return {
+                'max_concurrent': self.max_concurrent,
+                'in_flight': self.in_flight,
+                'queue_length': self.waiting,
+                'max_queue': self.max_queue,
+                'admitted': self.admitted,
+                'rejected_queue_full': self.rejected_queue_full,
+                'rejected_timeout': self.rejected_timeout,
+                'avg_wait_ms': round(self.total_wait_ms / self.admitted, 2) if self.admitted else None,
+                'max_wait_ms': round(self.max_wait_ms, 2),
+                'providers': budgets
+            }
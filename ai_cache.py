@@ -0,0 +1,149 @@
+"""
+Persistent cache for AI compatibility analyses.
+
+Results are keyed on the inputs that actually shape the prompt (sign pair,
+gender pair, compatibility tier and prompt version) and stored in SQLite so
+they survive restarts. Analyses are generated from prompts that carry
+placeholder tokens instead of person names, so a stored result never
+contains a real name; the names are substituted only on the way out.
+"""
+import json
+import sqlite3
+import threading
+import time
+
+PERSON1_PLACEHOLDER = '{{person1_name}}'
+PERSON2_PLACEHOLDER = '{{person2_name}}'
+
+
+def make_cache_key(sign1, sign2, gender1, gender2, tier, prompt_version):
+    """Build the cache key for one analysis request"""
+    return '|'.join([
+        str(prompt_version),
+        (sign1 or '').lower(),
+        (sign2 or '').lower(),
+        (gender1 or '').strip().lower(),
+        (gender2 or '').strip().lower(),
+        tier or ''
+    ])
+
+
+def _replace_names(value, replacements):
+    """Recursively apply (old, new) string replacements to a JSON-like value"""
+    if isinstance(value, str):
+        for old, new in replacements:
+            if old:
+                value = value.replace(old, new)
+        return value
+    if isinstance(value, list):
+        return [_replace_names(item, replacements) for item in value]
+    if isinstance(value, dict):
+        return {key: _replace_names(item, replacements) for key, item in value.items()}
+    return value
+
+
+def personalize(result, name1, name2):
+    """Substitute the placeholders in a cached result with real names"""
+    return _replace_names(result, [
+        (PERSON1_PLACEHOLDER, (name1 or '').strip()),
+        (PERSON2_PLACEHOLDER, (name2 or '').strip())
+    ])
+
+
+class AnalysisCache:
+    """SQLite-backed LRU/TTL cache for AI analysis results"""
+
+    def __init__(self, path, max_entries=2000, ttl_seconds=7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS analysis_cache ('
+            ' cache_key TEXT PRIMARY KEY,'
+            ' payload TEXT NOT NULL,'
+            ' created_at REAL NOT NULL,'
+            ' last_access REAL NOT NULL)'
+        )
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_analysis_cache_last_access '
+            'ON analysis_cache (last_access)'
+        )
+
+    def get(self, key):
+        """Return the cached placeholder-form result or None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT payload, created_at FROM analysis_cache WHERE cache_key = ?',
+                (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            payload, created_at = row
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                self._conn.execute('DELETE FROM analysis_cache WHERE cache_key = ?', (key,))
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self._conn.execute(
+                'UPDATE analysis_cache SET last_access = ? WHERE cache_key = ?',
+                (now, key)
+            )
+            self.hits += 1
+        return json.loads(payload)
+
+    def put(self, key, result):
+        """Store a placeholder-form result, evicting least recently used entries past the limit"""
+        now = time.time()
+        payload = json.dumps(result, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO analysis_cache (cache_key, payload, created_at, last_access) '
+                'VALUES (?, ?, ?, ?)',
+                (key, payload, now, now)
+            )
+            if self.ttl_seconds:
+                expired = self._conn.execute(
+                    'DELETE FROM analysis_cache WHERE created_at < ?',
+                    (now - self.ttl_seconds,)
+                ).rowcount
+                self.evictions += max(expired, 0)
+            overflow = self._size() - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    'DELETE FROM analysis_cache WHERE cache_key IN ('
+                    ' SELECT cache_key FROM analysis_cache ORDER BY last_access ASC LIMIT ?)',
+                    (overflow,)
+                )
+                self.evictions += overflow
+
+    def clear(self):
+        """Drop every cached entry"""
+        with self._lock:
+            self._conn.execute('DELETE FROM analysis_cache')
+
+    def _size(self):
+        return self._conn.execute('SELECT COUNT(*) FROM analysis_cache').fetchone()[0]
+
+    def stats(self):
+        """Return hit/miss counters and current size"""
+        with self._lock:
+            size = self._size()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions,
+            'entries': size,
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds
+        }
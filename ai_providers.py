@@ -0,0 +1,611 @@
+"""
+AI providers (OpenAI, Gemini) behind one interface, with latency-aware
+routing and hedged requests.
+
+Each provider turns a prompt into a normalized reply (text, finish reason,
+refusal flag, token usage) or an open stream of text deltas, using its own
+pooled `UpstreamClient` (retries and circuit breaker per provider).
+
+`ProviderRouter` keeps a rolling latency window and success rate per
+provider and tries the one with the lowest expected latency first. If that
+call has not produced a valid result (for streams: its first text) within
+the provider's p95 latency, the next provider is called as well and the
+first valid result wins; the slower call is left to finish in the
+background and its stream, if any, is closed. A hedge budget caps the
+share of calls that may fire a second request, so a slow provider cannot
+double the upstream load. When the caller passes an `admit` hook, every
+attempt after the first (hedge or failover) must also be admitted - the
+concurrency limit and that provider's rate limits count each upstream
+request - and is skipped when admission would make it wait.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class ProviderError(Exception):
+    """Raised when no provider could be called"""
+
+
+def _usage(prompt_tokens, completion_tokens, total_tokens=None):
+    if prompt_tokens is None and completion_tokens is None and total_tokens is None:
+        return None
+    prompt_tokens = prompt_tokens or 0
+    completion_tokens = completion_tokens or 0
+    return {
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'total_tokens': total_tokens if total_tokens is not None else prompt_tokens + completion_tokens
+    }
+
+
+class AIReply:
+    """One finished completion, normalized across providers"""
+
+    def __init__(self, provider, model, status, text='', finish_reason=None, refused=False,
+                 usage=None, timing=None, attempts=1, body_chars=0):
+        self.provider = provider
+        self.model = model
+        self.status = status
+        self.text = text
+        # 'stop', 'length' (cut off at max tokens) or the provider's own reason
+        self.finish_reason = finish_reason
+        self.refused = refused
+        self.usage = usage
+        self.timing = timing
+        self.attempts = attempts
+        self.body_chars = body_chars
+        # Set by the caller's validator so the reply is parsed only once
+        self.sections = None
+
+    @property
+    def ok(self):
+        return self.status == 200 and not self.refused and bool(self.text)
+
+
+class AIStream:
+    """An open streaming reply; iterating yields text deltas, `usage` is set once the provider sends it"""
+
+    def __init__(self, provider, model, response, parse_event):
+        self.provider = provider
+        self.model = model
+        self.status = response.status_code
+        self.timing = getattr(response, 'upstream_timing', None)
+        self.usage = None
+        self.started = False
+        self._response = response
+        self._parse_event = parse_event
+        self._lines = response.iter_lines() if self.status == 200 else iter(())
+        self._pending = []
+        self._done = False
+
+    def _next_delta(self):
+        while not self._done:
+            try:
+                raw_line = next(self._lines)
+            except StopIteration:
+                break
+            # Providers send UTF-8 without a charset, decode it ourselves
+            line = raw_line.decode('utf-8').strip()
+            if not line.startswith('data:'):
+                continue
+            chunk = line[5:].strip()
+            if chunk == '[DONE]':
+                break
+            delta, usage = self._parse_event(json.loads(chunk))
+            if usage:
+                self.usage = usage
+            if delta:
+                return delta
+        self._done = True
+        return None
+
+    def prime(self):
+        """Block until the first text arrives; False if the stream ended without any"""
+        delta = self._next_delta()
+        if delta is not None:
+            self._pending.append(delta)
+            self.started = True
+        return self.started
+
+    def __iter__(self):
+        while self._pending:
+            yield self._pending.pop(0)
+        while True:
+            delta = self._next_delta()
+            if delta is None:
+                return
+            yield delta
+
+    def close(self):
+        self._done = True
+        self._response.close()
+
+
+class AIProvider:
+    """Base class: a model behind an HTTP API, called through an UpstreamClient"""
+
+    name = None
+    placeholder_key = None
+
+    def __init__(self, client, api_key, model, temperature=0.7, max_tokens=8192, url=None,
+                 timeout=60, name=None):
+        self.client = client
+        self.api_key = api_key
+        self.model = model
+        self.temperature = temperature
+        # Ceiling for any single call, whatever the caller asks for
+        self.max_tokens = max_tokens
+        self.url = url or self.default_url
+        self.timeout = timeout
+        if name:
+            self.name = name
+
+    @property
+    def configured(self):
+        return bool(self.api_key) and self.api_key != self.placeholder_key
+
+    def available(self):
+        """Configured and not skipped by an open circuit breaker"""
+        return self.configured and self.client.breaker.state != 'open'
+
+    def complete(self, prompt, max_tokens, response_format=None):
+        raise NotImplementedError
+
+    def open_stream(self, prompt, max_tokens, response_format=None):
+        raise NotImplementedError
+
+
+class OpenAIProvider(AIProvider):
+    """OpenAI chat completions"""
+
+    name = 'openai'
+    placeholder_key = 'your-openai-api-key-here'
+    default_url = 'https://api.openai.com/v1/chat/completions'
+
+    def build_request(self, prompt, max_tokens, response_format=None, stream=False):
+        data = {
+            'model': self.model,
+            'messages': [{'role': 'user', 'content': prompt}],
+            'max_tokens': min(max_tokens, self.max_tokens),
+            'temperature': self.temperature
+        }
+        if response_format:
+            data['response_format'] = response_format
+        if stream:
+            data['stream'] = True
+            # Final chunk carries token usage, otherwise streamed calls are invisible in the metrics
+            data['stream_options'] = {'include_usage': True}
+        return data
+
+    def _post(self, data, stream=False):
+        return self.client.post(
+            self.url,
+            headers={
+                'Authorization': f'Bearer {self.api_key}',
+                'Content-Type': 'application/json'
+            },
+            json=data,
+            stream=stream,
+            timeout=self.timeout
+        )
+
+    @staticmethod
+    def _usage(usage):
+        if not usage:
+            return None
+        return _usage(usage.get('prompt_tokens'), usage.get('completion_tokens'), usage.get('total_tokens'))
+
+    def complete(self, prompt, max_tokens, response_format=None):
+        response = self._post(self.build_request(prompt, max_tokens, response_format))
+        timing = getattr(response, 'upstream_timing', None)
+        attempts = getattr(response, 'upstream_attempts', 1)
+        if response.status_code != 200:
+            return AIReply(self.name, self.model, response.status_code, timing=timing,
+                           attempts=attempts, body_chars=len(response.text))
+        result = response.json()
+        choice = result['choices'][0]
+        message = choice['message']
+        return AIReply(
+            self.name, self.model, 200,
+            text=(message.get('content') or '').strip(),
+            finish_reason=choice.get('finish_reason'),
+            refused=bool(message.get('refusal')),
+            usage=self._usage(result.get('usage')),
+            timing=timing,
+            attempts=attempts
+        )
+
+    def _parse_event(self, payload):
+        choices = payload.get('choices') or [{}]
+        delta = (choices[0].get('delta') or {}).get('content') or ''
+        return delta, self._usage(payload.get('usage'))
+
+    def open_stream(self, prompt, max_tokens, response_format=None):
+        response = self._post(self.build_request(prompt, max_tokens, response_format, stream=True), stream=True)
+        return AIStream(self.name, self.model, response, self._parse_event)
+
+
+class GeminiProvider(AIProvider):
+    """Google Gemini generateContent"""
+
+    name = 'gemini'
+    placeholder_key = 'your-gemini-api-key-here'
+    default_url = 'https://generativelanguage.googleapis.com/v1beta/models'
+    # Finish reasons meaning the content was withheld rather than cut short
+    BLOCKED_REASONS = {'SAFETY', 'RECITATION', 'BLOCKLIST', 'PROHIBITED_CONTENT', 'SPII'}
+
+    def build_request(self, prompt, max_tokens, response_format=None):
+        generation_config = {
+            'temperature': self.temperature,
+            'maxOutputTokens': min(max_tokens, self.max_tokens)
+        }
+        # Gemini accepts only a subset of JSON Schema, so ask for JSON and let the parser check the keys
+        if response_format:
+            generation_config['responseMimeType'] = 'application/json'
+        return {
+            'contents': [{'role': 'user', 'parts': [{'text': prompt}]}],
+            'generationConfig': generation_config
+        }
+
+    def _post(self, method, data, stream=False):
+        return self.client.post(
+            f'{self.url}/{self.model}:{method}',
+            headers={
+                'x-goog-api-key': self.api_key,
+                'Content-Type': 'application/json'
+            },
+            params={'alt': 'sse'} if stream else None,
+            json=data,
+            stream=stream,
+            timeout=self.timeout
+        )
+
+    @staticmethod
+    def _usage(metadata):
+        if not metadata:
+            return None
+        return _usage(metadata.get('promptTokenCount'), metadata.get('candidatesTokenCount'),
+                      metadata.get('totalTokenCount'))
+
+    @staticmethod
+    def _text(candidate):
+        parts = (candidate.get('content') or {}).get('parts') or []
+        return ''.join(part.get('text', '') for part in parts)
+
+    def complete(self, prompt, max_tokens, response_format=None):
+        response = self._post('generateContent', self.build_request(prompt, max_tokens, response_format))
+        timing = getattr(response, 'upstream_timing', None)
+        attempts = getattr(response, 'upstream_attempts', 1)
+        if response.status_code != 200:
+            return AIReply(self.name, self.model, response.status_code, timing=timing,
+                           attempts=attempts, body_chars=len(response.text))
+        result = response.json()
+        candidate = (result.get('candidates') or [{}])[0]
+        reason = candidate.get('finishReason')
+        blocked = bool((result.get('promptFeedback') or {}).get('blockReason')) or reason in self.BLOCKED_REASONS
+        return AIReply(
+            self.name, self.model, 200,
+            text=self._text(candidate).strip(),
+            finish_reason={'STOP': 'stop', 'MAX_TOKENS': 'length'}.get(reason, reason),
+            refused=blocked,
+            usage=self._usage(result.get('usageMetadata')),
+            timing=timing,
+            attempts=attempts
+        )
+
+    def _parse_event(self, payload):
+        candidate = (payload.get('candidates') or [{}])[0]
+        # usageMetadata is cumulative, the last chunk holds the totals
+        return self._text(candidate), self._usage(payload.get('usageMetadata'))
+
+    def open_stream(self, prompt, max_tokens, response_format=None):
+        response = self._post('streamGenerateContent', self.build_request(prompt, max_tokens, response_format),
+                              stream=True)
+        return AIStream(self.name, self.model, response, self._parse_event)
+
+
+class ProviderStats:
+    """Rolling latency windows (per call kind) and outcomes for one provider"""
+
+    def __init__(self, window=200):
+        self.latencies = {}
+        self.outcomes = deque(maxlen=window)
+        self.window = window
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.wins = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.lost_races = 0
+
+    def observe(self, kind, seconds, success):
+        self.calls += 1
+        self.outcomes.append(success)
+        if success:
+            self.successes += 1
+            window = self.latencies.get(kind)
+            if window is None:
+                window = self.latencies[kind] = deque(maxlen=self.window)
+            window.append(seconds)
+        else:
+            self.failures += 1
+
+    def samples(self, kind):
+        return len(self.latencies.get(kind, ()))
+
+    def quantile(self, kind, q):
+        values = sorted(self.latencies.get(kind, ()))
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    @property
+    def success_rate(self):
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 1.0
+
+
+def _release(ticket, value=None):
+    """Free an attempt's admission ticket, refunding by the reply's actual usage when known"""
+    if ticket is None:
+        return
+    usage = getattr(value, 'usage', None)
+    ticket.release(usage.get('total_tokens') if usage else None)
+
+
+class ProviderRouter:
+    """Orders providers by expected latency and hedges slow calls on the next one"""
+
+    def __init__(self, providers, routing='latency', hedge=True, hedge_quantile=0.95,
+                 hedge_min_delay=0.5, hedge_default_delay=8.0, hedge_budget=0.1,
+                 min_samples=20, window=200, max_workers=32):
+        self.providers = list(providers)
+        self.routing = routing
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        # Used until a provider has min_samples successful calls of a kind
+        self.hedge_default_delay = hedge_default_delay
+        self.hedge_budget = hedge_budget
+        self.min_samples = min_samples
+        self.max_workers = max_workers
+        self._stats = {provider.name: ProviderStats(window) for provider in self.providers}
+        self._lock = threading.Lock()
+        # Each call earns hedge_budget of a hedge; a hedge spends a whole one
+        self._hedge_tokens = 1.0
+        self.routed_calls = 0
+        self.hedges_fired = 0
+        self.hedges_denied = 0
+        self.hedges_not_admitted = 0
+        self.failovers = 0
+        self.failovers_not_admitted = 0
+        self._executor = None
+        self._pid = None
+
+    @property
+    def executor(self):
+        # Threads do not survive a fork; each worker gets its own pool
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='ai-call')
+                    self._pid = os.getpid()
+        return self._executor
+
+    def configured(self):
+        return [provider for provider in self.providers if provider.configured]
+
+    def expected_latency(self, provider, kind):
+        """Median latency inflated by the recent failure rate; None if never called, inf if it never succeeded"""
+        stats = self._stats[provider.name]
+        if stats.calls == 0:
+            return None
+        if stats.samples(kind) == 0:
+            return float('inf')
+        return stats.quantile(kind, 0.5) / max(stats.success_rate, 0.05)
+
+    def ranked(self, kind):
+        """Available providers, fastest expected first (configured order for ties)"""
+        available = [provider for provider in self.providers if provider.available()]
+        if self.routing != 'latency':
+            return available
+        with self._lock:
+            expected = [self.expected_latency(provider, kind) for provider in available]
+        # Providers never called go first so each gets measured
+        order = sorted(range(len(available)), key=lambda i: (expected[i] is not None, expected[i] or 0.0, i))
+        return [available[i] for i in order]
+
+    def hedge_delay(self, provider, kind):
+        """Seconds to wait on `provider` before hedging: its p95 latency, floored at hedge_min_delay"""
+        stats = self._stats[provider.name]
+        with self._lock:
+            if stats.samples(kind) < self.min_samples:
+                return self.hedge_default_delay
+            return max(self.hedge_min_delay, stats.quantile(kind, self.hedge_quantile))
+
+    def _take_hedge_token(self):
+        with self._lock:
+            if self._hedge_tokens >= 1.0:
+                self._hedge_tokens -= 1.0
+                self.hedges_fired += 1
+                return True
+            self.hedges_denied += 1
+            return False
+
+    def _return_hedge_token(self):
+        with self._lock:
+            self._hedge_tokens += 1.0
+            self.hedges_fired -= 1
+            self.hedges_not_admitted += 1
+
+    def _attempt(self, provider, start, kind, is_valid):
+        started = time.perf_counter()
+        try:
+            value = start(provider)
+        except Exception:
+            with self._lock:
+                self._stats[provider.name].observe(kind, time.perf_counter() - started, False)
+            raise
+        valid = is_valid(value)
+        with self._lock:
+            self._stats[provider.name].observe(kind, time.perf_counter() - started, valid)
+        return value, valid
+
+    def call(self, start, kind, is_valid, discard=None, hedge=True, admit=None, candidates=None):
+        """First valid `start(provider)` result, hedging a slow primary; see the module docstring
+
+        `candidates` is the provider order to try (default: `ranked(kind)`); a
+        caller that admitted the first attempt against a provider passes the
+        ranking it used. The caller's own admission covers the first attempt.
+        `admit(provider)`, if given, returns a ticket (with
+        `release(actual_tokens)`) for each further attempt on that provider,
+        or None when it is not admitted right away. Each such ticket belongs to
+        its attempt and is released when the attempt is over: at once for a
+        failed attempt, when the race ends for the winner (the caller's ticket
+        covers the call from then on) and when it finishes for a loser.
+
+        When every provider fails, returns the last invalid result (so the caller
+        can tell why) or raises the last exception.
+        """
+        candidates = self.ranked(kind) if candidates is None else candidates
+        if not candidates:
+            raise ProviderError('No AI provider available')
+        with self._lock:
+            self.routed_calls += 1
+            self._hedge_tokens = min(10.0, self._hedge_tokens + self.hedge_budget)
+
+        pending = {}
+        next_index = 0
+        hedge_at = None
+        hedge_source = None
+
+        def launch(as_hedge=False, ticket=None):
+            nonlocal next_index, hedge_at, hedge_source
+            provider = candidates[next_index]
+            next_index += 1
+            future = self.executor.submit(self._attempt, provider, start, kind, is_valid)
+            pending[future] = (provider, as_hedge, ticket)
+            if hedge and self.hedge and next_index < len(candidates):
+                hedge_at = time.monotonic() + self.hedge_delay(provider, kind)
+                hedge_source = provider
+            else:
+                hedge_at = None
+
+        launch()
+        last_value = last_error = None
+        while pending:
+            timeout = None if hedge_at is None else max(0.0, hedge_at - time.monotonic())
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # Primary is slower than its p95: race it against the next provider
+                hedge_at = None
+                if self._take_hedge_token():
+                    ticket = admit(candidates[next_index]) if admit else None
+                    if admit and ticket is None:
+                        self._return_hedge_token()
+                        continue
+                    with self._lock:
+                        self._stats[hedge_source.name].hedged += 1
+                    launch(as_hedge=True, ticket=ticket)
+                continue
+            for future in done:
+                provider, as_hedge, ticket = pending.pop(future)
+                try:
+                    value, valid = future.result()
+                except Exception as e:
+                    last_error = e
+                    _release(ticket)
+                    continue
+                _release(ticket, value)
+                if valid:
+                    self._finish_race(provider, as_hedge, pending, discard)
+                    return value
+                if last_value is not None and discard:
+                    discard(last_value)
+                last_value = value
+            if not pending and next_index < len(candidates):
+                # Fail over right away instead of waiting for the hedge delay
+                ticket = admit(candidates[next_index]) if admit else None
+                if admit and ticket is None:
+                    with self._lock:
+                        self.failovers_not_admitted += 1
+                    break
+                with self._lock:
+                    self.failovers += 1
+                launch(ticket=ticket)
+        if last_value is not None:
+            return last_value
+        raise last_error or ProviderError('No valid AI result')
+
+    def _finish_race(self, winner, as_hedge, pending, discard):
+        with self._lock:
+            stats = self._stats[winner.name]
+            stats.wins += 1
+            if as_hedge:
+                stats.hedge_wins += 1
+            for provider, _, _ in pending.values():
+                self._stats[provider.name].lost_races += 1
+
+        # Losers keep running; close whatever they return and free their tickets
+        def drop(future, ticket):
+            try:
+                value, _ = future.result()
+            except Exception:
+                _release(ticket)
+                return
+            if discard:
+                discard(value)
+            _release(ticket, value)
+        for future, (_, _, ticket) in pending.items():
+            future.add_done_callback(lambda done, ticket=ticket: drop(done, ticket))
+
+    def stats(self):
+        providers = []
+        with self._lock:
+            for provider in self.providers:
+                stats = self._stats[provider.name]
+                latency = {
+                    kind: {
+                        'samples': stats.samples(kind),
+                        'p50_ms': round(stats.quantile(kind, 0.5) * 1000, 1),
+                        'p95_ms': round(stats.quantile(kind, 0.95) * 1000, 1),
+                        'p99_ms': round(stats.quantile(kind, 0.99) * 1000, 1)
+                    }
+                    for kind in stats.latencies
+                }
+                providers.append({
+                    'name': provider.name,
+                    'model': provider.model,
+                    'configured': provider.configured,
+                    'circuit_state': provider.client.breaker.state,
+                    'calls': stats.calls,
+                    'successes': stats.successes,
+                    'failures': stats.failures,
+                    'recent_success_rate': round(stats.success_rate, 3),
+                    'latency': latency,
+                    'wins': stats.wins,
+                    'hedged': stats.hedged,
+                    'hedge_wins': stats.hedge_wins,
+                    'lost_races': stats.lost_races
+                })
+            totals = {
+                'routed_calls': self.routed_calls,
+                'hedges_fired': self.hedges_fired,
+                'hedges_denied': self.hedges_denied,
+                'hedges_not_admitted': self.hedges_not_admitted,
+                'failovers': self.failovers,
+                'failovers_not_admitted': self.failovers_not_admitted
+            }
+        return {
+            'routing': self.routing,
+            'hedging': self.hedge,
+            'hedge_quantile': self.hedge_quantile,
+            'hedge_budget': self.hedge_budget,
+            'order': {kind: [provider.name for provider in self.ranked(kind)] for kind in ('complete', 'stream')},
+            **totals,
+            'providers': providers
+        }
@@ -0,0 +1,252 @@
+"""
+Submission analytics: sign, tier and gender-pair counts, all time and per
+day / ISO week.
+
+The counters are folded incrementally from the submission journal (the
+outbox), which every worker shares, so each worker converges on the same
+totals and a read only copies the counters of one bucket: its cost does
+not depend on how many submissions exist. A background thread applies new
+journal entries shortly after they are appended (right away for this
+worker's own appends) and periodically writes the counters, with the
+journal position they cover, to a JSON snapshot. On start the snapshot is
+loaded and only the entries after it are read; without a usable snapshot
+the counters are rebuilt from the whole journal. That first load runs on the
+background thread, so worker start-up never waits for it; until it is done
+the report says it is not ready. If journal retention is turned on, each
+snapshot is synced to disk before the journal prunes the delivered entries
+it covers; a rebuild without the snapshot then counts only what the journal
+still holds, so with retention on the snapshot must be kept.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+BUCKETS = ('all', 'day', 'week')
+
+
+def _empty_tally():
+    return {'total': 0, 'signs': {}, 'tiers': {}, 'gender_pairs': {}}
+
+
+def _bump(counts, key):
+    counts[key] = counts.get(key, 0) + 1
+
+
+def period_keys(created_at):
+    """Day ('2024-05-17') and ISO week ('2024-W20') of a journal timestamp, in server local time"""
+    moment = datetime.fromtimestamp(created_at)
+    year, week, _ = moment.isocalendar()
+    return moment.strftime('%Y-%m-%d'), f'{year}-W{week:02d}'
+
+
+def preceding_periods(bucket, end, count):
+    """`count` consecutive day or week keys ending at `end`, oldest first; ValueError if `end` is malformed"""
+    if bucket == 'day':
+        moment, step = datetime.strptime(end, '%Y-%m-%d'), timedelta(days=1)
+    else:
+        moment, step = datetime.strptime(end + '-1', '%G-W%V-%u'), timedelta(weeks=1)
+    keys = []
+    for _ in range(count):
+        day, week = period_keys(moment.timestamp())
+        keys.append(day if bucket == 'day' else week)
+        moment -= step
+    return keys[::-1]
+
+
+class SubmissionStats:
+    """Counters over the submission journal, kept in memory and snapshotted to disk"""
+
+    def __init__(self, outbox, facts_from_row, snapshot_path=None, refresh_interval=1.0,
+                 snapshot_interval=60.0, read_batch=1000):
+        # facts_from_row(row) returns {'signs': (s1, s2), 'tier': t, 'genders': (g1, g2)}
+        self.outbox = outbox
+        self.facts_from_row = facts_from_row
+        self.snapshot_path = snapshot_path
+        self.refresh_interval = refresh_interval
+        self.snapshot_interval = snapshot_interval
+        self.read_batch = read_batch
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._ready = threading.Event()
+        self._thread = None
+        self._reset(0)
+        self.skipped = 0
+        self._snapshot_seq = None
+
+    def _reset(self, seq, buckets=None):
+        self._seq = seq
+        self._buckets = buckets or {bucket: {} for bucket in BUCKETS}
+        self._updated_at = time.time()
+
+    def load(self):
+        """Start from the snapshot when it matches the journal, else rebuild from the first entry"""
+        snapshot = None
+        if self.snapshot_path:
+            try:
+                with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                    snapshot = json.load(f)
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                logger.warning("Ignoring unreadable stats snapshot: %s", e)
+        # A snapshot ahead of the journal belongs to a journal that was replaced
+        if (snapshot and snapshot.get('version') == SNAPSHOT_VERSION
+                and snapshot.get('seq', 0) <= self.outbox.last_seq()):
+            with self._lock:
+                self._reset(snapshot['seq'], snapshot['buckets'])
+            self._snapshot_seq = snapshot['seq']
+        else:
+            with self._lock:
+                self._reset(0)
+            logger.info("Rebuilding submission stats from the journal")
+        applied = self.catch_up()
+        self._ready.set()
+        return applied
+
+    def catch_up(self):
+        """Apply journal entries appended since the last call; returns how many were applied"""
+        applied = 0
+        while True:
+            entries = self.outbox.read_since(self._seq, self.read_batch)
+            if not entries:
+                break
+            with self._lock:
+                for seq, created_at, row in entries:
+                    self._seq = seq
+                    try:
+                        facts = self.facts_from_row(row)
+                    except Exception:
+                        self.skipped += 1
+                        continue
+                    self._apply(created_at, facts)
+                    applied += 1
+                self._updated_at = time.time()
+            if len(entries) < self.read_batch:
+                break
+        return applied
+
+    def _apply(self, created_at, facts):
+        day, week = period_keys(created_at)
+        gender_pair = ' - '.join(sorted(facts['genders']))
+        for bucket, key in (('all', 'all'), ('day', day), ('week', week)):
+            tally = self._buckets[bucket].get(key)
+            if tally is None:
+                tally = self._buckets[bucket][key] = _empty_tally()
+            tally['total'] += 1
+            for sign in facts['signs']:
+                _bump(tally['signs'], sign)
+            _bump(tally['tiers'], facts['tier'])
+            _bump(tally['gender_pairs'], gender_pair)
+
+    def report(self, bucket='all', period=None, last=1):
+        """Counters of the `last` periods of a bucket up to `period` (default: the current one)"""
+        if bucket == 'all':
+            keys = ['all']
+        else:
+            if period is None:
+                day, week = period_keys(time.time())
+                period = day if bucket == 'day' else week
+            keys = preceding_periods(bucket, period, last)
+        with self._lock:
+            periods = []
+            for key in keys:
+                tally = self._buckets[bucket].get(key) or _empty_tally()
+                periods.append({
+                    'period': key,
+                    'total': tally['total'],
+                    'signs': dict(tally['signs']),
+                    'tiers': dict(tally['tiers']),
+                    'gender_pairs': dict(tally['gender_pairs'])
+                })
+            return {
+                'ready': self._ready.is_set(),
+                'bucket': bucket,
+                'periods': periods,
+                'journal_seq': self._seq,
+                'snapshot_seq': self._snapshot_seq,
+                'updated_at': datetime.fromtimestamp(self._updated_at).isoformat()
+            }
+
+    def write_snapshot(self):
+        """Write counters and the journal position they cover (atomic replace)"""
+        if not self.snapshot_path:
+            return
+        with self._lock:
+            seq = self._seq
+            payload = json.dumps({
+                'version': SNAPSHOT_VERSION,
+                'seq': seq,
+                'written_at': time.time(),
+                'buckets': self._buckets
+            }, ensure_ascii=False)
+        directory = os.path.dirname(self.snapshot_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Every worker may write it; each uses its own temporary file
+        tmp_path = f'{self.snapshot_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(payload)
+            # Pruning relies on the snapshot, so it must be on disk first
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        self._snapshot_seq = seq
+        self.outbox.prune(seq)
+
+    def notify(self):
+        """Entries were appended by this process; apply them without waiting for the next poll"""
+        self._wake.set()
+
+    def ready(self):
+        """True once the snapshot is loaded and the journal read up to its end"""
+        return self._ready.is_set()
+
+    def start(self):
+        """Load (snapshot plus journal catch-up) and then follow the journal, all on a background thread"""
+        self._thread = threading.Thread(target=self._run, name='submission-stats', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            self.load()
+        except Exception:
+            # Whatever was applied is kept; the loop below carries on from there
+            logger.exception("Could not load submission stats")
+        last_snapshot = time.monotonic()
+        while not self._stopping.is_set():
+            self._wake.wait(self.refresh_interval)
+            self._wake.clear()
+            try:
+                self.catch_up()
+                self._ready.set()
+                if (time.monotonic() - last_snapshot >= self.snapshot_interval
+                        and self._seq != self._snapshot_seq):
+                    self.write_snapshot()
+                    last_snapshot = time.monotonic()
+            except Exception:
+                logger.exception("Could not update submission stats")
+
+    def stop(self, timeout=5.0):
+        """Apply the last entries and write a final snapshot"""
+        if not self._thread or not self._thread.is_alive():
+            return
+        self._stopping.set()
+        self._wake.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            # Still loading; catching up from here as well would apply entries twice
+            logger.warning("Submission stats still loading after %ss, no final snapshot", timeout)
+            return
+        try:
+            self.catch_up()
+            if self._seq != self._snapshot_seq:
+                self.write_snapshot()
+        except Exception:
+            logger.exception("Could not write final submission stats snapshot")
@@ -1,17 +1,41 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Blueprint, Response, current_app, g, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
-import requests
 import json
+import logging
 import os
-from datetime import datetime
+import re
+import atexit
+import contextvars
+import hashlib
+import threading
+import time
+import unicodedata
+from datetime import datetime, date, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import gspread
 from google.oauth2.service_account import Credentials
 from config import config
 from dotenv import load_dotenv
+from ai_cache import (AnalysisCache, make_cache_key, personalize,
+                      PERSON1_PLACEHOLDER, PERSON2_PLACEHOLDER)
+from outbox import SubmissionOutbox
+from analytics import SubmissionStats, BUCKETS as STATS_BUCKETS
+from http_client import UpstreamClient, CircuitBreaker
+from ai_providers import OpenAIProvider, GeminiProvider, ProviderRouter
+from jobs import JobManager, JobQueueFull
+from admission import AdmissionController, AdmissionRejected
+from singleflight import SingleFlight, SingleFlightTimeout
+from structured_log import setup_logging, register_secret, new_request_id, request_id_var
+from metrics import MetricsRegistry
+from static_assets import StaticAssetCache
+from compression import available_encodings, choose_encoding, compress
+from matchmaking import top_k_matches
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 def setup_google_credentials():
     """Setup Google credentials from environment variable for production"""
     try:
@@ -24,122 +48,475 @@ def setup_google_credentials():
             with open('google-credentials.json', 'w') as f:
                 json.dump(credentials_data, f, indent=2)
             
-            print("✅ Google credentials file created from environment variable")
+            logger.info("Google credentials file created from environment variable")
             return True
         else:
-            print("⚠️ No GOOGLE_CREDENTIALS_JSON found in environment variables")
+            logger.warning("No GOOGLE_CREDENTIALS_JSON found in environment variables")
             return False
             
     except json.JSONDecodeError as e:
-        print(f"❌ Error parsing GOOGLE_CREDENTIALS_JSON: {e}")
+        logger.error("Error parsing GOOGLE_CREDENTIALS_JSON: %s", e.msg)
         return False
     except Exception as e:
-        print(f"❌ Error setting up Google credentials: {e}")
+        logger.error("Error setting up Google credentials: %s", type(e).__name__)
         return False
 
-# Setup credentials when app starts
-if os.environ.get('FLASK_ENV') == 'production':
-    setup_google_credentials()
-
-app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
-
 # Load configuration
 config_name = os.environ.get('FLASK_ENV', 'development')
-app.config.from_object(config[config_name])
+settings = config[config_name]
+
+# Log records are queued and written by a background thread; keys never reach the output
+setup_logging(settings.LOG_LEVEL, settings.LOG_FORMAT, settings.LOG_DEBUG_SAMPLE_RATE)
+for secret in (settings.OPENAI_API_KEY, settings.GEMINI_API_KEY, settings.SECRET_KEY):
+    register_secret(secret)
+
+# Routes live on a blueprint so create_app() can build the Flask app
+main = Blueprint('main', __name__)
 
 # Configuration constants
-GEMINI_API_KEY = app.config['GEMINI_API_KEY']
-OPENAI_API_KEY = app.config['OPENAI_API_KEY']
-GOOGLE_SHEETS_CREDENTIALS_PATH = app.config['GOOGLE_CREDENTIALS_PATH']
-GOOGLE_SHEET_ID = app.config['GOOGLE_SHEET_ID']
-GOOGLE_SHEETS_ENABLED = app.config['GOOGLE_SHEETS_ENABLED']
-HOROSCOPE_SYSTEM_ENABLED = app.config['HOROSCOPE_SYSTEM_ENABLED']
-
-# Google Sheets setup
+GEMINI_API_KEY = settings.GEMINI_API_KEY
+OPENAI_API_KEY = settings.OPENAI_API_KEY
+GOOGLE_SHEETS_CREDENTIALS_PATH = settings.GOOGLE_CREDENTIALS_PATH
+GOOGLE_SHEET_ID = settings.GOOGLE_SHEET_ID
+GOOGLE_SHEETS_ENABLED = settings.GOOGLE_SHEETS_ENABLED
+HOROSCOPE_SYSTEM_ENABLED = settings.HOROSCOPE_SYSTEM_ENABLED
+GOOGLE_TOKEN_REFRESH_MARGIN = settings.GOOGLE_TOKEN_REFRESH_MARGIN
+
+ZODIAC_SIGNS = ['aries', 'taurus', 'gemini', 'cancer', 'leo', 'virgo',
+                'libra', 'scorpio', 'sagittarius', 'capricorn', 'aquarius', 'pisces']
+SIGN_INDEX = {sign: index for index, sign in enumerate(ZODIAC_SIGNS)}
+AI_CACHE_ENABLED = settings.AI_CACHE_ENABLED
+ZODIAC_BULK_MAX_ITEMS = settings.ZODIAC_BULK_MAX_ITEMS
+MATCHMAKING_MAX_PARTICIPANTS = settings.MATCHMAKING_MAX_PARTICIPANTS
+MATCHMAKING_MAX_K = settings.MATCHMAKING_MAX_K
+STATS_MAX_PERIODS = settings.STATS_MAX_PERIODS
+ANALYSIS_BATCH_MAX_PAIRS = settings.ANALYSIS_BATCH_MAX_PAIRS
+ANALYSIS_BATCH_CONCURRENCY = settings.ANALYSIS_BATCH_CONCURRENCY
+RESPONSE_COMPRESSION_ENABLED = settings.RESPONSE_COMPRESSION_ENABLED
+RESPONSE_COMPRESSION_MIN_SIZE = settings.RESPONSE_COMPRESSION_MIN_SIZE
+HOROSCOPE_WARMUP_LEAD_SECONDS = settings.HOROSCOPE_WARMUP_LEAD_SECONDS
+AI_RESPONSE_FORMAT = settings.AI_RESPONSE_FORMAT
+AI_FOLLOWUP_ENABLED = settings.AI_FOLLOWUP_ENABLED
+
+# Bump whenever the analysis prompt changes so stale cached results are not served
+PROMPT_VERSION = 'v2'
+
+# AI result cache setup
+def init_analysis_cache():
+    """Open the persistent AI analysis cache"""
+    if not AI_CACHE_ENABLED:
+        return None
+    try:
+        return AnalysisCache(
+            settings.AI_CACHE_PATH,
+            max_entries=settings.AI_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.AI_CACHE_TTL_SECONDS
+        )
+    except Exception:
+        logger.exception("Error initializing AI analysis cache")
+        return None
+
+# Concurrency cap for AI calls and RPM/TPM pacing per provider (this worker's share of each quota)
+ai_admission = AdmissionController(
+    max_concurrent=settings.AI_MAX_CONCURRENT,
+    max_queue=settings.AI_ADMISSION_QUEUE,
+    default_timeout=settings.AI_ADMISSION_TIMEOUT,
+    provider_limits={
+        'openai': (settings.OPENAI_RATE_LIMIT_RPM, settings.OPENAI_RATE_LIMIT_TPM),
+        'gemini': (settings.GEMINI_RATE_LIMIT_RPM, settings.GEMINI_RATE_LIMIT_TPM)
+    }
+)
+
+# Coalesces identical in-flight analyses (same key as the AI result cache)
+ai_singleflight = SingleFlight()
+AI_SINGLEFLIGHT_TIMEOUT = settings.AI_SINGLEFLIGHT_TIMEOUT
+
+def estimate_request_tokens(prompt, max_tokens):
+    """Rough token estimate for quota pacing: prompt (~3 chars/token for Vietnamese) plus completion budget"""
+    return len(prompt) // 3 + max_tokens
+
+def admit_first_attempt(kind, prompt, max_tokens):
+    """Rank the providers for `kind` and wait for admission against the first one
+
+    Returns (candidates, ticket) - pass the candidates on to the router so the
+    first attempt goes to the provider that was admitted - or raises AdmissionRejected.
+    """
+    candidates = ai_router.ranked(kind)
+    provider = candidates[0].name if candidates else None
+    return candidates, ai_admission.acquire(estimate_request_tokens(prompt, max_tokens), provider=provider)
+
+def extra_attempt_admission(prompt, max_tokens):
+    """`admit` hook for the router: a hedged or failover attempt is admitted only if it need not wait"""
+    tokens = estimate_request_tokens(prompt, max_tokens)
+    def admit(provider):
+        try:
+            return ai_admission.acquire(tokens, timeout=0, provider=provider.name)
+        except AdmissionRejected:
+            return None
+    return admit
+
+# Opened per process in init_worker() - SQLite connections must not cross a fork
+analysis_cache = None
+
+def load_content_bundle(path):
+    """Load pre-generated analyses (see pregenerate.py) for the current prompt version"""
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            bundle = json.load(f)
+    except Exception:
+        logger.exception("Error loading content bundle", extra={'path': path})
+        return {}
+    if bundle.get('prompt_version') != PROMPT_VERSION:
+        logger.warning("Ignoring content bundle for another prompt version", extra={'path': path, 'bundle_version': bundle.get('prompt_version'), 'prompt_version': PROMPT_VERSION})
+        return {}
+    entries = bundle.get('entries') or {}
+    logger.info("Loaded pre-generated analyses", extra={'path': path, 'entries': len(entries)})
+    return entries
+
+# Read-only, so it is loaded once at import and shared by forked workers
+content_bundle = load_content_bundle(settings.CONTENT_BUNDLE_PATH)
+
+# Prometheus metrics for /metrics; with METRICS_DIR set, every worker's snapshot is summed on scrape
+metrics_registry = MetricsRegistry(settings.METRICS_DIR, settings.METRICS_FLUSH_INTERVAL)
+stage_latency = metrics_registry.histogram(
+    'zodiac_stage_duration_seconds', 'Latency of each analysis stage in seconds')
+request_latency = metrics_registry.histogram(
+    'zodiac_http_request_duration_seconds', 'HTTP request latency in seconds by endpoint')
+upstream_responses = metrics_registry.counter(
+    'zodiac_upstream_responses_total', 'AI provider responses by provider and HTTP status (error = no response)')
+fallback_counter = metrics_registry.counter(
+    'zodiac_fallback_total', 'Fallback analyses served, by reason')
+ai_tokens = metrics_registry.counter(
+    'zodiac_ai_tokens_total', 'AI tokens consumed, by provider and kind')
+analysis_sources = metrics_registry.counter(
+    'zodiac_analysis_source_total', 'Analyses served, by where the content came from')
+
+# index.html, CSS and JS are read and compressed once; re-read on change in development
+static_assets = StaticAssetCache(
+    os.path.dirname(os.path.abspath(__file__)),
+    reload=settings.STATIC_RELOAD,
+    max_age=settings.STATIC_MAX_AGE
+)
+
+def make_upstream_client():
+    """Pooled keep-alive session with retries and its own circuit breaker"""
+    return UpstreamClient(
+        pool_maxsize=settings.AI_HTTP_POOL_MAXSIZE,
+        max_retries=settings.AI_HTTP_MAX_RETRIES,
+        backoff_base=settings.AI_HTTP_BACKOFF_BASE,
+        backoff_max=settings.AI_HTTP_BACKOFF_MAX,
+        breaker=CircuitBreaker(
+            failure_threshold=settings.AI_CIRCUIT_FAILURES,
+            cooldown_seconds=settings.AI_CIRCUIT_COOLDOWN
+        )
+    )
+
+# One client per provider, so a failing provider only trips its own breaker
+openai_client = make_upstream_client()
+gemini_client = make_upstream_client()
+openai_provider = OpenAIProvider(
+    openai_client, OPENAI_API_KEY, settings.OPENAI_MODEL,
+    temperature=settings.AI_TEMPERATURE, max_tokens=settings.AI_MAX_TOKENS,
+    timeout=settings.AI_REQUEST_TIMEOUT
+)
+gemini_provider = GeminiProvider(
+    gemini_client, GEMINI_API_KEY, settings.GEMINI_MODEL,
+    temperature=settings.AI_TEMPERATURE, max_tokens=settings.AI_MAX_TOKENS,
+    timeout=settings.AI_REQUEST_TIMEOUT
+)
+AI_PROVIDERS = {provider.name: provider for provider in (openai_provider, gemini_provider)}
+
+# Fastest healthy provider first; a call slower than that provider's p95 is hedged on the next one
+ai_router = ProviderRouter(
+    [AI_PROVIDERS[name] for name in settings.AI_PROVIDERS if name in AI_PROVIDERS],
+    routing=settings.AI_ROUTING,
+    hedge=settings.AI_HEDGE_ENABLED,
+    hedge_quantile=settings.AI_HEDGE_QUANTILE,
+    hedge_min_delay=settings.AI_HEDGE_MIN_DELAY,
+    hedge_default_delay=settings.AI_HEDGE_DEFAULT_DELAY,
+    hedge_budget=settings.AI_HEDGE_BUDGET,
+    # Losing calls keep a thread until they finish
+    max_workers=settings.AI_MAX_CONCURRENT * 4
+)
+
+def record_ai_usage(provider, usage):
+    """Count tokens from a provider's normalized `usage` block"""
+    for kind in ('prompt_tokens', 'completion_tokens'):
+        if usage and usage.get(kind):
+            ai_tokens.inc(usage[kind], provider=provider, kind=kind.split('_')[0])
+
+def fallback_analysis(reason, person1_data, person2_data):
+    """Serve the fallback analysis and count why it was needed"""
+    fallback_counter.inc(reason=reason)
+    analysis_sources.inc(source='fallback')
+    return generate_fallback_analysis(person1_data, person2_data)
+
+# Google Sheets setup - one authenticated client and worksheet handle per process
+_sheets_lock = threading.Lock()
+_sheets_state = {'pid': None, 'client': None, 'worksheet': None, 'headers_ready': False}
+
+def _create_google_sheets_client():
+    """Build and log in a new Google Sheets client"""
+    scope = ['https://spreadsheets.google.com/feeds',
+            'https://www.googleapis.com/auth/drive']
+    
+    if not os.path.exists(GOOGLE_SHEETS_CREDENTIALS_PATH):
+        logger.warning("Google credentials file not found. Please add google-credentials.json")
+        return None
+    
+    creds = Credentials.from_service_account_file(
+        GOOGLE_SHEETS_CREDENTIALS_PATH, scopes=scope)
+    # Use new method instead of deprecated gspread.authorize
+    client = gspread.Client(auth=creds)
+    client.login()
+    return client
+
+def _token_needs_refresh(client):
+    """True when the access token is missing or about to expire"""
+    creds = client.auth
+    if not creds.token or not creds.expiry:
+        return True
+    remaining = (creds.expiry - datetime.utcnow()).total_seconds()
+    return remaining < GOOGLE_TOKEN_REFRESH_MARGIN
+
 def get_google_sheets_client():
-    """Initialize Google Sheets client"""
+    """Return the shared Google Sheets client, refreshing its token before expiry"""
     try:
         if not GOOGLE_SHEETS_ENABLED:
             return None
-            
-        scope = ['https://spreadsheets.google.com/feeds',
-                'https://www.googleapis.com/auth/drive']
         
-        if os.path.exists(GOOGLE_SHEETS_CREDENTIALS_PATH):
-            creds = Credentials.from_service_account_file(
-                GOOGLE_SHEETS_CREDENTIALS_PATH, scopes=scope)
-            # Use new method instead of deprecated gspread.authorize
-            client = gspread.Client(auth=creds)
-            client.login()
+        with _sheets_lock:
+            # A forked worker must not reuse the parent's HTTP session
+            if _sheets_state['pid'] != os.getpid():
+                _sheets_state.update(pid=os.getpid(), client=None, worksheet=None, headers_ready=False)
+            
+            client = _sheets_state['client']
+            if client is None:
+                client = _create_google_sheets_client()
+                _sheets_state['client'] = client
+            elif _token_needs_refresh(client):
+                client.login()
             return client
-        else:
-            print("Google credentials file not found. Please add google-credentials.json")
-            return None
-    except Exception as e:
-        print(f"Error initializing Google Sheets client: {e}")
+    except Exception:
+        logger.exception("Error initializing Google Sheets client")
+        return None
+
+def get_google_worksheet():
+    """Return the cached worksheet handle, resolving it once per process"""
+    client = get_google_sheets_client()
+    if not client:
         return None
+    
+    with _sheets_lock:
+        if _sheets_state['worksheet'] is None:
+            _sheets_state['worksheet'] = client.open_by_key(GOOGLE_SHEET_ID).sheet1
+        return _sheets_state['worksheet']
+
+def reset_google_sheets_client():
+    """Drop the cached client and worksheet so the next call reconnects"""
+    with _sheets_lock:
+        _sheets_state.update(client=None, worksheet=None, headers_ready=False)
+
+# First day of each sign; a sign runs until the day before the next one starts
+ZODIAC_START_DATES = [
+    (1, 20, 'aquarius'), (2, 19, 'pisces'), (3, 21, 'aries'), (4, 20, 'taurus'),
+    (5, 21, 'gemini'), (6, 21, 'cancer'), (7, 23, 'leo'), (8, 23, 'virgo'),
+    (9, 23, 'libra'), (10, 23, 'scorpio'), (11, 22, 'sagittarius'), (12, 22, 'capricorn')
+]
+DAYS_IN_MONTH = [0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
+def _build_sign_by_day():
+    """Sign for every (month, day), indexed as month * 32 + day"""
+    table = [None] * (13 * 32)
+    sign = 'capricorn'  # 1-19 January
+    for month in range(1, 13):
+        for day in range(1, DAYS_IN_MONTH[month] + 1):
+            for start_month, start_day, start_sign in ZODIAC_START_DATES:
+                if (start_month, start_day) == (month, day):
+                    sign = start_sign
+            table[month * 32 + day] = sign
+    return table
+
+SIGN_BY_DAY = _build_sign_by_day()
+BIRTH_DATE_PATTERN = re.compile(r'^(\d{1,4})([-/])(\d{1,2})\2(\d{1,4})$')
+BIRTH_DATE_FORMATS_HINT = 'YYYY-MM-DD, DD/MM/YYYY, MM/DD/YYYY or DD-MM-YYYY'
+
+def _is_valid_date(year, month, day):
+    if not 1 <= year <= 9999 or not 1 <= month <= 12 or not 1 <= day <= DAYS_IN_MONTH[month]:
+        return False
+    return month != 2 or day != 29 or (year % 4 == 0 and (year % 100 != 0 or year % 400 == 0))
+
+def parse_birth_date(value):
+    """(year, month, day) from YYYY-MM-DD, DD/MM/YYYY, MM/DD/YYYY or DD-MM-YYYY; raises ValueError"""
+    if isinstance(value, (date, datetime)):
+        return value.year, value.month, value.day
+    if not isinstance(value, str):
+        raise ValueError('Birthdate must be a string')
+    match = BIRTH_DATE_PATTERN.match(value.strip())
+    if not match:
+        raise ValueError(f'Unrecognized date format, expected {BIRTH_DATE_FORMATS_HINT}')
+    first, separator, middle, last = match.groups()
+    if len(first) == 4:
+        # Year first is only accepted in ISO form
+        candidates = [(int(first), int(middle), int(last))] if separator == '-' and len(last) <= 2 else []
+    elif len(last) == 4:
+        # Day-first wins, month-first is tried for slashes when the day-first reading is impossible
+        candidates = [(int(last), int(middle), int(first))]
+        if separator == '/':
+            candidates.append((int(last), int(first), int(middle)))
+    else:
+        candidates = []
+    if not candidates:
+        raise ValueError(f'Unrecognized date format, expected {BIRTH_DATE_FORMATS_HINT}')
+    for year, month, day in candidates:
+        if _is_valid_date(year, month, day):
+            return year, month, day
+    raise ValueError('Invalid calendar date')
+
+def zodiac_sign_for_date(birth_date):
+    """Zodiac sign of a birthdate; raises ValueError when it cannot be parsed"""
+    _, month, day = parse_birth_date(birth_date)
+    return SIGN_BY_DAY[month * 32 + day]
 
 def get_zodiac_sign(birth_date):
-    """Determine zodiac sign from birth date"""
+    """Determine zodiac sign from birth date ('aries' when missing or unparseable)"""
     if not birth_date:
         return 'aries'  # default
-    
     try:
-        from datetime import datetime
-        if isinstance(birth_date, str):
-            # Try different date formats
-            for fmt in ['%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y', '%d-%m-%Y']:
-                try:
-                    date_obj = datetime.strptime(birth_date, fmt)
-                    break
-                except ValueError:
-                    continue
-            else:
-                return 'aries'  # default if can't parse
-        else:
-            date_obj = birth_date
-            
-        month = date_obj.month
-        day = date_obj.day
-        
-        # Zodiac date ranges
-        if (month == 3 and day >= 21) or (month == 4 and day <= 19):
-            return 'aries'
-        elif (month == 4 and day >= 20) or (month == 5 and day <= 20):
-            return 'taurus'
-        elif (month == 5 and day >= 21) or (month == 6 and day <= 20):
-            return 'gemini'
-        elif (month == 6 and day >= 21) or (month == 7 and day <= 22):
-            return 'cancer'
-        elif (month == 7 and day >= 23) or (month == 8 and day <= 22):
-            return 'leo'
-        elif (month == 8 and day >= 23) or (month == 9 and day <= 22):
-            return 'virgo'
-        elif (month == 9 and day >= 23) or (month == 10 and day <= 22):
-            return 'libra'
-        elif (month == 10 and day >= 23) or (month == 11 and day <= 21):
-            return 'scorpio'
-        elif (month == 11 and day >= 22) or (month == 12 and day <= 21):
-            return 'sagittarius'
-        elif (month == 12 and day >= 22) or (month == 1 and day <= 19):
-            return 'capricorn'
-        elif (month == 1 and day >= 20) or (month == 2 and day <= 18):
-            return 'aquarius'
-        elif (month == 2 and day >= 19) or (month == 3 and day <= 20):
-            return 'pisces'
-        else:
-            return 'aries'  # default
-    except:
+        return zodiac_sign_for_date(birth_date)
+    except ValueError:
+        logger.debug("Unparseable birthdate, defaulting to aries", extra={'birthdate': str(birth_date)[:32]})
         return 'aries'  # default
 
-def create_comprehensive_horoscope(sign):
+# Static horoscope content, built once at import
+SIGN_NAMES = {
+    'aries': 'Bạch Dương', 'taurus': 'Kim Ngưu', 'gemini': 'Song Tử',
+    'cancer': 'Cự Giải', 'leo': 'Sư Tử', 'virgo': 'Xử Nữ',
+    'libra': 'Thiên Bình', 'scorpio': 'Hổ Cáp', 'sagittarius': 'Nhân Mã',
+    'capricorn': 'Ma Kết', 'aquarius': 'Bao Bình', 'pisces': 'Song Ngư'
+}
+
+# Detailed descriptions for each sign with variations
+HOROSCOPE_DESCRIPTIONS = {
+    'aries': [
+        "Hôm nay Bạch Dương tràn đầy năng lượng và sẵn sàng đương đầu với mọi thử thách. Sự dũng cảm của bạn sẽ được đền đáp xứng đáng.",
+        "Tinh thần lãnh đạo của Bạch Dương được thể hiện rõ nét hôm nay. Đây là thời điểm tuyệt vời để khởi động những dự án mới.",
+        "Bạch Dương cảm thấy tự tin và quyết đoán. Hãy tin tưởng vào bản năng và hành động theo trái tim mình.",
+        "Năng lượng tích cực bao quanh Bạch Dương. Bạn sẽ tìm thấy động lực mạnh mẽ để theo đuổi những mục tiêu quan trọng."
+    ],
+    'taurus': [
+        "Kim Ngưu tận hưởng sự ổn định và bình yên hôm nay. Đây là thời điểm tốt để tập trung vào những điều thực tế.",
+        "Sự kiên nhẫn của Kim Ngưu sẽ được đền đáp. Những nỗ lực lâu dài cuối cùng cũng bắt đầu cho thấy kết quả.",
+        "Kim Ngưu cảm thấy kết nối sâu sắc với thiên nhiên và vẻ đẹp. Hãy dành thời gian thưởng thức những điều đơn giản.",
+        "Tính thực tế của Kim Ngưu giúp bạn đưa ra những quyết định sáng suốt trong công việc và tài chính."
+    ],
+    'gemini': [
+        "Trí tuệ và sự tò mò của Song Tử được kích hoạt mạnh mẽ. Bạn sẽ học được nhiều điều thú vị hôm nay.",
+        "Khả năng giao tiếp xuất sắc của Song Tử tỏa sáng. Đây là ngày tuyệt vời để kết nối và chia sẻ ý tưởng.",
+        "Song Tử cảm thấy linh hoạt và thích ứng tốt với mọi tình huống. Sự đa tài của bạn được nhiều người ngưỡng mộ.",
+        "Tâm trí nhanh nhạy của Song Tử giúp tìm ra giải pháp sáng tạo cho những vấn đề phức tạp."
+    ],
+    'cancer': [
+        "Cự Giải cảm nhận được sự ấm áp từ gia đình và người thân. Tình cảm chân thành sẽ được đáp lại.",
+        "Trực giác mạnh mẽ của Cự Giải dẫn dắt bạn đến những quyết định đúng đắn. Hãy tin tưởng vào cảm xúc của mình.",
+        "Cự Giải thể hiện sự chăm sóc và bảo vệ những người quan trọng. Lòng nhân ái của bạn được nhiều người trân trọng.",
+        "Khả năng đồng cảm của Cự Giải giúp hiểu sâu tâm tư của người khác và tạo nên những mối quan hệ bền chặt."
+    ],
+    'leo': [
+        "Sư Tử tỏa sáng với sự tự tin và lôi cuốn không thể chối từ. Bạn là tâm điểm của mọi ánh nhìn.",
+        "Tinh thần lãnh đạo của Sư Tử được thể hiện rõ nét. Khả năng truyền cảm hứng của bạn sẽ động viên nhiều người.",
+        "Sư Tử cảm thấy được công nhận và trân trọng. Đây là thời điểm để thể hiện tài năng và sức sáng tạo.",
+        "Lòng hào hiệp của Sư Tử được bộc lộ. Bạn sẵn sàng giúp đỡ và bảo vệ những người cần hỗ trợ."
+    ],
+    'virgo': [
+        "Xử Nữ tập trung vào việc hoàn thiện và cải thiện mọi thứ xung quanh. Sự tỉ mỉ của bạn được đánh giá cao.",
+        "Khả năng phân tích của Xử Nữ giúp nhìn rõ bản chất vấn đề. Bạn sẽ tìm ra cách giải quyết hiệu quả.",
+        "Xử Nữ cảm thấy hài lòng khi giúp đỡ người khác. Sự chu đáo và tận tâm của bạn tạo nên khác biệt lớn.",
+        "Tinh thần cầu tiến của Xử Nữ thúc đẩy bạn không ngừng học hỏi và phát triển bản thân."
+    ],
+    'libra': [
+        "Thiên Bình tìm kiếm sự cân bằng và hài hòa trong mọi khía cạnh cuộc sống. Bạn là người hòa giải tuyệt vời.",
+        "Khiếu thẩm mỹ của Thiên Bình được thể hiện rõ nét. Bạn có thể tạo ra vẻ đẹp và sự thanh lịch.",
+        "Thiên Bình thể hiện sự công bằng và khách quan. Khả năng cân nhắc của bạn giúp đưa ra quyết định sáng suốt.",
+        "Sự duyên dáng của Thiên Bình thu hút nhiều người. Bạn có thể xây dựng những mối quan hệ tích cực."
+    ],
+    'scorpio': [
+        "Hổ Cáp đào sâu vào bản chất của mọi vấn đề. Trực giác mạnh mẽ của bạn không bao giờ lừa dối.",
+        "Sức mạnh nội tại của Hổ Cáp được kích hoạt. Bạn có thể vượt qua mọi khó khăn và thử thách.",
+        "Hổ Cáp thể hiện sự quyết tâm và bền bỉ. Không có gì có thể ngăn cản bạn đạt được mục tiêu.",
+        "Khả năng tái sinh của Hổ Cáp giúp bạn biến những thách thức thành cơ hội phát triển."
+    ],
+    'sagittarius': [
+        "Nhân Mã khao khát tự do và khám phá những chân trời mới. Tinh thần phiêu lưu dẫn dắt bạn đến thành công.",
+        "Triết lý sống tích cực của Nhân Mã lan tỏa đến mọi người xung quanh. Bạn là nguồn cảm hứng cho nhiều người.",
+        "Nhân Mã mở rộng tầm nhìn và kiến thức. Những trải nghiệm mới sẽ làm phong phú thế giới nội tâm.",
+        "Sự lạc quan của Nhân Mã giúp vượt qua mọi trở ngại. Bạn luôn tìm thấy ánh sáng trong bóng tối."
+    ],
+    'capricorn': [
+        "Ma Kết kiên định trên con đường đạt được mục tiêu. Sự chăm chỉ và kỷ luật sẽ được đền đáp xứng đáng.",
+        "Tính thực tế của Ma Kết giúp xây dựng nền tảng vững chắc cho tương lai. Bạn là người đáng tin cậy.",
+        "Ma Kết thể hiện sự trách nhiệm và cam kết. Khả năng lãnh đạo của bạn được nhiều người kính trọng.",
+        "Sự kiên nhẫn của Ma Kết cuối cùng cũng được đền đáp. Những nỗ lực lâu dài bắt đầu cho thấy kết quả."
+    ],
+    'aquarius': [
+        "Bao Bình tràn đầy ý tưởng sáng tạo và quan điểm độc đáo. Bạn có thể tạo ra những thay đổi tích cực.",
+        "Tinh thần nhân đạo của Bao Bình được thể hiện rõ nét. Bạn muốn đóng góp cho cộng đồng và xã hội.",
+        "Bao Bình thể hiện sự độc lập và tự do. Khả năng tư duy khác biệt giúp tìm ra giải pháp mới.",
+        "Tầm nhìn tương lai của Bao Bình giúp dự đoán và chuẩn bị cho những thay đổi sắp tới."
+    ],
+    'pisces': [
+        "Song Ngư kết nối sâu sắc với trực giác và cảm xúc. Khả năng đồng cảm của bạn chạm đến trái tim người khác.",
+        "Sự nhạy cảm của Song Ngư giúp cảm nhận được những điều tinh tế. Bạn có thể hiểu được cảm xúc của mọi người.",
+        "Song Ngư thể hiện sự từ bi và tha thứ. Tình yêu thương vô điều kiện của bạn chữa lành nhiều tổn thương.",
+        "Trí tưởng tượng phong phú của Song Ngư tạo ra những ý tưởng tuyệt vời và nguồn cảm hứng bất tận."
+    ]
+}
+
+# Colors for each sign
+HOROSCOPE_COLORS = {
+    'aries': ['Đỏ tươi', 'Cam rực', 'Đỏ thẫm'],
+    'taurus': ['Xanh lục', 'Nâu đất', 'Hồng nhạt'],
+    'gemini': ['Vàng', 'Bạc', 'Xanh nhạt'],
+    'cancer': ['Bạc', 'Trắng ngọc trai', 'Xanh biển'],
+    'leo': ['Vàng kim', 'Cam', 'Đỏ'],
+    'virgo': ['Xanh navy', 'Nâu', 'Be'],
+    'libra': ['Hồng', 'Xanh pastel', 'Trắng'],
+    'scorpio': ['Đỏ thẫm', 'Đen', 'Tím'],
+    'sagittarius': ['Tím', 'Xanh dương', 'Đỏ'],
+    'capricorn': ['Nâu', 'Xanh đậm', 'Đen'],
+    'aquarius': ['Xanh dương', 'Bạc', 'Tím'],
+    'pisces': ['Xanh lam', 'Xanh lục biển', 'Tím nhạt']
+}
+
+# Moods for each sign
+HOROSCOPE_MOODS = {
+    'aries': ['Năng động và quyết đoán', 'Nhiệt huyết và dũng cảm', 'Tự tin và mạnh mẽ'],
+    'taurus': ['Ổn định và thực tế', 'Bình yên và kiên nhẫn', 'Đáng tin cậy'],
+    'gemini': ['Tò mò và linh hoạt', 'Thông minh và giao tiếp', 'Sáng tạo'],
+    'cancer': ['Ấm áp và che chở', 'Nhạy cảm và trực giác', 'Yêu thương'],
+    'leo': ['Tự tin và rạng rỡ', 'Hào hứng và tỏa sáng', 'Lãnh đạo'],
+    'virgo': ['Tỉ mỉ và cẩn thận', 'Hoàn hảo và phân tích', 'Chu đáo'],
+    'libra': ['Hòa hợp và công bằng', 'Thanh lịch và cân bằng', 'Hòa bình'],
+    'scorpio': ['Mạnh mẽ và bí ẩn', 'Quyết tâm và sâu sắc', 'Trực giác'],
+    'sagittarius': ['Tự do và phiêu lưu', 'Lạc quan và triết học', 'Khám phá'],
+    'capricorn': ['Kỷ luật và có mục tiêu', 'Trách nhiệm và kiên định', 'Thực tế'],
+    'aquarius': ['Sáng tạo và độc lập', 'Nhân đạo và tương lai', 'Độc đáo'],
+    'pisces': ['Nhạy cảm và trực giác', 'Từ bi và nghệ thuật', 'Tưởng tượng']
+}
+
+# Lucky elements
+LUCKY_ELEMENTS = [
+    'một cuộc gặp gỡ quan trọng', 'tin tức tích cực', 'cơ hội mới',
+    'sự hỗ trợ từ bạn bè', 'thành công trong công việc', 'tình yêu đẹp',
+    'sức khỏe tốt', 'tài lộc', 'sự học hỏi', 'niềm vui bất ngờ'
+]
+
+def create_comprehensive_horoscope(sign, day=None):
     """Generate dynamic horoscope data based on date and zodiac sign"""
-    import hashlib
-    from datetime import datetime
-    
     # Get current date for dynamic content
-    today = datetime.now()
+    today = day or date.today()
     date_seed = f"{sign}_{today.strftime('%Y-%m-%d')}"
     
     # Create deterministic but changing data based on date + sign
@@ -149,148 +526,98 @@ def create_comprehensive_horoscope(sign):
     # Convert hash to numbers for selection
     seed_num = int(hash_hex[:8], 16)
     
-    sign_names = {
-        'aries': 'Bạch Dương', 'taurus': 'Kim Ngưu', 'gemini': 'Song Tử',
-        'cancer': 'Cự Giải', 'leo': 'Sư Tử', 'virgo': 'Xử Nữ',
-        'libra': 'Thiên Bình', 'scorpio': 'Hổ Cáp', 'sagittarius': 'Nhân Mã',
-        'capricorn': 'Ma Kết', 'aquarius': 'Bao Bình', 'pisces': 'Song Ngư'
-    }
-    
-    # Detailed descriptions for each sign with variations
-    descriptions = {
-        'aries': [
-            "Hôm nay Bạch Dương tràn đầy năng lượng và sẵn sàng đương đầu với mọi thử thách. Sự dũng cảm của bạn sẽ được đền đáp xứng đáng.",
-            "Tinh thần lãnh đạo của Bạch Dương được thể hiện rõ nét hôm nay. Đây là thời điểm tuyệt vời để khởi động những dự án mới.",
-            "Bạch Dương cảm thấy tự tin và quyết đoán. Hãy tin tưởng vào bản năng và hành động theo trái tim mình.",
-            "Năng lượng tích cực bao quanh Bạch Dương. Bạn sẽ tìm thấy động lực mạnh mẽ để theo đuổi những mục tiêu quan trọng."
-        ],
-        'taurus': [
-            "Kim Ngưu tận hưởng sự ổn định và bình yên hôm nay. Đây là thời điểm tốt để tập trung vào những điều thực tế.",
-            "Sự kiên nhẫn của Kim Ngưu sẽ được đền đáp. Những nỗ lực lâu dài cuối cùng cũng bắt đầu cho thấy kết quả.",
-            "Kim Ngưu cảm thấy kết nối sâu sắc với thiên nhiên và vẻ đẹp. Hãy dành thời gian thưởng thức những điều đơn giản.",
-            "Tính thực tế của Kim Ngưu giúp bạn đưa ra những quyết định sáng suốt trong công việc và tài chính."
-        ],
-        'gemini': [
-            "Trí tuệ và sự tò mò của Song Tử được kích hoạt mạnh mẽ. Bạn sẽ học được nhiều điều thú vị hôm nay.",
-            "Khả năng giao tiếp xuất sắc của Song Tử tỏa sáng. Đây là ngày tuyệt vời để kết nối và chia sẻ ý tưởng.",
-            "Song Tử cảm thấy linh hoạt và thích ứng tốt với mọi tình huống. Sự đa tài của bạn được nhiều người ngưỡng mộ.",
-            "Tâm trí nhanh nhạy của Song Tử giúp tìm ra giải pháp sáng tạo cho những vấn đề phức tạp."
-        ],
-        'cancer': [
-            "Cự Giải cảm nhận được sự ấm áp từ gia đình và người thân. Tình cảm chân thành sẽ được đáp lại.",
-            "Trực giác mạnh mẽ của Cự Giải dẫn dắt bạn đến những quyết định đúng đắn. Hãy tin tưởng vào cảm xúc của mình.",
-            "Cự Giải thể hiện sự chăm sóc và bảo vệ những người quan trọng. Lòng nhân ái của bạn được nhiều người trân trọng.",
-            "Khả năng đồng cảm của Cự Giải giúp hiểu sâu tâm tư của người khác và tạo nên những mối quan hệ bền chặt."
-        ],
-        'leo': [
-            "Sư Tử tỏa sáng với sự tự tin và lôi cuốn không thể chối từ. Bạn là tâm điểm của mọi ánh nhìn.",
-            "Tinh thần lãnh đạo của Sư Tử được thể hiện rõ nét. Khả năng truyền cảm hứng của bạn sẽ động viên nhiều người.",
-            "Sư Tử cảm thấy được công nhận và trân trọng. Đây là thời điểm để thể hiện tài năng và sức sáng tạo.",
-            "Lòng hào hiệp của Sư Tử được bộc lộ. Bạn sẵn sàng giúp đỡ và bảo vệ những người cần hỗ trợ."
-        ],
-        'virgo': [
-            "Xử Nữ tập trung vào việc hoàn thiện và cải thiện mọi thứ xung quanh. Sự tỉ mỉ của bạn được đánh giá cao.",
-            "Khả năng phân tích của Xử Nữ giúp nhìn rõ bản chất vấn đề. Bạn sẽ tìm ra cách giải quyết hiệu quả.",
-            "Xử Nữ cảm thấy hài lòng khi giúp đỡ người khác. Sự chu đáo và tận tâm của bạn tạo nên khác biệt lớn.",
-            "Tinh thần cầu tiến của Xử Nữ thúc đẩy bạn không ngừng học hỏi và phát triển bản thân."
-        ],
-        'libra': [
-            "Thiên Bình tìm kiếm sự cân bằng và hài hòa trong mọi khía cạnh cuộc sống. Bạn là người hòa giải tuyệt vời.",
-            "Khiếu thẩm mỹ của Thiên Bình được thể hiện rõ nét. Bạn có thể tạo ra vẻ đẹp và sự thanh lịch.",
-            "Thiên Bình thể hiện sự công bằng và khách quan. Khả năng cân nhắc của bạn giúp đưa ra quyết định sáng suốt.",
-            "Sự duyên dáng của Thiên Bình thu hút nhiều người. Bạn có thể xây dựng những mối quan hệ tích cực."
-        ],
-        'scorpio': [
-            "Hổ Cáp đào sâu vào bản chất của mọi vấn đề. Trực giác mạnh mẽ của bạn không bao giờ lừa dối.",
-            "Sức mạnh nội tại của Hổ Cáp được kích hoạt. Bạn có thể vượt qua mọi khó khăn và thử thách.",
-            "Hổ Cáp thể hiện sự quyết tâm và bền bỉ. Không có gì có thể ngăn cản bạn đạt được mục tiêu.",
-            "Khả năng tái sinh của Hổ Cáp giúp bạn biến những thách thức thành cơ hội phát triển."
-        ],
-        'sagittarius': [
-            "Nhân Mã khao khát tự do và khám phá những chân trời mới. Tinh thần phiêu lưu dẫn dắt bạn đến thành công.",
-            "Triết lý sống tích cực của Nhân Mã lan tỏa đến mọi người xung quanh. Bạn là nguồn cảm hứng cho nhiều người.",
-            "Nhân Mã mở rộng tầm nhìn và kiến thức. Những trải nghiệm mới sẽ làm phong phú thế giới nội tâm.",
-            "Sự lạc quan của Nhân Mã giúp vượt qua mọi trở ngại. Bạn luôn tìm thấy ánh sáng trong bóng tối."
-        ],
-        'capricorn': [
-            "Ma Kết kiên định trên con đường đạt được mục tiêu. Sự chăm chỉ và kỷ luật sẽ được đền đáp xứng đáng.",
-            "Tính thực tế của Ma Kết giúp xây dựng nền tảng vững chắc cho tương lai. Bạn là người đáng tin cậy.",
-            "Ma Kết thể hiện sự trách nhiệm và cam kết. Khả năng lãnh đạo của bạn được nhiều người kính trọng.",
-            "Sự kiên nhẫn của Ma Kết cuối cùng cũng được đền đáp. Những nỗ lực lâu dài bắt đầu cho thấy kết quả."
-        ],
-        'aquarius': [
-            "Bao Bình tràn đầy ý tưởng sáng tạo và quan điểm độc đáo. Bạn có thể tạo ra những thay đổi tích cực.",
-            "Tinh thần nhân đạo của Bao Bình được thể hiện rõ nét. Bạn muốn đóng góp cho cộng đồng và xã hội.",
-            "Bao Bình thể hiện sự độc lập và tự do. Khả năng tư duy khác biệt giúp tìm ra giải pháp mới.",
-            "Tầm nhìn tương lai của Bao Bình giúp dự đoán và chuẩn bị cho những thay đổi sắp tới."
-        ],
-        'pisces': [
-            "Song Ngư kết nối sâu sắc với trực giác và cảm xúc. Khả năng đồng cảm của bạn chạm đến trái tim người khác.",
-            "Sự nhạy cảm của Song Ngư giúp cảm nhận được những điều tinh tế. Bạn có thể hiểu được cảm xúc của mọi người.",
-            "Song Ngư thể hiện sự từ bi và tha thứ. Tình yêu thương vô điều kiện của bạn chữa lành nhiều tổn thương.",
-            "Trí tưởng tượng phong phú của Song Ngư tạo ra những ý tưởng tuyệt vời và nguồn cảm hứng bất tận."
-        ]
-    }
-    
-    # Colors for each sign
-    colors = {
-        'aries': ['Đỏ tươi', 'Cam rực', 'Đỏ thẫm'],
-        'taurus': ['Xanh lục', 'Nâu đất', 'Hồng nhạt'],
-        'gemini': ['Vàng', 'Bạc', 'Xanh nhạt'],
-        'cancer': ['Bạc', 'Trắng ngọc trai', 'Xanh biển'],
-        'leo': ['Vàng kim', 'Cam', 'Đỏ'],
-        'virgo': ['Xanh navy', 'Nâu', 'Be'],
-        'libra': ['Hồng', 'Xanh pastel', 'Trắng'],
-        'scorpio': ['Đỏ thẫm', 'Đen', 'Tím'],
-        'sagittarius': ['Tím', 'Xanh dương', 'Đỏ'],
-        'capricorn': ['Nâu', 'Xanh đậm', 'Đen'],
-        'aquarius': ['Xanh dương', 'Bạc', 'Tím'],
-        'pisces': ['Xanh lam', 'Xanh lục biển', 'Tím nhạt']
-    }
-    
-    # Moods for each sign
-    moods = {
-        'aries': ['Năng động và quyết đoán', 'Nhiệt huyết và dũng cảm', 'Tự tin và mạnh mẽ'],
-        'taurus': ['Ổn định và thực tế', 'Bình yên và kiên nhẫn', 'Đáng tin cậy'],
-        'gemini': ['Tò mò và linh hoạt', 'Thông minh và giao tiếp', 'Sáng tạo'],
-        'cancer': ['Ấm áp và che chở', 'Nhạy cảm và trực giác', 'Yêu thương'],
-        'leo': ['Tự tin và rạng rỡ', 'Hào hứng và tỏa sáng', 'Lãnh đạo'],
-        'virgo': ['Tỉ mỉ và cẩn thận', 'Hoàn hảo và phân tích', 'Chu đáo'],
-        'libra': ['Hòa hợp và công bằng', 'Thanh lịch và cân bằng', 'Hòa bình'],
-        'scorpio': ['Mạnh mẽ và bí ẩn', 'Quyết tâm và sâu sắc', 'Trực giác'],
-        'sagittarius': ['Tự do và phiêu lưu', 'Lạc quan và triết học', 'Khám phá'],
-        'capricorn': ['Kỷ luật và có mục tiêu', 'Trách nhiệm và kiên định', 'Thực tế'],
-        'aquarius': ['Sáng tạo và độc lập', 'Nhân đạo và tương lai', 'Độc đáo'],
-        'pisces': ['Nhạy cảm và trực giác', 'Từ bi và nghệ thuật', 'Tưởng tượng']
-    }
-    
-    # Lucky elements
-    lucky_elements = [
-        'một cuộc gặp gỡ quan trọng', 'tin tức tích cực', 'cơ hội mới',
-        'sự hỗ trợ từ bạn bè', 'thành công trong công việc', 'tình yêu đẹp',
-        'sức khỏe tốt', 'tài lộc', 'sự học hỏi', 'niềm vui bất ngờ'
-    ]
+    descriptions = HOROSCOPE_DESCRIPTIONS.get(sign, HOROSCOPE_DESCRIPTIONS['aries'])
+    colors = HOROSCOPE_COLORS.get(sign, HOROSCOPE_COLORS['aries'])
+    moods = HOROSCOPE_MOODS.get(sign, HOROSCOPE_MOODS['aries'])
     
     # Select variations based on seed
-    desc_idx = seed_num % len(descriptions.get(sign, descriptions['aries']))
-    color_idx = (seed_num >> 8) % len(colors.get(sign, colors['aries']))
-    mood_idx = (seed_num >> 16) % len(moods.get(sign, moods['aries']))
-    element_idx = (seed_num >> 24) % len(lucky_elements)
+    desc_idx = seed_num % len(descriptions)
+    color_idx = (seed_num >> 8) % len(colors)
+    mood_idx = (seed_num >> 16) % len(moods)
+    element_idx = (seed_num >> 24) % len(LUCKY_ELEMENTS)
     
     return {
-        "description": descriptions.get(sign, descriptions['aries'])[desc_idx],
-        "compatibility": f"Cung {sign_names.get(sign, sign)} hôm nay có khả năng tương thích tốt, đặc biệt trong việc {lucky_elements[element_idx]}.",
-        "mood": moods.get(sign, moods['aries'])[mood_idx],
-        "color": colors.get(sign, colors['aries'])[color_idx],
+        "description": descriptions[desc_idx],
+        "compatibility": f"Cung {SIGN_NAMES.get(sign, sign)} hôm nay có khả năng tương thích tốt, đặc biệt trong việc {LUCKY_ELEMENTS[element_idx]}.",
+        "mood": moods[mood_idx],
+        "color": colors[color_idx],
         "lucky_number": str((seed_num % 9) + 1),
         "lucky_time": f"{10 + (seed_num % 6)}:00 AM - {2 + ((seed_num >> 4) % 4)}:00 PM",
-                "current_date": today.strftime('%B %d, %Y')
+        "current_date": today.strftime('%B %d, %Y')
     }
 
+# Per-day horoscope cache: (date, {sign: horoscope}) swapped as a whole so
+# readers never see a half-built day
+_daily_horoscopes = (None, {})
+_prefilled_horoscopes = (None, {})
+_horoscope_lock = threading.Lock()
+
+def build_daily_horoscopes(day):
+    """Materialize the 12 horoscopes for one calendar day"""
+    return {sign: create_comprehensive_horoscope(sign, day) for sign in ZODIAC_SIGNS}
+
+def get_daily_horoscopes(day=None):
+    """Return the horoscopes for `day` (default today), rolling over atomically"""
+    global _daily_horoscopes
+    day = day or date.today()
+    cached_day, horoscopes = _daily_horoscopes
+    if cached_day == day:
+        return horoscopes
+    
+    with _horoscope_lock:
+        cached_day, horoscopes = _daily_horoscopes
+        if cached_day != day:
+            prefilled_day, prefilled = _prefilled_horoscopes
+            horoscopes = prefilled if prefilled_day == day else build_daily_horoscopes(day)
+            _daily_horoscopes = (day, horoscopes)
+    return horoscopes
+
+def prefill_next_day_horoscopes():
+    """Warm-up hook: build tomorrow's horoscopes ahead of the midnight rollover"""
+    global _prefilled_horoscopes
+    tomorrow = date.today() + timedelta(days=1)
+    if _prefilled_horoscopes[0] != tomorrow:
+        _prefilled_horoscopes = (tomorrow, build_daily_horoscopes(tomorrow))
+    return tomorrow
+
+def _horoscope_warmup_loop():
+    """Prefill shortly before local midnight, then roll the cache over"""
+    while True:
+        now = datetime.now()
+        next_midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        warmup_at = next_midnight - timedelta(seconds=HOROSCOPE_WARMUP_LEAD_SECONDS)
+        time.sleep(max(0, (warmup_at - now).total_seconds()))
+        try:
+            prefill_next_day_horoscopes()
+        except Exception:
+            logger.exception("Error prefilling next day horoscopes")
+        time.sleep(max(0, (next_midnight - datetime.now()).total_seconds()) + 1)
+        try:
+            get_daily_horoscopes()
+        except Exception:
+            logger.exception("Error rolling over daily horoscopes")
+
+_horoscope_warmup_pid = None
+
+def start_horoscope_warmup():
+    """Fill today's cache and start the background midnight warm-up thread (once per process)"""
+    global _horoscope_warmup_pid
+    get_daily_horoscopes()
+    if _horoscope_warmup_pid == os.getpid():
+        return None
+    _horoscope_warmup_pid = os.getpid()
+    thread = threading.Thread(target=_horoscope_warmup_loop, name='horoscope-warmup', daemon=True)
+    thread.start()
+    return thread
+
 def get_horoscope_data(sign):
     """Generate comprehensive horoscope data locally without external APIs"""
-    print(f"Generating local horoscope data for {sign}")
-    return create_comprehensive_horoscope(sign)
+    logger.debug("Serving local horoscope data", extra={'sign': sign})
+    horoscope = get_daily_horoscopes().get(sign)
+    if horoscope is None:
+        # Unknown sign: not part of the daily table, build it directly
+        return create_comprehensive_horoscope(sign)
+    return dict(horoscope)
 
 def create_fallback_horoscope(sign):
     """Create enhanced fallback horoscope data when API fails"""
@@ -343,7 +670,7 @@ def create_fallback_horoscope(sign):
         "current_date": datetime.now().strftime('%B %d, %Y')
     }
 
-def calculate_compatibility_score(sign1, sign2):
+def _score_sign_pair(sign1, sign2):
     """Calculate compatibility score based on element and modality compatibility"""
     
     # Element mapping
@@ -418,52 +745,80 @@ def get_compatibility_tier(score):
     else:
         return "Có sự khác biệt, cần thấu hiểu nhiều hơn"
 
+TIER_DESCRIPTIONS = {
+    "Hợp duyên trời định": "Hai bạn như mảnh ghép vừa khít – dễ đồng điệu cả trong tính cách lẫn cảm xúc. Chỉ cần một cái nhìn cũng đủ hiểu nhau.",
+    "Có duyên, cần thời gian vun đắp": "Giữa hai bạn có sự hấp dẫn nhau tự nhiên, nhưng vẫn cần trải nghiệm, chia sẻ thêm về suy nghĩ và cảm xúc để gắn bó lâu dài.",
+    "Có duyên nhưng cần nỗ lực nhiều": "Sự khác biệt có thể dẫn đến mâu thuẫn, nhưng nếu đủ kiên nhẫn thì đây lại là cơ hội để học cách dung hòa và trưởng thành, biết chấp nhận và tôn trọng sự khác biệt của người khác.",
+    "Có sự khác biệt, cần thấu hiểu nhiều hơn": "Hai bạn có nhiều điểm khác biệt, nhưng chính điều đó có thể giúp mỗi người soi chiếu và hiểu rõ bản thân hơn, biết rằng mình cần điều chỉnh gì để hài hòa mối quan hệ."
+}
+
 def get_tier_description(tier):
     """Get tier description according to instruction"""
-    descriptions = {
-        "Hợp duyên trời định": "Hai bạn như mảnh ghép vừa khít – dễ đồng điệu cả trong tính cách lẫn cảm xúc. Chỉ cần một cái nhìn cũng đủ hiểu nhau.",
-        "Có duyên, cần thời gian vun đắp": "Giữa hai bạn có sự hấp dẫn nhau tự nhiên, nhưng vẫn cần trải nghiệm, chia sẻ thêm về suy nghĩ và cảm xúc để gắn bó lâu dài.",
-        "Có duyên nhưng cần nỗ lực nhiều": "Sự khác biệt có thể dẫn đến mâu thuẫn, nhưng nếu đủ kiên nhẫn thì đây lại là cơ hội để học cách dung hòa và trưởng thành, biết chấp nhận và tôn trọng sự khác biệt của người khác.",
-        "Có sự khác biệt, cần thấu hiểu nhiều hơn": "Hai bạn có nhiều điểm khác biệt, nhưng chính điều đó có thể giúp mỗi người soi chiếu và hiểu rõ bản thân hơn, biết rằng mình cần điều chỉnh gì để hài hòa mối quan hệ."
+    return TIER_DESCRIPTIONS.get(tier, "")
+
+def build_compatibility_matrix():
+    """Precompute score, tier and tier description for every sign pair"""
+    table = []
+    for sign1 in ZODIAC_SIGNS:
+        row = []
+        for sign2 in ZODIAC_SIGNS:
+            score = _score_sign_pair(sign1, sign2)
+            tier = get_compatibility_tier(score)
+            row.append({
+                'score': score,
+                'tier': tier,
+                'tier_description': get_tier_description(tier)
+            })
+        table.append(row)
+    return table
+
+# 12x12 table indexed by SIGN_INDEX, built once at import
+COMPATIBILITY_TABLE = build_compatibility_matrix()
+
+def get_compatibility(sign1, sign2):
+    """Look up precomputed score/tier/description; unknown signs score like aries"""
+    row = COMPATIBILITY_TABLE[SIGN_INDEX.get((sign1 or '').lower(), 0)]
+    return row[SIGN_INDEX.get((sign2 or '').lower(), 0)]
+
+def calculate_compatibility_score(sign1, sign2):
+    """Compatibility score for a sign pair from the precomputed table"""
+    return get_compatibility(sign1, sign2)['score']
+
+# Scores only, indexed like ZODIAC_SIGNS, for the matchmaking ranking
+COMPATIBILITY_SCORES = [[cell['score'] for cell in row] for row in COMPATIBILITY_TABLE]
+
+# Whole table as a single JSON-ready payload for /api/compatibility/matrix
+COMPATIBILITY_MATRIX_PAYLOAD = {
+    'signs': ZODIAC_SIGNS,
+    'tier_descriptions': TIER_DESCRIPTIONS,
+    'matrix': {
+        sign1: {
+            sign2: {
+                'score': COMPATIBILITY_TABLE[i][j]['score'],
+                'tier': COMPATIBILITY_TABLE[i][j]['tier']
+            }
+            for j, sign2 in enumerate(ZODIAC_SIGNS)
+        }
+        for i, sign1 in enumerate(ZODIAC_SIGNS)
     }
-    return descriptions.get(tier, "")
+}
 
-def analyze_compatibility_with_ai(person1_data, person2_data, horoscope1, horoscope2):
-    """Use OpenAI to analyze compatibility based on detailed instruction scenarios"""
-    
-    # Calculate score using the new formula
-    sign1 = person1_data['zodiacSign'].lower()
-    sign2 = person2_data['zodiacSign'].lower()
-    compatibility_score = calculate_compatibility_score(sign1, sign2)
-    compatibility_tier = get_compatibility_tier(compatibility_score)
-    tier_description = get_tier_description(compatibility_tier)
-    
-    # Build detailed prompt based on instruction
-    # Tìm function analyze_compatibility_with_ai và cập nhật prompt (khoảng line 450)
+# Top-level sections of the AI analysis JSON, in the order the prompt asks for them
+ANALYSIS_SECTION_KEYS = [
+    'zodiac_summary', 'personality_analysis', 'differences', 'strengths',
+    'life_benefits', 'work_benefits', 'love_benefits', 'advice',
+    'product_recommendations'
+]
 
-# Cập nhật function analyze_compatibility_with_ai (khoảng line 442)
+def anonymous_people(person1_data, person2_data):
+    """Copies of both people with their names replaced by the placeholder tokens"""
+    # Prompts never see a real name, so nothing generated from them (cached, bundled or
+    # shared between callers) can carry one; personalize() fills the names in on output
+    return {**person1_data, 'name': PERSON1_PLACEHOLDER}, {**person2_data, 'name': PERSON2_PLACEHOLDER}
 
-def analyze_compatibility_with_ai(person1_data, person2_data, horoscope1, horoscope2):
-    """Use OpenAI to analyze compatibility based on detailed instruction scenarios"""
-    
-    print("=== DEBUG AI ANALYSIS START ===")
-    print(f"🔑 OPENAI_API_KEY exists: {bool(OPENAI_API_KEY)}")
-    print(f"🔑 OPENAI_API_KEY length: {len(OPENAI_API_KEY) if OPENAI_API_KEY else 0}")
-    print(f"🔑 OPENAI_API_KEY prefix: {OPENAI_API_KEY[:20] if OPENAI_API_KEY else 'None'}...")
-    print(f"🔑 Key is not placeholder: {OPENAI_API_KEY != 'your-openai-api-key-here' if OPENAI_API_KEY else False}")
-    
-    # Calculate score using the new formula
-    sign1 = person1_data['zodiacSign'].lower()
-    sign2 = person2_data['zodiacSign'].lower()
-    compatibility_score = calculate_compatibility_score(sign1, sign2)
-    compatibility_tier = get_compatibility_tier(compatibility_score)
-    tier_description = get_tier_description(compatibility_tier)
-    
-    print(f"📊 Calculated compatibility tier: {compatibility_tier}")
-    print(f"📊 Tier description: {tier_description[:100]}...")
-    
-    # Build SHORTER and MORE REALISTIC prompt
-    prompt = f"""
+def build_analysis_prompt(person1_data, person2_data, compatibility_tier, tier_description):
+    """Build the AI prompt for a compatibility analysis"""
+    return f"""
         Bạn là chuyên gia chiêm tinh với 15 năm kinh nghiệm. Phân tích tương thích giữa 2 người:
         Người 1: {person1_data['name']} - Cung {person1_data['zodiacSign']} - {person1_data['gender']}  
         Người 2: {person2_data['name']} - Cung {person2_data['zodiacSign']} - {person2_data['gender']}
@@ -474,6 +829,7 @@ def analyze_compatibility_with_ai(person1_data, person2_data, horoscope1, horosc
         - Tổng cộng 2500-3000 chữ  
         - Không hiển thị điểm số hay phần trăm
         - Viết bằng tiếng Việt, có ví dụ cụ thể
+        - Gọi hai người đúng bằng {PERSON1_PLACEHOLDER} và {PERSON2_PLACEHOLDER}, giữ nguyên các ký hiệu này, không tự đặt tên khác
         Phân tích theo cấu trúc JSON:
         1. ZODIAC_SUMMARY (350-400 chữ): Mô tả chi tiết đặc điểm tâm lý, phong cách sống của 2 cung {person1_data['zodiacSign']} và {person2_data['zodiacSign']}, ảnh hưởng của nguyên tố và hành tinh cai trị.
         2. PERSONALITY_ANALYSIS (400-450 chữ): Phân tích sâu tính cách của từng người với ví dụ trong công việc, tình yêu, giao tiếp.
@@ -508,183 +864,524 @@ def analyze_compatibility_with_ai(person1_data, person2_data, horoscope1, horosc
         CHỈ TRẢ VỀ JSON OBJECT DUY NHẤT, KHÔNG CÓ TEXT NÀO KHÁC!
         """
 
-    print(f"📝 Prompt length: {len(prompt)} characters")
+def clean_ai_json_response(ai_response):
+    """Strip explanatory text and code fences around the JSON object in an AI reply"""
+    # Check if response starts with explanatory text
+    if ai_response.startswith('Dưới đây là phân tích') or ai_response.startswith('Đây là phân tích'):
+        # Find the JSON part
+        json_start = ai_response.find('```json')
+        json_end = ai_response.find('```', json_start + 7)
+
+        if json_start != -1 and json_end != -1:
+            ai_response = ai_response[json_start + 7:json_end].strip()
+        else:
+            # Try to find JSON object directly
+            json_start = ai_response.find('{')
+            json_end = ai_response.rfind('}')
+            if json_start != -1 and json_end != -1:
+                ai_response = ai_response[json_start:json_end + 1].strip()
+
+    elif ai_response.startswith('```'):
+        # The closing fence is missing when the reply was cut off at max_tokens
+        ai_response = ai_response[7:] if ai_response.startswith('```json') else ai_response[3:]
+        if ai_response.rstrip().endswith('```'):
+            ai_response = ai_response.rstrip()[:-3]
+        ai_response = ai_response.strip()
+    elif ai_response.startswith('{'):
+        # Already JSON, no need to clean
+        pass
+    else:
+        # Try to extract JSON from text
+        json_start = ai_response.find('{')
+        json_end = ai_response.rfind('}')
+        if json_start != -1 and json_end != -1:
+            ai_response = ai_response[json_start:json_end + 1].strip()
+    return ai_response
+
+_section_decoder = json.JSONDecoder()
+
+def extract_completed_sections(buffer, done_keys):
+    """Return analysis sections whose JSON value is already complete in a partial response"""
+    completed = {}
+    for key in ANALYSIS_SECTION_KEYS:
+        if key in done_keys:
+            continue
+        marker = buffer.find(f'"{key}"')
+        if marker == -1:
+            continue
+        colon = buffer.find(':', marker + len(key) + 2)
+        if colon == -1:
+            continue
+        start = colon + 1
+        while start < len(buffer) and buffer[start] in ' \t\r\n':
+            start += 1
+        try:
+            # raw_decode fails until the closing quote/bracket has arrived
+            value, _ = _section_decoder.raw_decode(buffer, start)
+        except json.JSONDecodeError:
+            continue
+        completed[key] = value
+    return completed
 
+def parse_analysis_sections(ai_response):
+    """Recover every complete analysis section from an AI reply, even a truncated one"""
+    text = clean_ai_json_response(ai_response.strip())
     try:
-        # Use OpenAI API first
-        if OPENAI_API_KEY and OPENAI_API_KEY != 'your-openai-api-key-here':
-            print("🚀 ATTEMPTING OPENAI API CALL...")
-            
-            headers = {
-                'Authorization': f'Bearer {OPENAI_API_KEY}',
-                'Content-Type': 'application/json'
+        parsed = json.loads(text)
+    except json.JSONDecodeError:
+        # Cut off at max_tokens (or malformed further on): keep the sections that did finish
+        parsed = extract_completed_sections(text, ())
+    if not isinstance(parsed, dict):
+        return {}
+    return {key: parsed[key] for key in ANALYSIS_SECTION_KEYS if parsed.get(key)}
+
+PRODUCT_FIELDS = ['name', 'description', 'image_url', 'price']
+
+def build_analysis_schema(section_keys):
+    """JSON schema for the requested analysis sections (all required, no extra keys)"""
+    properties = {}
+    for key in section_keys:
+        if key == 'product_recommendations':
+            properties[key] = {
+                'type': 'array',
+                'items': {
+                    'type': 'object',
+                    'properties': {field: {'type': 'string'} for field in PRODUCT_FIELDS},
+                    'required': PRODUCT_FIELDS,
+                    'additionalProperties': False
+                }
             }
-            
-            data = {
-                'model': 'gpt-4o',
-                'messages': [{'role': 'user', 'content': prompt}],
-                'max_tokens': 2500,  # Giảm xuống 1500 để tiết kiệm memory
-                'temperature': 0.7   # Giảm từ 0.8 xuống 0.7
-             
+        else:
+            properties[key] = {'type': 'string'}
+    return {
+        'type': 'object',
+        'properties': properties,
+        'required': list(section_keys),
+        'additionalProperties': False
+    }
+
+def build_response_format(section_keys=ANALYSIS_SECTION_KEYS):
+    """`response_format` (OpenAI form) for the configured JSON mode, or None to send plain prompts"""
+    if AI_RESPONSE_FORMAT == 'json_schema':
+        # Structured outputs emit keys in schema order, so sections still stream in prompt order
+        return {
+            'type': 'json_schema',
+            'json_schema': {
+                'name': 'compatibility_analysis',
+                'strict': True,
+                'schema': build_analysis_schema(section_keys)
             }
+        }
+    if AI_RESPONSE_FORMAT == 'json_object':
+        return {'type': 'json_object'}
+    return None
+
+# Output budget of one full analysis (each provider also caps it at AI_MAX_TOKENS)
+ANALYSIS_MAX_TOKENS = settings.AI_ANALYSIS_MAX_TOKENS
+
+def provider_complete(provider, prompt, max_tokens, section_keys):
+    """One completion from `provider`, counting its response status and tokens"""
+    try:
+        reply = provider.complete(prompt, max_tokens, build_response_format(section_keys))
+    except Exception:
+        upstream_responses.inc(provider=provider.name, status='error')
+        raise
+    upstream_responses.inc(provider=provider.name, status=str(reply.status))
+    record_ai_usage(provider.name, reply.usage)
+    return reply
+
+def provider_stream(provider, prompt, max_tokens):
+    """Open a streamed analysis on `provider` and wait for its first text"""
+    try:
+        stream = provider.open_stream(prompt, max_tokens, build_response_format(ANALYSIS_SECTION_KEYS))
+    except Exception:
+        upstream_responses.inc(provider=provider.name, status='error')
+        raise
+    upstream_responses.inc(provider=provider.name, status=str(stream.status))
+    if stream.status == 200:
+        try:
+            stream.prime()
+        except Exception:
+            stream.close()
+            raise
+    return stream
+
+def routed_completion(prompt, max_tokens, section_keys=ANALYSIS_SECTION_KEYS, is_valid=None, hedge=True, admitted=True,
+                      candidates=None):
+    """Completion from the fastest healthy provider, hedged on the next one when it is slow
+
+    With `admitted`, the caller holds an admission ticket for the first attempt
+    (on the first of `candidates`, see admit_first_attempt) and every further
+    attempt is admitted separately.
+    Returns the first valid AIReply, or the last failed one when no provider succeeded.
+    """
+    return ai_router.call(
+        lambda provider: provider_complete(provider, prompt, max_tokens, section_keys),
+        'complete',
+        is_valid=is_valid or (lambda reply: reply.ok),
+        hedge=hedge,
+        admit=extra_attempt_admission(prompt, max_tokens) if admitted else None,
+        candidates=candidates
+    )
+
+def is_refusal_text(text):
+    return text.startswith('Tôi xin lỗi') or text.startswith('I\'m sorry') or len(text) < 100
+
+def valid_analysis_reply(reply):
+    """Not a refusal and at least one complete section; the parsed sections are kept on the reply"""
+    if reply.status != 200 or reply.refused or is_refusal_text(reply.text):
+        return False
+    with stage_latency.time(stage='json_parse'):
+        reply.sections = parse_analysis_sections(reply.text)
+    return bool(reply.sections)
+
+# A 300-450 word Vietnamese section is roughly 900 tokens
+FOLLOWUP_TOKENS_PER_SECTION = 900
+
+def build_followup_prompt(person1_data, person2_data, compatibility_tier, tier_description, missing_keys):
+    """Prompt asking only for the sections a truncated reply did not deliver"""
+    return f"""
+        Bạn là chuyên gia chiêm tinh với 15 năm kinh nghiệm. Phân tích tương thích giữa 2 người:
+        Người 1: {person1_data['name']} - Cung {person1_data['zodiacSign']} - {person1_data['gender']}
+        Người 2: {person2_data['name']} - Cung {person2_data['zodiacSign']} - {person2_data['gender']}
+        Kết quả đánh giá: {compatibility_tier}
+        Mô tả: {tier_description}
+        Chỉ viết các phần sau, mỗi phần 300-400 chữ, bằng tiếng Việt, có ví dụ cụ thể, không hiển thị điểm số hay phần trăm:
+        {', '.join(missing_keys)}
+        Gọi hai người đúng bằng {PERSON1_PLACEHOLDER} và {PERSON2_PLACEHOLDER}, giữ nguyên các ký hiệu này, không tự đặt tên khác
+        Nếu có product_recommendations: array gồm 3 object với keys: name, description, image_url, price
+        CHỈ TRẢ VỀ JSON OBJECT DUY NHẤT VỚI ĐÚNG CÁC KEY TRÊN, KHÔNG CÓ TEXT NÀO KHÁC!
+        """
+
+def request_missing_sections(person1_data, person2_data, compatibility_tier, tier_description, missing_keys):
+    """One targeted follow-up call for missing sections; returns whatever sections it recovered"""
+    if not AI_FOLLOWUP_ENABLED or not missing_keys:
+        return {}
+    prompt = build_followup_prompt(person1_data, person2_data, compatibility_tier, tier_description, missing_keys)
+    max_tokens = min(ANALYSIS_MAX_TOKENS, FOLLOWUP_TOKENS_PER_SECTION * len(missing_keys))
+    try:
+        candidates, ticket = admit_first_attempt('complete', prompt, max_tokens)
+    except AdmissionRejected as admission_error:
+        logger.warning("Follow-up call not admitted: %s", admission_error)
+        return {}
+    actual_tokens = None
+    try:
+        with stage_latency.time(stage='ai_followup'):
+            reply = routed_completion(prompt, max_tokens, missing_keys, candidates=candidates)
+        if reply.status != 200:
+            logger.warning("Follow-up call failed", extra={'provider': reply.provider, 'status': reply.status})
+            actual_tokens = 0
+            return {}
+        actual_tokens = (reply.usage or {}).get('total_tokens')
+        recovered = parse_analysis_sections(reply.text)
+        return {key: value for key, value in recovered.items() if key in missing_keys}
+    except Exception:
+        logger.exception("Follow-up call raised")
+        return {}
+    finally:
+        ticket.release(actual_tokens)
+
+def lookup_stored_analysis(cache_key):
+    """Return (result, source) from the content bundle or the AI cache, or (None, None); names are placeholders"""
+    with stage_latency.time(stage='stored_lookup'):
+        return _lookup_stored_analysis(cache_key)
+
+def _lookup_stored_analysis(cache_key):
+    bundled = content_bundle.get(cache_key)
+    if bundled:
+        return bundled, 'bundle'
+    if analysis_cache:
+        try:
+            cached_result = analysis_cache.get(cache_key)
+            if cached_result:
+                return cached_result, 'cache'
+        except Exception as cache_error:
+            logger.warning("AI cache lookup failed: %s", cache_error)
+    return None, None
+
+def analyze_compatibility_with_ai(person1_data, person2_data, horoscope1, horoscope2):
+    """Use the AI providers to analyze compatibility based on detailed instruction scenarios"""
+    return personalize(shared_analysis(person1_data, person2_data), person1_data.get('name'), person2_data.get('name'))
+
+def shared_analysis(person1_data, person2_data):
+    """Analysis for the pair's sign/gender/tier key with placeholder names, the same for every pair with that key"""
+    # Calculate score using the new formula
+    sign1 = person1_data['zodiacSign'].lower()
+    sign2 = person2_data['zodiacSign'].lower()
+    compatibility = get_compatibility(sign1, sign2)
+    compatibility_tier = compatibility['tier']
+    tier_description = compatibility['tier_description']
+    
+    logger.debug("Compatibility tier computed", extra={'sign1': sign1, 'sign2': sign2, 'tier': compatibility_tier})
+    
+    # Serve pre-generated or cached content when the same sign/gender/tier was analysed before
+    cache_key = make_cache_key(
+        sign1, sign2,
+        person1_data.get('gender'), person2_data.get('gender'),
+        compatibility_tier, PROMPT_VERSION
+    )
+    stored_result, source = lookup_stored_analysis(cache_key)
+    if stored_result:
+        logger.info("AI analysis served without upstream call", extra={'source': source})
+        analysis_sources.inc(source=source)
+        return stored_result
+    
+    # Concurrent requests for the same key share one upstream call; the prompt never
+    # carried a name, so the shared result is safe to personalize for each caller
+    try:
+        shared_result, coalesced = ai_singleflight.do(
+            cache_key,
+            lambda: request_ai_analysis(person1_data, person2_data, compatibility_tier, tier_description, cache_key),
+            timeout=AI_SINGLEFLIGHT_TIMEOUT
+        )
+    except SingleFlightTimeout as wait_error:
+        logger.warning("%s - using fallback analysis", wait_error)
+        return fallback_analysis('singleflight_timeout', *anonymous_people(person1_data, person2_data))
+    if coalesced:
+        logger.info("AI analysis coalesced with in-flight call", extra={'source': 'coalesced'})
+        analysis_sources.inc(source='coalesced')
+    return shared_result
+
+def request_ai_analysis(person1_data, person2_data, compatibility_tier, tier_description, cache_key):
+    """Call the AI providers for one analysis; returns the parsed result or the fallback analysis, with placeholder names"""
+    person1_data, person2_data = anonymous_people(person1_data, person2_data)
+    # Build SHORTER and MORE REALISTIC prompt
+    prompt = build_analysis_prompt(person1_data, person2_data, compatibility_tier, tier_description)
+
+    try:
+        if ai_router.configured():
+            logger.debug("Calling AI provider", extra={'providers': [provider.name for provider in ai_router.ranked('complete')], 'max_tokens': ANALYSIS_MAX_TOKENS, 'prompt_chars': len(prompt)})
             
-            print(f"📤 Request data: model={data['model']}, max_tokens={data['max_tokens']}")
-            print("📤 Sending request to OpenAI API...")
+            # Admission control: wait for a concurrency slot and rate budget, or serve fallback now
+            try:
+                with stage_latency.time(stage='admission_wait'):
+                    candidates, ticket = admit_first_attempt('complete', prompt, ANALYSIS_MAX_TOKENS)
+            except AdmissionRejected as admission_error:
+                logger.warning("AI call not admitted, using fallback: %s", admission_error)
+                return fallback_analysis('admission_rejected', person1_data, person2_data)
             
-            response = requests.post(
-                'https://api.openai.com/v1/chat/completions',
-                headers=headers,
-                json=data,
-                timeout=60
-            )
+            try:
+                with stage_latency.time(stage='ai_request'):
+                    reply = routed_completion(prompt, ANALYSIS_MAX_TOKENS, is_valid=valid_analysis_reply, candidates=candidates)
+            except Exception:
+                ticket.release()
+                raise
             
-            print(f"📨 OpenAI Response Status: {response.status_code}")
-            print(f"📨 Response Headers: {dict(list(response.headers.items())[:3])}")
+            # Give back the unused part of the token estimate once real usage is known
+            ticket.release((reply.usage or {}).get('total_tokens') if reply.status == 200 else 0)
             
-            if response.status_code == 200:
-                print("✅ OPENAI API CALL SUCCESSFUL - TOKENS CONSUMED")
-                result = response.json()
-                
-                print(f"📊 Usage info: {result.get('usage', {})}")
-                ai_response = result['choices'][0]['message']['content']
-                ai_response = ai_response.strip()
+            logger.debug("AI provider responded", extra={'provider': reply.provider, 'status': reply.status, 'attempts': reply.attempts, **(reply.timing or {})})
+            
+            if reply.status == 200:
+                logger.debug("AI reply received", extra={'provider': reply.provider, 'chars': len(reply.text), 'finish_reason': reply.finish_reason})
                 
-                # Check if response starts with explanatory text
-                if ai_response.startswith('Dưới đây là phân tích') or ai_response.startswith('Đây là phân tích'):
-                    # Find the JSON part
-                    json_start = ai_response.find('```json')
-                    json_end = ai_response.find('```', json_start + 7)
-                    
-                    if json_start != -1 and json_end != -1:
-                        ai_response = ai_response[json_start + 7:json_end].strip()
-                    else:
-                        # Try to find JSON object directly
-                        json_start = ai_response.find('{')
-                        json_end = ai_response.rfind('}')
-                        if json_start != -1 and json_end != -1:
-                            ai_response = ai_response[json_start:json_end + 1].strip()
+                # Check if response is a refusal
+                if reply.refused or is_refusal_text(reply.text):
+                    logger.warning("AI provider refused the request, using fallback", extra={'provider': reply.provider, 'chars': len(reply.text)})
+                    return fallback_analysis('refusal', person1_data, person2_data)
                 
-                elif ai_response.startswith('```json'):
-                    ai_response = ai_response[7:-3].strip()
-                elif ai_response.startswith('```'):
-                    ai_response = ai_response[3:-3].strip()
-                elif ai_response.startswith('{'):
-                    # Already JSON, no need to clean
-                    pass
-                else:
-                    # Try to extract JSON from text
-                    json_start = ai_response.find('{')
-                    json_end = ai_response.rfind('}')
-                    if json_start != -1 and json_end != -1:
-                        ai_response = ai_response[json_start:json_end + 1].strip()
+                # A reply cut off at max_tokens still carries every section that finished
+                sections = reply.sections
+                if not sections:
+                    logger.warning("No complete section in AI reply, using fallback", extra={'provider': reply.provider, 'chars': len(reply.text)})
+                    return fallback_analysis('parse_failure', person1_data, person2_data)
                 
-                print(f"🧹 Cleaned response length: {len(ai_response)} characters")
-                print(f"🧹 Cleaned response preview: {ai_response[:150]}...")
+                missing = [key for key in ANALYSIS_SECTION_KEYS if key not in sections]
+                if missing:
+                    logger.info("AI reply incomplete", extra={'provider': reply.provider, 'missing_sections': missing, 'finish_reason': reply.finish_reason})
+                    sections.update(request_missing_sections(
+                        person1_data, person2_data, compatibility_tier, tier_description, missing
+                    ))
                 
-                # Check if response is a refusal
-                if ai_response.startswith('Tôi xin lỗi') or ai_response.startswith('I\'m sorry') or len(ai_response) < 100:
-                    print("❌ OPENAI REFUSED TO COMPLETE REQUEST")
-                    print(f"Refusal message: {ai_response}")
-                    print("🔄 Using fallback analysis instead")
-                    return generate_fallback_analysis(person1_data, person2_data)
+                parsed_result = {'compatibility_tier': compatibility_tier, 'tier_description': tier_description}
+                fallback = None
+                for key in ANALYSIS_SECTION_KEYS:
+                    if key in sections:
+                        parsed_result[key] = sections[key]
+                    else:
+                        fallback = fallback or generate_fallback_analysis(person1_data, person2_data)
+                        parsed_result[key] = fallback[key]
                 
-                try:
-                    parsed_result = json.loads(ai_response)
-                    print("✅ SUCCESSFULLY PARSED OPENAI JSON RESPONSE")
-                    print(f"🎯 Response has {len(parsed_result)} sections")
-                    
-                    # Verify content length
-                    zodiac_len = len(parsed_result.get('zodiac_summary', ''))
-                    personality_len = len(parsed_result.get('personality_analysis', ''))
-                    print(f"📏 Content lengths: zodiac_summary={zodiac_len}, personality_analysis={personality_len}")
-                    
-                    print("🎉 RETURNING OPENAI RESULT - NOT FALLBACK")
-                    print("=== DEBUG AI ANALYSIS SUCCESS ===")
-                    return parsed_result
-                    
-                except json.JSONDecodeError as json_error:
-                    print(f"❌ FAILED TO PARSE OPENAI JSON: {json_error}")
-                    print(f"Raw response preview: {ai_response[:500]}...")
-                    
-                    # Try to fix common JSON issues
-                    try:
-                        # Remove any trailing commas
-                        fixed_response = ai_response.replace(',}', '}').replace(',]', ']')
-                        
-                        # Try parsing the fixed version
-                        parsed_result = json.loads(fixed_response)
-                        print("✅ SUCCESSFULLY PARSED FIXED JSON RESPONSE")
-                        return parsed_result
-                        
-                    except json.JSONDecodeError as second_error:
-                        print(f"❌ FAILED TO PARSE FIXED JSON: {second_error}")
-                        
-                        # Last resort: try to extract and reconstruct JSON manually
-                        try:
-                            # Save the raw response for manual parsing
-                            with open('debug_response.txt', 'w', encoding='utf-8') as f:
-                                f.write(f"Original response:\n{result['choices'][0]['message']['content']}\n\n")
-                                f.write(f"Cleaned response:\n{ai_response}")
-                            
-                            print("💾 Saved raw response to debug_response.txt for manual inspection")
-                            
-                        except Exception as save_error:
-                            print(f"Could not save debug file: {save_error}")
-                        
-                        print("🔄 Using fallback analysis instead")
-                        return generate_fallback_analysis(person1_data, person2_data)
+                if fallback:
+                    # Do not cache a partly generic answer; the next request gets another try
+                    logger.info("Filled missing sections from fallback", extra={'fallback_sections': sum(key not in sections for key in ANALYSIS_SECTION_KEYS)})
+                    fallback_counter.inc(reason='partial_sections')
+                    analysis_sources.inc(source=f'{reply.provider}_partial')
+                else:
+                    logger.info("AI analysis generated", extra={'source': reply.provider})
+                    analysis_sources.inc(source=reply.provider)
+                    store_cached_analysis(cache_key, parsed_result)
+                return parsed_result
             else:
-                print(f"❌ OPENAI API FAILED: {response.status_code}")
-                print(f"❌ Error response: {response.text}")
-                print("🔄 Using fallback analysis instead")
-                return generate_fallback_analysis(person1_data, person2_data)
+                logger.error("AI call failed, using fallback", extra={'provider': reply.provider, 'status': reply.status, 'body_chars': reply.body_chars})
+                return fallback_analysis('upstream_status', person1_data, person2_data)
         else:
-            print("❌ NO VALID OPENAI API KEY FOUND")
-            print(f"❌ Key exists: {bool(OPENAI_API_KEY)}")
-            print(f"❌ Key is placeholder: {OPENAI_API_KEY == 'your-openai-api-key-here' if OPENAI_API_KEY else 'No key'}")
-            print("🔄 Using fallback analysis")
-            return generate_fallback_analysis(person1_data, person2_data)
+            logger.warning("No AI provider API key configured, using fallback")
+            return fallback_analysis('no_key', person1_data, person2_data)
         
-    except Exception as e:
-        print(f"❌ OPENAI API EXCEPTION: {e}")
-        import traceback
-        print(f"❌ Full traceback: {traceback.format_exc()}")
-        print("🔄 Using fallback analysis instead")
-        return generate_fallback_analysis(person1_data, person2_data)
-def generate_fallback_analysis(person1_data, person2_data):
-    """Generate fallback analysis without AI using instruction format"""
+    except Exception:
+        logger.exception("AI call raised, using fallback")
+        return fallback_analysis('exception', person1_data, person2_data)
+
+def stream_compatibility_analysis(person1_data, person2_data, horoscope1, horoscope2):
+    """Yield (event, payload) pairs: tier first, then each section as the AI provider produces it"""
+    sign1 = person1_data['zodiacSign'].lower()
+    sign2 = person2_data['zodiacSign'].lower()
+    compatibility = get_compatibility(sign1, sign2)
+    compatibility_tier = compatibility['tier']
+    tier_description = compatibility['tier_description']
     
-    # Calculate compatibility using the same system as AI function
-    compatibility_score = calculate_compatibility_score(
-        person1_data['zodiacSign'], 
-        person2_data['zodiacSign']
-    )
-    compatibility_tier = get_compatibility_tier(compatibility_score)
-    
-    # Define personality traits for each sign
-    personality_traits = {
-        'aries': ['Năng động và đầy nhiệt huyết', 'Dám dấn thân và không sợ thử thách', 'Có khả năng lãnh đạo tự nhiên', 'Đôi khi hơi nóng tính'],
-        'taurus': ['Ổn định và đáng tin cậy', 'Yêu thích sự thoải mái và an toàn', 'Kiên nhẫn và bền bỉ', 'Có thể hơi cố chấp'],
-        'gemini': ['Thông minh và linh hoạt', 'Giao tiếp tốt và hòa đồng', 'Luôn tò mò học hỏi', 'Có thể thay đổi suy nghĩ nhanh'],
-        'cancer': ['Tình cảm sâu sắc và quan tâm người khác', 'Trực giác tốt và nhạy cảm', 'Yêu gia đình và bảo vệ người thân', 'Đôi khi quá nhạy cảm'],
-        'leo': ['Tự tin và có sức hút', 'Hào phóng và ấm áp', 'Sáng tạo và đầy cảm hứng', 'Thích được chú ý và ngưỡng mộ'],
-        'virgo': ['Tỉ mỉ và cầu toàn', 'Thực tế và có logic', 'Luôn muốn giúp đỡ người khác', 'Có thể quá khắt khe với bản thân'],
-        'libra': ['Cân bằng và hài hòa', 'Có gu thẩm mỹ tốt', 'Công bằng và khách quan', 'Đôi khi hay do dự'],
-        'scorpio': ['Sâu sắc và bí ẩn', 'Có ý chí mạnh mẽ', 'Trung thành và chung thủy', 'Có thể hay ghen tuông'],
-        'sagittarius': ['Yêu tự do và phiêu lưu', 'Lạc quan và tích cực', 'Thích khám phá và du lịch', 'Đôi khi thiếu kiên nhẫn'],
-        'capricorn': ['Có trách nhiệm và thực tế', 'Tham vọng và quyết tâm', 'Kiên trì theo đuổi mục tiêu', 'Có thể quá nghiêm túc'],
-        'aquarius': ['Độc lập và sáng tạo', 'Quan tâm đến vấn đề xã hội', 'Tư duy tiến bộ', 'Đôi khi xa cách về mặt cảm xúc'],
-        'pisces': ['Nhạy cảm và giàu cảm xúc', 'Trực giác mạnh và sáng tạo', 'Đồng cảm và hiểu biết', 'Có thể quá mơ mộng']
+    # Score and tier are known before any upstream work - send them right away
+    yield 'meta', {
+        'compatibility_score': compatibility['score'],
+        'compatibility_tier': compatibility_tier,
+        'tier_description': tier_description,
+        'person1': person1_data,
+        'person2': person2_data,
+        'horoscope1': horoscope1,
+        'horoscope2': horoscope2
     }
     
-    sign1 = person1_data['zodiacSign'].lower()
-    sign2 = person2_data['zodiacSign'].lower()
+    result = {'compatibility_tier': compatibility_tier, 'tier_description': tier_description}
+    cache_key = make_cache_key(
+        sign1, sign2,
+        person1_data.get('gender'), person2_data.get('gender'),
+        compatibility_tier, PROMPT_VERSION
+    )
+    stored_result, source = lookup_stored_analysis(cache_key)
+    if stored_result:
+        stored_result = personalize(stored_result, person1_data.get('name'), person2_data.get('name'))
+        for key in ANALYSIS_SECTION_KEYS:
+            if key in stored_result:
+                yield 'section', {'key': key, 'value': stored_result[key]}
+        yield 'done', {'compatibility_analysis': stored_result, 'source': source}
+        analysis_sources.inc(source=source)
+        return
+    
+    # Generated and cached in placeholder form; each section is personalized as it is sent
+    name1, name2 = person1_data.get('name'), person2_data.get('name')
+    person1_data, person2_data = anonymous_people(person1_data, person2_data)
+    buffer = ''
+    usage = None
+    source = None
+    fallback_reason = None
+    if ai_router.configured():
+        prompt = build_analysis_prompt(person1_data, person2_data, compatibility_tier, tier_description)
+        try:
+            # Wait for a concurrency slot and rate budget, or give up and use the fallback
+            with stage_latency.time(stage='admission_wait'):
+                candidates, ticket = admit_first_attempt('stream', prompt, ANALYSIS_MAX_TOKENS)
+            stream = None
+            try:
+                # Timed up to the first text; the rest is consumed section by section below
+                with stage_latency.time(stage='ai_stream'):
+                    stream = ai_router.call(
+                        lambda provider: provider_stream(provider, prompt, ANALYSIS_MAX_TOKENS),
+                        'stream',
+                        is_valid=lambda opened: opened.started,
+                        discard=lambda opened: opened.close(),
+                        admit=extra_attempt_admission(prompt, ANALYSIS_MAX_TOKENS),
+                        candidates=candidates
+                    )
+                source = stream.provider
+                if stream.status != 200:
+                    logger.error("AI stream failed", extra={'provider': stream.provider, 'status': stream.status})
+                    fallback_reason = 'upstream_status'
+                else:
+                    for delta in stream:
+                        buffer += delta
+                        # A section can only complete when a closing quote/bracket arrives
+                        if '"' in delta or ']' in delta:
+                            for key, value in extract_completed_sections(buffer, result).items():
+                                result[key] = value
+                                yield 'section', {'key': key, 'value': personalize(value, name1, name2)}
+            finally:
+                if stream is not None:
+                    stream.close()
+                    usage = stream.usage
+                    record_ai_usage(stream.provider, usage)
+                ticket.release(usage.get('total_tokens') if usage else None)
+        except AdmissionRejected as admission_error:
+            logger.warning("AI call not admitted, using fallback: %s", admission_error)
+            fallback_reason = 'admission_rejected'
+        except Exception:
+            logger.exception("AI stream raised")
+            fallback_reason = 'exception'
+    else:
+        logger.warning("No AI provider API key configured, streaming fallback analysis")
+        fallback_reason = 'no_key'
+    
+    # Whatever the stream did not deliver comes from the full parse, a follow-up call or the fallback
+    parsed_result = parse_analysis_sections(buffer) if buffer else {}
+    missing = [key for key in ANALYSIS_SECTION_KEYS if key not in result and key not in parsed_result]
+    if buffer and missing:
+        logger.info("AI stream incomplete", extra={'provider': source, 'missing_sections': missing})
+        parsed_result.update(request_missing_sections(
+            person1_data, person2_data, compatibility_tier, tier_description, missing
+        ))
+    from_provider = sum(1 for key in ANALYSIS_SECTION_KEYS if key in result or parsed_result.get(key))
+    fallback = None
+    for key in ANALYSIS_SECTION_KEYS:
+        if key in result:
+            continue
+        value = parsed_result.get(key)
+        if not value:
+            fallback = fallback or generate_fallback_analysis(person1_data, person2_data)
+            value = fallback[key]
+        result[key] = value
+        yield 'section', {'key': key, 'value': personalize(value, name1, name2)}
+    
+    if fallback is None:
+        analysis_sources.inc(source=source)
+        store_cached_analysis(cache_key, result)
+    elif from_provider:
+        fallback_counter.inc(reason='partial_sections')
+        analysis_sources.inc(source=f'{source}_partial')
+    else:
+        fallback_counter.inc(reason=fallback_reason or 'parse_failure')
+        analysis_sources.inc(source='fallback')
+    yield 'done', {'compatibility_analysis': personalize(result, name1, name2), 'source': 'fallback' if fallback else source}
+
+def format_sse(event, payload):
+    """Encode one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def store_cached_analysis(cache_key, result):
+    """Save a successful AI result, still in placeholder form, to the persistent cache"""
+    if not analysis_cache:
+        return
+    try:
+        analysis_cache.put(cache_key, result)
+    except Exception as cache_error:
+        logger.warning("Could not store AI result in cache: %s", cache_error)
+
+# Personality traits for each sign, used by the fallback analysis
+FALLBACK_PERSONALITY_TRAITS = {
+    'aries': ['Năng động và đầy nhiệt huyết', 'Dám dấn thân và không sợ thử thách', 'Có khả năng lãnh đạo tự nhiên', 'Đôi khi hơi nóng tính'],
+    'taurus': ['Ổn định và đáng tin cậy', 'Yêu thích sự thoải mái và an toàn', 'Kiên nhẫn và bền bỉ', 'Có thể hơi cố chấp'],
+    'gemini': ['Thông minh và linh hoạt', 'Giao tiếp tốt và hòa đồng', 'Luôn tò mò học hỏi', 'Có thể thay đổi suy nghĩ nhanh'],
+    'cancer': ['Tình cảm sâu sắc và quan tâm người khác', 'Trực giác tốt và nhạy cảm', 'Yêu gia đình và bảo vệ người thân', 'Đôi khi quá nhạy cảm'],
+    'leo': ['Tự tin và có sức hút', 'Hào phóng và ấm áp', 'Sáng tạo và đầy cảm hứng', 'Thích được chú ý và ngưỡng mộ'],
+    'virgo': ['Tỉ mỉ và cầu toàn', 'Thực tế và có logic', 'Luôn muốn giúp đỡ người khác', 'Có thể quá khắt khe với bản thân'],
+    'libra': ['Cân bằng và hài hòa', 'Có gu thẩm mỹ tốt', 'Công bằng và khách quan', 'Đôi khi hay do dự'],
+    'scorpio': ['Sâu sắc và bí ẩn', 'Có ý chí mạnh mẽ', 'Trung thành và chung thủy', 'Có thể hay ghen tuông'],
+    'sagittarius': ['Yêu tự do và phiêu lưu', 'Lạc quan và tích cực', 'Thích khám phá và du lịch', 'Đôi khi thiếu kiên nhẫn'],
+    'capricorn': ['Có trách nhiệm và thực tế', 'Tham vọng và quyết tâm', 'Kiên trì theo đuổi mục tiêu', 'Có thể quá nghiêm túc'],
+    'aquarius': ['Độc lập và sáng tạo', 'Quan tâm đến vấn đề xã hội', 'Tư duy tiến bộ', 'Đôi khi xa cách về mặt cảm xúc'],
+    'pisces': ['Nhạy cảm và giàu cảm xúc', 'Trực giác mạnh và sáng tạo', 'Đồng cảm và hiểu biết', 'Có thể quá mơ mộng']
+}
+
+def build_fallback_analysis(sign1, sign2, name1, name2):
+    """Build the fallback analysis for one sign pair using instruction format"""
+    
+    # Calculate compatibility using the same system as AI function
+    compatibility_tier = get_compatibility(sign1, sign2)['tier']
     
     # Generate advice based on compatibility tier 
     advice_by_tier = {
         "Hợp duyên trời định": f"Hai bạn có rất nhiều giá trị tương đồng để có thể tìm hiểu, làm quen lâu dài. Sự hòa hợp giữa cung {sign1.title()} và {sign2.title()} tạo nên một mối quan hệ đầy tiềm năng. Tại sao không thử mở cánh cửa cơ hội cho mình nhỉ, cùng làm quen, đi chơi? Nếu trong buổi hẹn đầu tiên mà đã có một món quà nhỏ cho đối phương thì chắc chắn sẽ để lại ấn tượng rất sâu sắc.",
         
-        "Có duyên cần thời gian vun đắp": f"Hai bạn có rất nhiều giá trị tương đồng để có thể tìm hiểu, làm quen lâu dài. Mối quan hệ giữa cung {sign1.title()} và {sign2.title()} có tiềm năng phát triển lâu dài. Tại sao không thử mở cánh cửa cơ hội cho mình nhỉ, cùng làm quen, đi chơi? Nếu trong buổi hẹn đầu tiên mà đã có một món quà nhỏ cho đối phương thì chắc chắn sẽ để lại ấn tượng rất sâu sắc.",
+        "Có duyên, cần thời gian vun đắp": f"Hai bạn có rất nhiều giá trị tương đồng để có thể tìm hiểu, làm quen lâu dài. Mối quan hệ giữa cung {sign1.title()} và {sign2.title()} có tiềm năng phát triển lâu dài. Tại sao không thử mở cánh cửa cơ hội cho mình nhỉ, cùng làm quen, đi chơi? Nếu trong buổi hẹn đầu tiên mà đã có một món quà nhỏ cho đối phương thì chắc chắn sẽ để lại ấn tượng rất sâu sắc.",
         
         "Có duyên nhưng cần nỗ lực nhiều": f"Mỗi người lớn lên trong môi trường giáo dục khác nhau, nên điểm khác biệt là điều tất yếu trong cuộc sống. Sự khác biệt có mặt ở mọi nơi, không chỉ bạn và bạn này mà sau này bạn và bạn khác cũng sẽ có sự khác biệt. Vậy nên điểm mấu chốt nhất là các bạn học cách chấp nhận và tôn trọng điều khác biệt ở nhau để cùng phát triển, cùng trở nên hợp hơn. Nên là đừng vì có một chút khác biệt mà từ bỏ cơ hội, hãy cứ thử sức, hãy cho mình cơ hội để hiểu bản thân và hiểu người khác hơn.",
         
@@ -694,9 +1391,9 @@ def generate_fallback_analysis(person1_data, person2_data):
     return {
         "compatibility_tier": compatibility_tier,
         "tier_description": compatibility_tier,
-        "zodiac_summary": f"Cung {sign1.title()} và cung {sign2.title()} đại diện cho hai phong cách sống và tư duy khác nhau. {sign1.title()} thường {personality_traits.get(sign1, ['có tính cách riêng biệt'])[0].lower()}, trong khi {sign2.title()} {personality_traits.get(sign2, ['có tính cách riêng biệt'])[0].lower()}. Sự kết hợp này tạo nên một bức tranh tổng thể đa dạu và phong phú, mang đến những trải nghiệm thú vị trong hành trình tìm hiểu nhau.",
+        "zodiac_summary": f"Cung {sign1.title()} và cung {sign2.title()} đại diện cho hai phong cách sống và tư duy khác nhau. {sign1.title()} thường {FALLBACK_PERSONALITY_TRAITS.get(sign1, ['có tính cách riêng biệt'])[0].lower()}, trong khi {sign2.title()} {FALLBACK_PERSONALITY_TRAITS.get(sign2, ['có tính cách riêng biệt'])[0].lower()}. Sự kết hợp này tạo nên một bức tranh tổng thể đa dạu và phong phú, mang đến những trải nghiệm thú vị trong hành trình tìm hiểu nhau.",
         
-        "personality_analysis": f"{person1_data['name']} thuộc cung {sign1.title()} - một người {personality_traits.get(sign1, ['tính cách độc đáo'])[0].lower()}, {personality_traits.get(sign1, ['tính cách độc đáo'])[1].lower() if len(personality_traits.get(sign1, [''])) > 1 else 'có cách nhìn riêng về cuộc sống'}. Trong giao tiếp, {person1_data['name']} thường thể hiện sự {personality_traits.get(sign1, ['tính cách độc đáo'])[2].lower() if len(personality_traits.get(sign1, [''])) > 2 else 'chân thành và cởi mở'}. Về mặt cảm xúc, những người cung {sign1.title()} thường có xu hướng {personality_traits.get(sign1, ['tính cách độc đáo'])[-1].lower() if len(personality_traits.get(sign1, [''])) > 3 else 'thể hiện cảm xúc một cách trực tiếp'}.\n\nTrong khi đó, {person2_data['name']} thuộc cung {sign2.title()} lại {personality_traits.get(sign2, ['tính cách độc đáo'])[0].lower()}, {personality_traits.get(sign2, ['tính cách độc đáo'])[1].lower() if len(personality_traits.get(sign2, [''])) > 1 else 'có phong cách riêng'}. {person2_data['name']} thường {personality_traits.get(sign2, ['tính cách độc đáo'])[2].lower() if len(personality_traits.get(sign2, [''])) > 2 else 'xử lý tình huống một cách khéo léo'}, và có khuynh hướng {personality_traits.get(sign2, ['tính cách độc đáo'])[-1].lower() if len(personality_traits.get(sign2, [''])) > 3 else 'lắng nghe và thấu hiểu'}. Sự kết hợp giữa hai tính cách này tạo nên những trải nghiệm phong phú, trong đó mỗi người đều có thể học hỏi và khám phá những khía cạnh mới về bản thân qua con mắt của người kia.",
+        "personality_analysis": f"{name1} thuộc cung {sign1.title()} - một người {FALLBACK_PERSONALITY_TRAITS.get(sign1, ['tính cách độc đáo'])[0].lower()}, {FALLBACK_PERSONALITY_TRAITS.get(sign1, ['tính cách độc đáo'])[1].lower() if len(FALLBACK_PERSONALITY_TRAITS.get(sign1, [''])) > 1 else 'có cách nhìn riêng về cuộc sống'}. Trong giao tiếp, {name1} thường thể hiện sự {FALLBACK_PERSONALITY_TRAITS.get(sign1, ['tính cách độc đáo'])[2].lower() if len(FALLBACK_PERSONALITY_TRAITS.get(sign1, [''])) > 2 else 'chân thành và cởi mở'}. Về mặt cảm xúc, những người cung {sign1.title()} thường có xu hướng {FALLBACK_PERSONALITY_TRAITS.get(sign1, ['tính cách độc đáo'])[-1].lower() if len(FALLBACK_PERSONALITY_TRAITS.get(sign1, [''])) > 3 else 'thể hiện cảm xúc một cách trực tiếp'}.\n\nTrong khi đó, {name2} thuộc cung {sign2.title()} lại {FALLBACK_PERSONALITY_TRAITS.get(sign2, ['tính cách độc đáo'])[0].lower()}, {FALLBACK_PERSONALITY_TRAITS.get(sign2, ['tính cách độc đáo'])[1].lower() if len(FALLBACK_PERSONALITY_TRAITS.get(sign2, [''])) > 1 else 'có phong cách riêng'}. {name2} thường {FALLBACK_PERSONALITY_TRAITS.get(sign2, ['tính cách độc đáo'])[2].lower() if len(FALLBACK_PERSONALITY_TRAITS.get(sign2, [''])) > 2 else 'xử lý tình huống một cách khéo léo'}, và có khuynh hướng {FALLBACK_PERSONALITY_TRAITS.get(sign2, ['tính cách độc đáo'])[-1].lower() if len(FALLBACK_PERSONALITY_TRAITS.get(sign2, [''])) > 3 else 'lắng nghe và thấu hiểu'}. Sự kết hợp giữa hai tính cách này tạo nên những trải nghiệm phong phú, trong đó mỗi người đều có thể học hỏi và khám phá những khía cạnh mới về bản thân qua con mắt của người kia.",
         
         "differences": "Những khác biệt chính giữa hai người nằm ở cách tiếp cận cuộc sống và thể hiện cảm xúc. Trong khi một người có thể thích sự ổn định và kế hoạch chi tiết, người kia lại ưa thích sự linh hoạt và tự phát. Điều này có thể dẫn đến những cuộc thảo luận thú vị về cách tổ chức thời gian, lựa chọn hoạt động giải trí, hoặc đưa ra quyết định quan trọng. Tuy nhiên, những khác biệt này không phải là rào cản mà là cơ hội để cả hai mở rộng tầm nhìn và học cách uyển chuyển trong các tình huống khác nhau.",
         
@@ -708,7 +1405,7 @@ def generate_fallback_analysis(person1_data, person2_data):
         
         "love_benefits": "Về mặt tình cảm, mối quan hệ này có tiềm năng phát triển sâu sắc và bền vững. Hai người có thể học cách yêu thương theo những cách khác nhau - một người thể hiện tình cảm qua những hành động cụ thể và chu đáo, trong khi người kia có thể bày tỏ qua lời nói ngọt ngào và những cử chỉ tự nhiên. Sự khác biệt này giúp cả hai hiểu được rằng tình yêu có thể được thể hiện qua nhiều hình thức khác nhau.",
         
-        "advice": advice_by_tier.get(compatibility_tier, advice_by_tier["Có sự khác biệt, cần thấu hiểu nhiều hơn"]),
+        "advice": advice_by_tier[compatibility_tier],
         
         "product_recommendations": [
             {
@@ -732,88 +1429,319 @@ def generate_fallback_analysis(person1_data, person2_data):
         ]
     }
 
-def save_to_google_sheets(data):
-    """Save form data and analysis to Google Sheets with improved error handling"""
-    try:
-        if not GOOGLE_SHEETS_ENABLED:
-            print("Google Sheets is disabled - data not saved")
-            return False
-            
-        client = get_google_sheets_client()
-        if not client:
-            print("Google Sheets client not available - data not saved to sheets")
-            return False
-            
-        # Open the Google Sheet
-        sheet = client.open_by_key(GOOGLE_SHEET_ID).sheet1
-        
-        # Extract data safely with fallbacks
-        person1 = data.get('person1', {})
-        person2 = data.get('person2', {})
-        compatibility = data.get('compatibility_analysis') or data.get('analysis', {})
-        
-        # Prepare row data with safe access
-        row_data = [
-            datetime.now().strftime('%Y-%m-%d %H:%M:%S'),  # Timestamp
-            person1.get('name', ''),
-            person1.get('birthdate', '') or person1.get('birth', ''),
-            person1.get('gender', ''),
-            person1.get('zodiacSign', ''),
-            person2.get('name', ''),
-            person2.get('birthdate', '') or person2.get('birth', ''),
-            person2.get('gender', ''),
-            person2.get('zodiacSign', ''),
-            compatibility.get('compatibility_score', 0) if isinstance(compatibility, dict) else 0,
-            str(compatibility.get('compatibility_level', '')) if isinstance(compatibility, dict) else str(compatibility)[:100]
-        ]
-        
-        # Add headers if sheet is empty
+# Compiled once at import with name placeholders; per request only the names are substituted.
+# advice_by_tier is indexed directly, so a tier string drifting from get_compatibility_tier() fails here.
+FALLBACK_TEMPLATES = {
+    (sign1, sign2): build_fallback_analysis(sign1, sign2, PERSON1_PLACEHOLDER, PERSON2_PLACEHOLDER)
+    for sign1 in ZODIAC_SIGNS
+    for sign2 in ZODIAC_SIGNS
+}
+
+def generate_fallback_analysis(person1_data, person2_data):
+    """Generate fallback analysis without AI from the precompiled templates"""
+    sign1 = person1_data['zodiacSign'].lower()
+    sign2 = person2_data['zodiacSign'].lower()
+    template = FALLBACK_TEMPLATES.get((sign1, sign2))
+    if template is None:
+        # Unrecognised sign text is free-form input - build it directly rather than caching it
+        return build_fallback_analysis(sign1, sign2, person1_data['name'], person2_data['name'])
+    
+    result = dict(template)
+    result['personality_analysis'] = template['personality_analysis'].replace(
+        PERSON1_PLACEHOLDER, person1_data['name']
+    ).replace(PERSON2_PLACEHOLDER, person2_data['name'])
+    # Callers may mutate the result (cache, personalize), so the shared list is not handed out
+    result['product_recommendations'] = [dict(product) for product in template['product_recommendations']]
+    return result
+
+SHEET_HEADERS = [
+    'Thời gian', 'Tên 1', 'Ngày sinh 1', 'Giới tính 1', 'Cung hoàng đạo 1',
+    'Tên 2', 'Ngày sinh 2', 'Giới tính 2', 'Cung hoàng đạo 2',
+    'Điểm tương thích', 'Phân tích', 'Mã lượt gửi'
+]
+# 1-based column holding the submission id, read back to skip rows already delivered
+SUBMISSION_ID_COLUMN = len(SHEET_HEADERS)
+
+def build_sheet_row(data):
+    """Convert an analysis response into one Google Sheets row"""
+    # Extract data safely with fallbacks
+    person1 = data.get('person1', {})
+    person2 = data.get('person2', {})
+    compatibility = data.get('compatibility_analysis') or data.get('analysis', {})
+    
+    # Prepare row data with safe access
+    return [
+        datetime.now().strftime('%Y-%m-%d %H:%M:%S'),  # Timestamp
+        person1.get('name', ''),
+        person1.get('birthdate', '') or person1.get('birth', ''),
+        person1.get('gender', ''),
+        person1.get('zodiacSign', ''),
+        person2.get('name', ''),
+        person2.get('birthdate', '') or person2.get('birth', ''),
+        person2.get('gender', ''),
+        person2.get('zodiacSign', ''),
+        compatibility.get('compatibility_score', 0) if isinstance(compatibility, dict) else 0,
+        str(compatibility.get('compatibility_level', '')) if isinstance(compatibility, dict) else str(compatibility)[:100],
+        data.get('submission_id', '')
+    ]
+
+def write_rows_to_google_sheets(rows):
+    """Append a batch of rows to Google Sheets in a single call (runs on the writer thread)"""
+    with stage_latency.time(stage='sheets_write'):
+        _write_rows_to_google_sheets(rows)
+
+def _write_rows_to_google_sheets(rows):
+    sheet = get_google_worksheet()
+    if not sheet:
+        raise RuntimeError('Google Sheets client not available')
+    
+    # Add headers if sheet is empty - checked once per process, then cached
+    if not _sheets_state['headers_ready']:
         try:
-            all_records = sheet.get_all_records()
-            if len(all_records) == 0:
-                headers = [
-                    'Thời gian', 'Tên 1', 'Ngày sinh 1', 'Giới tính 1', 'Cung hoàng đạo 1',
-                    'Tên 2', 'Ngày sinh 2', 'Giới tính 2', 'Cung hoàng đạo 2',
-                    'Điểm tương thích', 'Phân tích'
-                ]
-                sheet.insert_row(headers, 1)
+            if not sheet.row_values(1):
+                sheet.insert_row(SHEET_HEADERS, 1)
+            _sheets_state['headers_ready'] = True
         except Exception as header_error:
-            print(f"Warning: Could not check/add headers: {header_error}")
+            logger.warning("Could not check/add sheet headers: %s", header_error)
+    
+    try:
+        sheet.append_rows(rows)
+    except Exception:
+        # Stale handle or revoked credentials: reconnect on the next batch
+        reset_google_sheets_client()
+        raise
+    logger.info("Saved rows to Google Sheets", extra={'rows': len(rows)})
+
+def delivered_submission_ids():
+    """Submission ids already in the sheet (one column read, only after a failed or interrupted append)"""
+    sheet = get_google_worksheet()
+    if not sheet:
+        raise RuntimeError('Google Sheets client not available')
+    return set(sheet.col_values(SUBMISSION_ID_COLUMN))
+
+# Opened per process in init_worker()
+submission_outbox = None
+
+def init_submission_outbox():
+    """Open the submission journal and, with Google Sheets enabled, start replaying it there"""
+    try:
+        # The journal also feeds /api/stats, so it is kept even when Sheets is disabled
+        outbox = SubmissionOutbox(
+            settings.OUTBOX_PATH,
+            write_rows_to_google_sheets if GOOGLE_SHEETS_ENABLED else None,
+            existing_ids=delivered_submission_ids if GOOGLE_SHEETS_ENABLED else None,
+            batch_size=settings.SHEETS_BATCH_SIZE,
+            flush_interval=settings.SHEETS_FLUSH_INTERVAL,
+            backoff_max=settings.SHEETS_RETRY_MAX,
+            retention_seconds=settings.OUTBOX_RETENTION_SECONDS
+        )
+    except Exception:
+        logger.exception("Error opening submission outbox")
+        return None
+    # Resume from the last checkpoint; deliver what is left on interpreter shutdown
+    outbox.start()
+    atexit.register(outbox.stop)
+    return outbox
+
+def submission_facts(row):
+    """Signs, tier and genders of a journalled Sheets row, counted by /api/stats"""
+    sign1, sign2 = str(row[4]).lower(), str(row[8]).lower()
+    signs = tuple(sign if sign in SIGN_INDEX else 'unknown' for sign in (sign1, sign2))
+    tier = 'unknown' if 'unknown' in signs else get_compatibility(sign1, sign2)['tier']
+    genders = tuple(str(gender).strip() or 'unknown' for gender in (row[3], row[7]))
+    return {'signs': signs, 'tier': tier, 'genders': genders}
+
+# Opened per process in init_worker(), on top of the submission outbox
+submission_stats = None
+
+def init_submission_stats(outbox):
+    """Follow the journal in the background, starting from the stats snapshot"""
+    if outbox is None:
+        return None
+    stats = SubmissionStats(
+        outbox,
+        submission_facts,
+        snapshot_path=settings.STATS_SNAPSHOT_PATH,
+        refresh_interval=settings.STATS_REFRESH_INTERVAL,
+        snapshot_interval=settings.STATS_SNAPSHOT_INTERVAL
+    )
+    # Loading may read the whole journal; it happens on the stats thread, not here
+    stats.start()
+    atexit.register(stats.stop)
+    return stats
+
+def journal_submissions(entries):
+    """Append (submission_id, row) pairs to the outbox and let the stats pick them up"""
+    inserted = submission_outbox.append_many(entries)
+    if submission_stats is not None:
+        submission_stats.notify()
+    return inserted
+
+# Bounded pool for opt-in asynchronous analyses (POST /api/analyze?async=1)
+analysis_jobs = JobManager(
+    settings.JOBS_PATH,
+    max_workers=settings.JOB_WORKERS,
+    ttl_seconds=settings.JOB_TTL_SECONDS,
+    max_pending=settings.JOB_MAX_PENDING
+)
+
+def record_submission(data):
+    """Journal a completed analysis: counted by /api/stats and, with Sheets enabled, appended to the sheet"""
+    try:
+        if submission_outbox is None:
+            logger.warning("Submission outbox is not open - data not saved")
+            return False
         
-        # Insert data
-        sheet.append_row(row_data)
-        print(f"Successfully saved data to Google Sheets for {person1.get('name', 'Unknown')} and {person2.get('name', 'Unknown')}")
-        return True
+        return journal_submissions([(data['submission_id'], build_sheet_row(data))]) == 1
         
-    except Exception as e:
-        print(f"Error saving to Google Sheets: {e}")
+    except Exception:
+        logger.exception("Error journalling submission")
         return False
 
-@app.route('/')
+def prepare_analysis_input(data):
+    """Resolve zodiac signs and horoscopes for an analysis request body"""
+    # Extract person data
+    person1_data = data.get('person1', {})
+    person2_data = data.get('person2', {})
+    
+    if not person1_data or not person2_data:
+        raise ValueError('Missing person data')
+    
+    # Get zodiac signs - handle both birthdate and birth field names
+    sign1 = person1_data.get('zodiacSign') or get_zodiac_sign(person1_data.get('birthdate') or person1_data.get('birth', ''))
+    sign2 = person2_data.get('zodiacSign') or get_zodiac_sign(person2_data.get('birthdate') or person2_data.get('birth', ''))
+    
+    # Update person data with zodiac signs
+    person1_data['zodiacSign'] = sign1
+    person2_data['zodiacSign'] = sign2
+    
+    # Get horoscope data with fallback handling
+    try:
+        with stage_latency.time(stage='horoscope'):
+            horoscope1 = get_horoscope_data(sign1)
+            horoscope2 = get_horoscope_data(sign2)
+    except Exception:
+        logger.exception("Error getting horoscope data")
+        # Use fallback horoscopes
+        horoscope1 = create_fallback_horoscope(sign1)
+        horoscope2 = create_fallback_horoscope(sign2)
+    
+    return person1_data, person2_data, horoscope1, horoscope2
+
+def run_analysis(person1_data, person2_data, horoscope1, horoscope2, submission_id=None):
+    """Run the AI analysis and journal the Sheets save; returns the /api/analyze response body"""
+    # Analyze compatibility with AI
+    try:
+        with stage_latency.time(stage='ai_analysis'):
+            compatibility_analysis = analyze_compatibility_with_ai(person1_data, person2_data, horoscope1, horoscope2)
+    except Exception:
+        logger.exception("Error in AI analysis")
+        # Use fallback analysis
+        compatibility_analysis = fallback_analysis('exception', person1_data, person2_data)
+    
+    # Prepare response data
+    response_data = {
+        'success': True,
+        'person1': person1_data,
+        'person2': person2_data,
+        'horoscope1': horoscope1,
+        'horoscope2': horoscope2,
+        'compatibility_analysis': compatibility_analysis,
+        'timestamp': datetime.now().isoformat(),
+        'submission_id': submission_id or new_request_id()
+    }
+    
+    # Journal the submission (stats, and Google Sheets via the outbox replayer)
+    try:
+        record_submission(response_data)
+    except Exception as e:
+        logger.warning("Could not record submission: %s", e)
+        # Continue without failing the request
+    
+    return response_data
+
+# Top-level keys of the /api/analyze body that `fields=` may select; `success` is always sent
+ANALYSIS_RESPONSE_FIELDS = ('person1', 'person2', 'horoscope1', 'horoscope2', 'compatibility_analysis', 'timestamp')
+
+def select_fields(response_data, fields):
+    """Keep only the requested fields, e.g. `compatibility_analysis` or `compatibility_analysis.advice,person1.name`"""
+    if not fields:
+        return response_data
+    selected = {'success': response_data.get('success', True)}
+    if 'submission_id' in response_data:
+        selected['submission_id'] = response_data['submission_id']
+    for field in fields.split(','):
+        field = field.strip()
+        if not field:
+            continue
+        key, _, sub_key = field.partition('.')
+        if key not in ANALYSIS_RESPONSE_FIELDS:
+            raise ValueError(f"Unknown field '{key}'; expected one of: {', '.join(ANALYSIS_RESPONSE_FIELDS)}")
+        value = response_data.get(key)
+        if not sub_key:
+            selected[key] = value
+        elif isinstance(value, dict):
+            # A whole-object selection of the same key takes precedence
+            target = selected.setdefault(key, {})
+            if target is not value and sub_key in value:
+                target[sub_key] = value[sub_key]
+    return selected
+
+@main.before_app_request
+def assign_request_id():
+    """Tag every log line of this request with a correlation id (honours X-Request-ID)"""
+    g.request_id_token = request_id_var.set(new_request_id(request.headers.get('X-Request-ID')))
+    g.request_started = time.perf_counter()
+
+@main.after_app_request
+def add_request_id_header(response):
+    response.headers['X-Request-ID'] = request_id_var.get() or ''
+    # Streaming responses are timed to their first byte; the body follows
+    request_latency.observe(
+        time.perf_counter() - g.get('request_started', time.perf_counter()),
+        endpoint=request.endpoint or 'unmatched',
+        method=request.method,
+        status=str(response.status_code)
+    )
+    return response
+
+@main.after_app_request
+def compress_json_response(response):
+    """gzip / brotli JSON bodies for clients that accept it"""
+    if (not RESPONSE_COMPRESSION_ENABLED or response.direct_passthrough or response.is_streamed
+            or response.mimetype != 'application/json' or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < RESPONSE_COMPRESSION_MIN_SIZE:
+        return response
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'), available_encodings())
+    if encoding == 'identity':
+        return response
+    response.set_data(compress(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+@main.teardown_app_request
+def clear_request_id(error=None):
+    token = g.pop('request_id_token', None)
+    if token is not None:
+        request_id_var.reset(token)
+
+@main.route('/')
 def index():
     """Serve the main HTML page"""
-    try:
-        with open('index.html', 'r', encoding='utf-8') as file:
-            return file.read(), 200, {'Content-Type': 'text/html; charset=utf-8'}
-    except FileNotFoundError:
-        return "index.html not found", 404
+    return serve_static('index.html')
 
-@app.route('/<path:filename>')
+@main.route('/<path:filename>')
 def serve_static(filename):
-    """Serve static files"""
-    try:
-        if filename.endswith('.css'):
-            with open(filename, 'r', encoding='utf-8') as file:
-                return file.read(), 200, {'Content-Type': 'text/css'}
-        elif filename.endswith('.js'):
-            with open(filename, 'r', encoding='utf-8') as file:
-                return file.read(), 200, {'Content-Type': 'application/javascript'}
-        else:
-            return "File not found", 404
-    except FileNotFoundError:
+    """Serve static files from memory (compressed, with ETag / 304 support)"""
+    served = static_assets.serve(filename, request.headers, request.method)
+    if served is None:
         return "File not found", 404
+    return served
 
-@app.route('/api/analyze', methods=['POST'])
+@main.route('/api/analyze', methods=['POST'])
 def analyze_compatibility():
     """Main API endpoint for compatibility analysis with improved error handling"""
     try:
@@ -821,73 +1749,220 @@ def analyze_compatibility():
         if not data:
             return jsonify({'error': 'No data provided'}), 400
         
-        # Extract person data
-        person1_data = data.get('person1', {})
-        person2_data = data.get('person2', {})
-        
-        if not person1_data or not person2_data:
-            return jsonify({'error': 'Missing person data'}), 400
-        
-        # Get zodiac signs - handle both birthdate and birth field names
-        sign1 = person1_data.get('zodiacSign') or get_zodiac_sign(person1_data.get('birthdate') or person1_data.get('birth', ''))
-        sign2 = person2_data.get('zodiacSign') or get_zodiac_sign(person2_data.get('birthdate') or person2_data.get('birth', ''))
-        
-        # Update person data with zodiac signs
-        person1_data['zodiacSign'] = sign1
-        person2_data['zodiacSign'] = sign2
-        
-        # Get horoscope data with fallback handling
-        try:
-            horoscope1 = get_horoscope_data(sign1)
-            horoscope2 = get_horoscope_data(sign2)
-        except Exception as horoscope_error:
-            print(f"Error getting horoscope data: {horoscope_error}")
-            # Use fallback horoscopes
-            horoscope1 = create_fallback_horoscope(sign1)
-            horoscope2 = create_fallback_horoscope(sign2)
-        
-        # Analyze compatibility with AI
+        submission_id = new_request_id()
         try:
-            compatibility_analysis = analyze_compatibility_with_ai(person1_data, person2_data, horoscope1, horoscope2)
-        except Exception as ai_error:
-            print(f"Error in AI analysis: {ai_error}")
-            # Use fallback analysis
-            compatibility_analysis = generate_fallback_analysis(person1_data, person2_data)
-        
-        # Prepare response data
-        response_data = {
-            'success': True,
-            'person1': person1_data,
-            'person2': person2_data,
-            'horoscope1': horoscope1,
-            'horoscope2': horoscope2,
-            'compatibility_analysis': compatibility_analysis,
-            'timestamp': datetime.now().isoformat()
-        }
+            # Validate the selector before doing any work
+            fields = request.args.get('fields')
+            select_fields({}, fields)
+            person1_data, person2_data, horoscope1, horoscope2 = prepare_analysis_input(data)
+        except ValueError as input_error:
+            return jsonify({'error': str(input_error)}), 400
         
-        # Save to Google Sheets (non-blocking)
-        try:
-            if GOOGLE_SHEETS_ENABLED:
-                save_to_google_sheets(response_data)
-        except Exception as e:
-            print(f"Warning: Could not save to Google Sheets: {e}")
-            # Continue without failing the request
+        # Opt-in job mode: hand the slow AI call to the job pool and return immediately
+        if request.args.get('async', '').lower() in ('1', 'true', 'yes'):
+            try:
+                job_id = analysis_jobs.submit(run_analysis, person1_data, person2_data, horoscope1, horoscope2, submission_id)
+            except JobQueueFull as queue_error:
+                return jsonify({'error': str(queue_error)}), 503
+            return jsonify({
+                'success': True,
+                'job_id': job_id,
+                'status': 'queued',
+                'status_url': f'/api/jobs/{job_id}'
+            }), 202
         
-        return jsonify(response_data)
+        return jsonify(select_fields(run_analysis(person1_data, person2_data, horoscope1, horoscope2, submission_id), fields))
         
     except Exception as e:
-        print(f"Error in analyze endpoint: {e}")
+        logger.exception("Error in analyze endpoint")
         return jsonify({
             'error': 'Internal server error',
             'message': str(e)
         }), 500
 
-@app.route('/api/horoscope/<sign>')
+@main.route('/api/analyze/stream', methods=['POST'])
+def analyze_compatibility_stream():
+    """Streaming variant of /api/analyze: sends tier first, then sections as Server-Sent Events"""
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'error': 'No data provided'}), 400
+    
+    try:
+        person1_data, person2_data, horoscope1, horoscope2 = prepare_analysis_input(data)
+    except ValueError as input_error:
+        return jsonify({'error': str(input_error)}), 400
+    
+    submission_id = new_request_id()
+    
+    def generate():
+        try:
+            for event, payload in stream_compatibility_analysis(person1_data, person2_data, horoscope1, horoscope2):
+                if event == 'done':
+                    response_data = {
+                        'success': True,
+                        'person1': person1_data,
+                        'person2': person2_data,
+                        'horoscope1': horoscope1,
+                        'horoscope2': horoscope2,
+                        'compatibility_analysis': payload['compatibility_analysis'],
+                        'timestamp': datetime.now().isoformat(),
+                        'submission_id': submission_id
+                    }
+                    record_submission(response_data)
+                    payload = {**payload, 'timestamp': response_data['timestamp'], 'submission_id': submission_id}
+                yield format_sse(event, payload)
+        except Exception as e:
+            logger.exception("Error in analyze stream")
+            yield format_sse('error', {'error': 'Internal server error', 'message': str(e)})
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def plan_batch_analysis(pairs):
+    """Validate batch pairs and group them by analysis key (sign pair, genders, tier)
+
+    Returns ({cache_key: [item, ...]}, [error line, ...]); each item carries the
+    pair's index, optional id and prepared person/horoscope data.
+    """
+    groups = {}
+    errors = []
+    for index, pair in enumerate(pairs):
+        pair_id = pair.get('id') if isinstance(pair, dict) else None
+        try:
+            if not isinstance(pair, dict):
+                raise ValueError('Pair must be an object with person1 and person2')
+            person1_data, person2_data, horoscope1, horoscope2 = prepare_analysis_input(pair)
+            sign1 = person1_data['zodiacSign'].lower()
+            sign2 = person2_data['zodiacSign'].lower()
+            cache_key = make_cache_key(
+                sign1, sign2,
+                person1_data.get('gender'), person2_data.get('gender'),
+                get_compatibility(sign1, sign2)['tier'], PROMPT_VERSION
+            )
+        except Exception as pair_error:
+            errors.append({'type': 'error', 'index': index, 'id': pair_id, 'success': False, 'error': str(pair_error)})
+            continue
+        groups.setdefault(cache_key, []).append({
+            'index': index, 'id': pair_id, 'submission_id': new_request_id(),
+            'person1': person1_data, 'person2': person2_data,
+            'horoscope1': horoscope1, 'horoscope2': horoscope2
+        })
+    return groups, errors
+
+def analyze_batch_group(items):
+    """One analysis for a group of same-key pairs, personalized for each; returns response bodies"""
+    first = items[0]
+    try:
+        with stage_latency.time(stage='ai_analysis'):
+            shared = shared_analysis(first['person1'], first['person2'])
+    except Exception:
+        logger.exception("Error in batch AI analysis")
+        shared = fallback_analysis('exception', *anonymous_people(first['person1'], first['person2']))
+    
+    timestamp = datetime.now().isoformat()
+    return [
+        (item, {
+            'success': True,
+            'person1': item['person1'],
+            'person2': item['person2'],
+            'horoscope1': item['horoscope1'],
+            'horoscope2': item['horoscope2'],
+            'compatibility_analysis': personalize(shared, item['person1'].get('name'), item['person2'].get('name')),
+            'timestamp': timestamp,
+            'submission_id': item['submission_id']
+        })
+        for item in items
+    ]
+
+@main.route('/api/analyze/batch', methods=['POST'])
+def analyze_compatibility_batch():
+    """Analyze many pairs in one call, streaming one NDJSON line per pair as analyses complete"""
+    data = request.get_json(silent=True)
+    pairs = data.get('pairs') if isinstance(data, dict) else None
+    if not isinstance(pairs, list) or not pairs:
+        return jsonify({'error': 'Expected JSON body {"pairs": [{"person1": {...}, "person2": {...}}, ...]}'}), 400
+    if len(pairs) > ANALYSIS_BATCH_MAX_PAIRS:
+        return jsonify({'error': f'Too many pairs: {len(pairs)} (max {ANALYSIS_BATCH_MAX_PAIRS})'}), 413
+    fields = request.args.get('fields')
+    try:
+        select_fields({}, fields)
+    except ValueError as field_error:
+        return jsonify({'error': str(field_error)}), 400
+    
+    # Same sign pair and genders means the same analysis: plan before any upstream work
+    groups, errors = plan_batch_analysis(pairs)
+    logger.info("Batch analysis planned", extra={'pairs': len(pairs), 'unique_analyses': len(groups), 'invalid': len(errors)})
+    
+    def generate():
+        for line in errors:
+            yield json.dumps(line, ensure_ascii=False) + '\n'
+        rows = []
+        executor = ThreadPoolExecutor(max_workers=max(1, min(ANALYSIS_BATCH_CONCURRENCY, len(groups))),
+                                      thread_name_prefix='analysis-batch')
+        try:
+            # Each task runs in a copy of this request's context so logs keep its correlation id
+            futures = [executor.submit(contextvars.copy_context().run, analyze_batch_group, items)
+                       for items in groups.values()]
+            for future in as_completed(futures):
+                for item, response_data in future.result():
+                    rows.append((response_data['submission_id'], build_sheet_row(response_data)))
+                    line = {'type': 'result', 'index': item['index'], 'id': item['id'], **select_fields(response_data, fields)}
+                    yield json.dumps(line, ensure_ascii=False) + '\n'
+            yield json.dumps({
+                'type': 'summary',
+                'success': True,
+                'pairs': len(pairs),
+                'unique_analyses': len(groups),
+                'errors': len(errors)
+            }) + '\n'
+        finally:
+            # Client gone or done: drop queued groups and journal what completed in one transaction
+            executor.shutdown(wait=False, cancel_futures=True)
+            if rows and submission_outbox is not None:
+                journal_submissions(rows)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@main.route('/api/jobs/<job_id>')
+def get_analysis_job(job_id):
+    """Status and result of an asynchronous analysis job"""
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    
+    response = {
+        'success': job['status'] != 'failed',
+        'job_id': job_id,
+        'status': job['status'],
+        'created_at': job['created_at'],
+        'finished_at': job['finished_at']
+    }
+    if job['status'] == 'done':
+        try:
+            response['result'] = select_fields(job['result'], request.args.get('fields'))
+        except ValueError as field_error:
+            return jsonify({'error': str(field_error)}), 400
+    elif job['status'] == 'failed':
+        response['error'] = job['error']
+    return jsonify(response)
+
+@main.route('/api/jobs/stats')
+def analysis_job_stats():
+    """Job pool size and job counts by status"""
+    return jsonify(analysis_jobs.stats())
+
+@main.route('/api/horoscope/<sign>')
 def get_horoscope_api(sign):
     """API endpoint to get horoscope for a specific sign"""
     try:
-        if sign.lower() not in ['aries', 'taurus', 'gemini', 'cancer', 'leo', 'virgo', 
-                               'libra', 'scorpio', 'sagittarius', 'capricorn', 'aquarius', 'pisces']:
+        if sign.lower() not in SIGN_INDEX:
             return jsonify({'error': 'Invalid zodiac sign'}), 400
         
         horoscope_data = get_horoscope_data(sign.lower())
@@ -898,19 +1973,190 @@ def get_horoscope_api(sign):
         })
         
     except Exception as e:
-        print(f"Error in horoscope endpoint: {e}")
+        logger.exception("Error in horoscope endpoint")
         return jsonify({
             'error': 'Internal server error',
             'message': str(e)
         }), 500
 
-@app.route('/api/test-horoscope')
+@main.route('/api/zodiac/bulk', methods=['POST'])
+def zodiac_bulk():
+    """Map many birthdates to zodiac signs in one call, with an error per unparseable item"""
+    data = request.get_json(silent=True)
+    items = data.get('birthdates') if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        return jsonify({'error': 'Expected JSON body {"birthdates": [...]}'}), 400
+    if len(items) > ZODIAC_BULK_MAX_ITEMS:
+        return jsonify({'error': f'Too many birthdates: {len(items)} (max {ZODIAC_BULK_MAX_ITEMS})'}), 413
+    
+    results = []
+    error_count = 0
+    for index, item in enumerate(items):
+        # Items are plain strings or {"id": ..., "birthdate": ...} objects; ids are echoed back
+        entry = {'index': index}
+        if isinstance(item, dict):
+            if 'id' in item:
+                entry['id'] = item['id']
+            item = item.get('birthdate') or item.get('birth')
+        entry['birthdate'] = item
+        if not item:
+            entry['error'] = 'Missing birthdate'
+        else:
+            try:
+                sign = zodiac_sign_for_date(item)
+                entry['sign'] = sign
+                entry['sign_name'] = SIGN_NAMES[sign]
+            except ValueError as parse_error:
+                entry['error'] = str(parse_error)
+        if 'error' in entry:
+            error_count += 1
+        results.append(entry)
+    
+    return jsonify({
+        'success': True,
+        'count': len(results),
+        'error_count': error_count,
+        'results': results
+    })
+
+# Gender values the form offers; matchmaking accepts only these (any case, NFC or NFD)
+MATCHMAKING_GENDERS = {unicodedata.normalize('NFC', gender).casefold(): gender for gender in ('Nam', 'Nữ', 'Khác')}
+
+def _parse_gender(value, field='gender'):
+    """Canonical gender ('Nam', 'Nữ', 'Khác'), or None when not given; raises ValueError otherwise"""
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f'{field} must be a string')
+    gender = MATCHMAKING_GENDERS.get(unicodedata.normalize('NFC', value.strip()).casefold())
+    if gender is None:
+        raise ValueError(f"Unknown {field} '{value}', expected one of: {', '.join(MATCHMAKING_GENDERS.values())}")
+    return gender
+
+def _parse_seeking(value):
+    """Accepted partner genders as a frozenset; None means any"""
+    if value in (None, '', []):
+        return None
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list):
+        raise ValueError('seeking must be a gender or a list of genders')
+    return frozenset(_parse_gender(gender, 'seeking gender') for gender in value)
+
+def _parse_flag(value, name):
+    """A JSON boolean, or the strings 'true' / 'false'"""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in ('true', 'false'):
+        return value.strip().lower() == 'true'
+    raise ValueError(f'{name} must be true or false')
+
+def _parse_participant(participant, default_seeking):
+    """(sign, gender, seeking) of one roster entry
+
+    TypeError / ValueError for a malformed entry, which fails the request;
+    LookupError when the sign cannot be determined, which only skips the entry.
+    """
+    if not isinstance(participant, dict):
+        raise ValueError('Participant must be an object')
+    for field in ('zodiacSign', 'birthdate', 'birth'):
+        if participant.get(field) is not None and not isinstance(participant[field], str):
+            raise ValueError(f'{field} must be a string')
+    gender = _parse_gender(participant.get('gender'))
+    wanted = _parse_seeking(participant['seeking']) if 'seeking' in participant else default_seeking
+    sign = (participant.get('zodiacSign') or '').strip().lower()
+    if not sign:
+        birth = participant.get('birthdate') or participant.get('birth')
+        if not birth:
+            raise LookupError('Missing zodiacSign or birthdate')
+        try:
+            sign = zodiac_sign_for_date(birth)
+        except ValueError as date_error:
+            raise LookupError(str(date_error))
+    if sign not in SIGN_INDEX:
+        raise LookupError(f"Unknown zodiac sign '{sign}'")
+    return sign, gender, wanted
+
+@main.route('/api/matchmaking', methods=['POST'])
+def matchmaking():
+    """Ranked top-k compatible partners for every participant of a roster"""
+    data = request.get_json(silent=True)
+    participants = data.get('participants') if isinstance(data, dict) else None
+    if not isinstance(participants, list):
+        return jsonify({'error': 'Expected JSON body {"participants": [...]}'}), 400
+    if len(participants) > MATCHMAKING_MAX_PARTICIPANTS:
+        return jsonify({'error': f'Too many participants: {len(participants)} (max {MATCHMAKING_MAX_PARTICIPANTS})'}), 413
+    try:
+        k = int(data.get('k', 5))
+        max_per_person = data.get('max_per_person')
+        max_per_person = int(max_per_person) if max_per_person is not None else None
+        min_score = data.get('min_score')
+        min_score = float(min_score) if min_score is not None else None
+        default_seeking = _parse_seeking(data.get('seeking'))
+        mutual = _parse_flag(data.get('mutual', True), 'mutual')
+        if not 1 <= k <= MATCHMAKING_MAX_K:
+            raise ValueError(f'k must be between 1 and {MATCHMAKING_MAX_K}')
+        if max_per_person is not None and max_per_person < 0:
+            raise ValueError('max_per_person must not be negative')
+    except (TypeError, ValueError) as option_error:
+        return jsonify({'error': str(option_error)}), 400
+    
+    # Resolve signs up front; participants without a usable sign are reported and left out
+    # of the matching, while malformed ones (field types, unknown genders) fail the request
+    ids, signs, genders, seeking, positions, errors, invalid = [], [], [], [], [], [], []
+    for index, participant in enumerate(participants):
+        participant_id = participant.get('id', index) if isinstance(participant, dict) else index
+        try:
+            sign, gender, wanted = _parse_participant(participant, default_seeking)
+        except (TypeError, ValueError) as participant_error:
+            invalid.append({'index': index, 'id': participant_id, 'error': str(participant_error)})
+            continue
+        except LookupError as participant_error:
+            errors.append({'index': index, 'id': participant_id, 'error': str(participant_error)})
+            continue
+        ids.append(participant_id)
+        signs.append(SIGN_INDEX[sign])
+        genders.append(gender)
+        seeking.append(wanted)
+        positions.append(index)
+    if invalid:
+        return jsonify({'error': f'{len(invalid)} invalid participants', 'errors': invalid}), 400
+    
+    ranked = top_k_matches(
+        signs, genders, COMPATIBILITY_SCORES, k=k, seeking=seeking,
+        max_per_person=max_per_person, mutual=mutual, min_score=min_score
+    )
+    results = [
+        {
+            'index': positions[person],
+            'id': ids[person],
+            'sign': ZODIAC_SIGNS[signs[person]],
+            'matches': [
+                {
+                    'index': positions[partner],
+                    'id': ids[partner],
+                    'sign': ZODIAC_SIGNS[signs[partner]],
+                    'score': score,
+                    'tier': COMPATIBILITY_TABLE[signs[person]][signs[partner]]['tier']
+                }
+                for partner, score in partners
+            ]
+        }
+        for person, partners in enumerate(ranked)
+    ]
+    return jsonify({'success': True, 'count': len(results), 'errors': errors, 'results': results})
+
+@main.route('/api/compatibility/matrix')
+def compatibility_matrix():
+    """Return the full precomputed 12x12 compatibility table in one response"""
+    return jsonify({'success': True, **COMPATIBILITY_MATRIX_PAYLOAD})
+
+@main.route('/api/test-horoscope')
 def test_horoscope_system():
     """Test local horoscope system"""
     try:
         # Test with all zodiac signs
-        test_signs = ['aries', 'taurus', 'gemini', 'cancer', 'leo', 'virgo', 
-                     'libra', 'scorpio', 'sagittarius', 'capricorn', 'aquarius', 'pisces']
+        test_signs = ZODIAC_SIGNS
         
         results = {}
         for sign in test_signs:
@@ -938,7 +2184,7 @@ def test_horoscope_system():
             'type': type(e).__name__
         })
 
-@app.route('/api/test-aztro')
+@main.route('/api/test-aztro')
 def test_aztro_api():
     """Deprecated: Aztro API no longer used"""
     return jsonify({
@@ -947,20 +2193,19 @@ def test_aztro_api():
         'redirect': '/api/test-horoscope'
     })
 
-@app.route('/api/test-sheets')
+@main.route('/api/test-sheets')
 def test_sheets():
     """Test Google Sheets connection"""
     try:
-        client = get_google_sheets_client()
-        if not client:
+        # Same cached handle the outbox delivers through
+        sheet = get_google_worksheet()
+        if not sheet:
             return jsonify({
                 'status': 'error',
                 'message': 'Google Sheets credentials not found',
                 'solution': 'Add google-credentials.json file to connect to Google Sheets'
             })
         
-        # Try to open the sheet
-        sheet = client.open_by_key(GOOGLE_SHEET_ID).sheet1
         sheet_info = {
             'title': sheet.title,
             'row_count': sheet.row_count,
@@ -975,29 +2220,144 @@ def test_sheets():
         })
         
     except Exception as e:
+        # Reconnect on the next use rather than keep a handle that failed
+        reset_google_sheets_client()
         return jsonify({
             'status': 'error',
             'message': f'Google Sheets connection failed: {str(e)}',
             'sheet_id': GOOGLE_SHEET_ID
         })
 
-@app.route('/health')
+@main.route('/api/sheets/stats')
+def sheets_stats():
+    """Expose the submission outbox backlog, checkpoint and delivery counters"""
+    if submission_outbox is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': GOOGLE_SHEETS_ENABLED, **submission_outbox.stats()})
+
+@main.route('/api/stats')
+def submission_stats_report():
+    """Sign, tier and gender-pair counts of saved submissions, all time or per day / week"""
+    if submission_stats is None:
+        return jsonify({'enabled': False})
+    bucket = request.args.get('bucket', 'all')
+    if bucket not in STATS_BUCKETS:
+        return jsonify({'error': f"bucket must be one of: {', '.join(STATS_BUCKETS)}"}), 400
+    try:
+        last = int(request.args.get('last', '1'))
+        if not 1 <= last <= STATS_MAX_PERIODS:
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': f'last must be between 1 and {STATS_MAX_PERIODS}'}), 400
+    try:
+        report = submission_stats.report(bucket, request.args.get('period'), last)
+    except ValueError:
+        return jsonify({'error': 'period must look like 2024-05-17 (day) or 2024-W20 (week)'}), 400
+    if not report['ready']:
+        # Counters are still being read from the journal and would undercount
+        return jsonify({'enabled': True, 'ready': False, 'error': 'Stats are still loading, retry shortly'}), 503
+    return jsonify({'enabled': True, **report})
+
+@main.route('/api/upstream/stats')
+def upstream_stats():
+    """Expose OpenAI connection timings, retries and circuit breaker state"""
+    return jsonify(openai_client.stats())
+
+@main.route('/api/ai/stats')
+def ai_provider_stats():
+    """Expose per-provider latency percentiles, success rates, routing order and hedging counters"""
+    stats = ai_router.stats()
+    for provider in stats['providers']:
+        provider['upstream'] = AI_PROVIDERS[provider['name']].client.stats()
+    return jsonify(stats)
+
+@main.route('/api/admission/stats')
+def admission_stats():
+    """Expose AI admission queue length, wait times and rejections"""
+    return jsonify(ai_admission.stats())
+
+@main.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint, aggregated over all gunicorn workers"""
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+@main.route('/api/cache/stats')
+def cache_stats():
+    """Expose AI analysis cache hit/miss counters and in-flight coalescing"""
+    coalescing = ai_singleflight.stats()
+    if not analysis_cache:
+        return jsonify({'enabled': False, 'bundle_entries': len(content_bundle), 'coalescing': coalescing})
+    return jsonify({'enabled': True, **analysis_cache.stats(), 'bundle_entries': len(content_bundle), 'coalescing': coalescing})
+
+@main.route('/health')
 def health_check():
     """Health check endpoint"""
     return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()})
 
-@app.route('/api/test-credentials')
+@main.route('/api/test-credentials')
 def test_credentials():
     """Test endpoint để kiểm tra credentials setup"""
     return jsonify({
         "environment": os.environ.get('FLASK_ENV'),
-        "has_credentials_file": os.path.exists(app.config['GOOGLE_CREDENTIALS_PATH']),
-        "credentials_path": app.config['GOOGLE_CREDENTIALS_PATH'],
-        "google_sheets_enabled": app.config['GOOGLE_SHEETS_ENABLED'],
-        "has_sheet_id": bool(app.config.get('GOOGLE_SHEET_ID')),
-        "has_gemini_key": bool(app.config.get('GEMINI_API_KEY'))
+        "has_credentials_file": os.path.exists(current_app.config['GOOGLE_CREDENTIALS_PATH']),
+        "credentials_path": current_app.config['GOOGLE_CREDENTIALS_PATH'],
+        "google_sheets_enabled": current_app.config['GOOGLE_SHEETS_ENABLED'],
+        "has_sheet_id": bool(current_app.config.get('GOOGLE_SHEET_ID')),
+        "has_gemini_key": bool(current_app.config.get('GEMINI_API_KEY'))
     })
 
+def init_worker():
+    """Per-process setup: open the AI cache, warm the Sheets client, start background threads"""
+    global analysis_cache, submission_outbox, submission_stats
+    # The log listener thread does not survive a fork
+    setup_logging(settings.LOG_LEVEL, settings.LOG_FORMAT, settings.LOG_DEBUG_SAMPLE_RATE)
+    analysis_cache = init_analysis_cache()
+    
+    # Authenticate and resolve the worksheet now instead of on the first save
+    reset_google_sheets_client()
+    if GOOGLE_SHEETS_ENABLED and os.path.exists(GOOGLE_SHEETS_CREDENTIALS_PATH):
+        try:
+            get_google_worksheet()
+        except Exception as e:
+            logger.warning("Could not warm up Google Sheets client: %s", e)
+    
+    # Deliver submissions journalled before the last restart, then keep replaying; stats load in the background
+    submission_outbox = init_submission_outbox()
+    submission_stats = init_submission_stats(submission_outbox)
+    
+    # Warm today's horoscopes and keep them rolling over at midnight
+    start_horoscope_warmup()
+
+def shutdown_worker():
+    """Deliver journalled Sheets rows, stop the job pool and write final metrics before the process exits"""
+    if submission_stats is not None:
+        submission_stats.stop()
+    if submission_outbox is not None:
+        submission_outbox.stop()
+    analysis_jobs.shutdown(wait=False)
+    metrics_registry.flush()
+
+def create_app(config_name=None, init_services=True):
+    """Application factory"""
+    config_name = config_name or os.environ.get('FLASK_ENV', 'development')
+    
+    # Setup credentials when app starts
+    if config_name == 'production':
+        setup_google_credentials()
+    
+    flask_app = Flask(__name__)
+    CORS(flask_app)  # Enable CORS for all routes
+    flask_app.config.from_object(config[config_name])
+    flask_app.register_blueprint(main)
+    
+    # With gunicorn preload the master only imports the app; workers call
+    # init_worker() from the post_fork hook (see gunicorn.conf.py)
+    if init_services:
+        init_worker()
+    return flask_app
+
+app = create_app(init_services=os.environ.get('ZODIAC_DEFER_WORKER_INIT', 'false').lower() != 'true')
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     debug = os.environ.get('FLASK_ENV') == 'development'
@@ -0,0 +1,53 @@
+"""
+Micro-benchmark for generate_fallback_analysis.
+
+Times the per-call cost over every sign pair so changes to the fallback
+path can be compared before and after.
+
+Usage:
+    python benchmarks/bench_fallback.py
+    python benchmarks/bench_fallback.py --rounds 20
+"""
+import argparse
+import itertools
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('ZODIAC_DEFER_WORKER_INIT', 'true')
+
+import app as zodiac_app  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark generate_fallback_analysis')
+    parser.add_argument('--rounds', type=int, default=10, help='passes over all 144 sign pairs')
+    args = parser.parse_args(argv)
+
+    people = [
+        ({'name': 'Nguyễn Văn An', 'zodiacSign': sign1, 'gender': 'Nam'},
+         {'name': 'Trần Thị Bình', 'zodiacSign': sign2, 'gender': 'Nữ'})
+        for sign1, sign2 in itertools.product(zodiac_app.ZODIAC_SIGNS, repeat=2)
+    ]
+    generate = zodiac_app.generate_fallback_analysis
+
+    # Warm-up pass so one-off import/setup cost is not measured
+    for person1, person2 in people:
+        generate(person1, person2)
+
+    timings = []
+    for _ in range(args.rounds):
+        started = time.perf_counter()
+        for person1, person2 in people:
+            generate(person1, person2)
+        timings.append((time.perf_counter() - started) / len(people))
+
+    timings.sort()
+    print(f'generate_fallback_analysis: {len(people) * args.rounds} calls')
+    print(f'  best   {timings[0] * 1e6:8.2f} µs/call')
+    print(f'  median {timings[len(timings) // 2] * 1e6:8.2f} µs/call')
+
+
+if __name__ == '__main__':
+    main()
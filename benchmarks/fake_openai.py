@@ -0,0 +1,166 @@
+"""
+Local stand-in for the OpenAI chat completions API.
+
+Answers with a well-formed analysis for whatever sections the request's
+JSON schema asks for, after a configurable delay. A share of replies can be
+cut off mid-JSON (finish_reason "length") or fail with 429/500, so the
+truncation-recovery, retry and fallback paths get exercised too. Streaming
+requests get SSE chunks.
+
+Usage:
+    python benchmarks/fake_openai.py --port 8700 --latency-ms 300 --truncation-rate 0.1
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SECTION_KEYS = [
+    'zodiac_summary', 'personality_analysis', 'differences', 'strengths',
+    'life_benefits', 'work_benefits', 'love_benefits', 'advice',
+    'product_recommendations'
+]
+
+# ~350 Vietnamese words, the length the prompt asks for per section
+SECTION_TEXT = ('Hai bạn có nhiều điểm bổ sung cho nhau trong cuộc sống hằng ngày. ' * 25).strip()
+
+PRODUCTS = [
+    {
+        'name': f'Sản phẩm {i}',
+        'description': 'Quà tặng đôi theo cung hoàng đạo',
+        'image_url': 'https://i.pinimg.com/736x/ea/87/51/ea8751f3816013dfcca04c796e09e6de.jpg',
+        'price': '500,000 VNĐ'
+    }
+    for i in range(1, 4)
+]
+
+
+class FakeOpenAIConfig:
+    def __init__(self, latency_ms=300, jitter_ms=100, truncation_rate=0.0, error_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.truncation_rate = truncation_rate
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.truncated = 0
+        self.errors = 0
+
+    def roll(self):
+        """Return (delay_seconds, outcome) for one request"""
+        with self.lock:
+            self.requests += 1
+            delay = max(0.0, self.random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+            draw = self.random.random()
+            if draw < self.error_rate:
+                self.errors += 1
+                return delay, 'error'
+            if draw < self.error_rate + self.truncation_rate:
+                self.truncated += 1
+                return delay, 'truncated'
+            return delay, 'ok'
+
+    def stats(self):
+        with self.lock:
+            return {'requests': self.requests, 'truncated': self.truncated, 'errors': self.errors}
+
+
+def requested_sections(body):
+    """Section keys from the request's json_schema, or all of them"""
+    response_format = body.get('response_format') or {}
+    schema = (response_format.get('json_schema') or {}).get('schema') or {}
+    return schema.get('required') or SECTION_KEYS
+
+
+def build_reply(sections, truncated):
+    content = json.dumps(
+        {key: PRODUCTS if key == 'product_recommendations' else SECTION_TEXT for key in sections},
+        ensure_ascii=False
+    )
+    if truncated:
+        content = content[:int(len(content) * 0.6)]
+    return content
+
+
+def make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            delay, outcome = config.roll()
+            time.sleep(delay)
+            if outcome == 'error':
+                status = config.random.choice([429, 500])
+                self._send_json(status, {'error': {'message': 'fake upstream error'}})
+                return
+
+            content = build_reply(requested_sections(body), outcome == 'truncated')
+            finish_reason = 'length' if outcome == 'truncated' else 'stop'
+            usage = {'prompt_tokens': 900, 'completion_tokens': len(content) // 3,
+                     'total_tokens': 900 + len(content) // 3}
+
+            if not body.get('stream'):
+                self._send_json(200, {
+                    'choices': [{'message': {'role': 'assistant', 'content': content},
+                                 'finish_reason': finish_reason}],
+                    'usage': usage
+                })
+                return
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            for start in range(0, len(content), 64):
+                chunk = {'choices': [{'delta': {'content': content[start:start + 64]}}]}
+                self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode('utf-8'))
+            self.wfile.write(f'data: {json.dumps({"choices": [], "usage": usage})}\n\n'.encode('utf-8'))
+            self.wfile.write(b'data: [DONE]\n\n')
+            self.close_connection = True
+
+    return Handler
+
+
+def start_fake_openai(config, host='127.0.0.1', port=0):
+    """Serve in a daemon thread; returns (server, base_url)"""
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='fake-openai', daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}/v1/chat/completions'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake OpenAI chat completions server')
+    parser.add_argument('--port', type=int, default=8700)
+    parser.add_argument('--latency-ms', type=float, default=300)
+    parser.add_argument('--jitter-ms', type=float, default=100)
+    parser.add_argument('--truncation-rate', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    config = FakeOpenAIConfig(args.latency_ms, args.jitter_ms, args.truncation_rate, args.error_rate)
+    server, url = start_fake_openai(config, port=args.port)
+    print(f'Fake OpenAI listening on {url}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
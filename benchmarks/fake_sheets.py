@@ -0,0 +1,46 @@
+"""
+In-memory stand-in for a gspread worksheet.
+
+Implements the calls app.py makes (row_values, col_values, insert_row,
+append_rows) with an optional per-call delay, so Sheets writes cost
+something without touching Google.
+"""
+import threading
+import time
+
+
+class FakeWorksheet:
+    def __init__(self, latency_ms=150):
+        self.latency = latency_ms / 1000
+        self.rows = []
+        self.api_calls = 0
+        self._lock = threading.Lock()
+
+    def _call(self):
+        time.sleep(self.latency)
+        with self._lock:
+            self.api_calls += 1
+
+    def row_values(self, index):
+        self._call()
+        with self._lock:
+            return list(self.rows[index - 1]) if len(self.rows) >= index else []
+
+    def col_values(self, index):
+        self._call()
+        with self._lock:
+            return [row[index - 1] if len(row) >= index else '' for row in self.rows]
+
+    def insert_row(self, values, index=1):
+        self._call()
+        with self._lock:
+            self.rows.insert(index - 1, list(values))
+
+    def append_rows(self, values, **kwargs):
+        self._call()
+        with self._lock:
+            self.rows.extend(list(row) for row in values)
+
+    def stats(self):
+        with self._lock:
+            return {'rows': len(self.rows), 'api_calls': self.api_calls}
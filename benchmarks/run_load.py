@@ -0,0 +1,288 @@
+"""
+Load benchmark for the Flask app against local fakes.
+
+Starts a fake OpenAI server (benchmarks/fake_openai.py), swaps the Google
+worksheet for an in-memory one (benchmarks/fake_sheets.py), serves the app
+with a threaded WSGI server and drives each scenario at the given
+concurrency levels. Throughput and p50/p95/p99 latency per scenario and
+level go to a JSON file (default benchmarks/results/<commit>.json), so two
+commits can be compared with --compare.
+
+Usage:
+    python benchmarks/run_load.py
+    python benchmarks/run_load.py --concurrency 1,8,32 --requests 200 --truncation-rate 0.1
+    python benchmarks/run_load.py --scenarios analyze --compare benchmarks/results/abc1234.json
+"""
+import argparse
+import functools
+import itertools
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_openai import FakeOpenAIConfig, start_fake_openai  # noqa: E402
+from fake_sheets import FakeWorksheet  # noqa: E402
+
+SIGNS = ['aries', 'taurus', 'gemini', 'cancer', 'leo', 'virgo',
+         'libra', 'scorpio', 'sagittarius', 'capricorn', 'aquarius', 'pisces']
+GENDERS = ['Nam', 'Nữ', 'Khác']
+STATIC_PATHS = ['/', '/style.css', '/script.js']
+
+
+def analyze_request(rng, path='/api/analyze'):
+    # Names are not part of the analysis key (prompts use placeholders), only signs and genders are:
+    # drawing them at random spreads the load over 12 * 12 * 3 * 3 keys, so only a small share of
+    # requests find an identical analysis in flight and coalesce with it (or, with --cache, repeat one)
+    suffix = rng.randrange(10 ** 9)
+    return 'POST', path, {
+        'person1': {'name': f'Người A {suffix}', 'zodiacSign': rng.choice(SIGNS), 'gender': rng.choice(GENDERS)},
+        'person2': {'name': f'Người B {suffix}', 'zodiacSign': rng.choice(SIGNS), 'gender': rng.choice(GENDERS)}
+    }
+
+
+SCENARIOS = {
+    'analyze': analyze_request,
+    'horoscope': lambda rng: ('GET', f'/api/horoscope/{rng.choice(SIGNS)}', None),
+    'static': lambda rng: ('GET', rng.choice(STATIC_PATHS), None),
+    'health': lambda rng: ('GET', '/health', None),
+}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def run_level(base_url, make_request, concurrency, total, seed, headers=None):
+    """Fire `total` requests from `concurrency` threads; returns the summary dict"""
+    import requests
+
+    local = threading.local()
+    counter = itertools.count()
+    latencies = []
+    results = {'errors': 0, 'bytes': 0, 'wire_bytes': 0, 'statuses': {}}
+    lock = threading.Lock()
+
+    def worker():
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+            local.rng = random.Random(seed + threading.get_ident())
+        while next(counter) < total:
+            method, path, body = make_request(local.rng)
+            started = time.perf_counter()
+            try:
+                response = session.request(method, base_url + path, json=body, headers=headers, timeout=120)
+                size = len(response.content)
+                # Bytes read off the socket, i.e. before any Content-Encoding is undone
+                wire_size = response.raw.tell() or size
+                status = str(response.status_code)
+            except Exception:
+                size, wire_size, status = 0, 0, 'error'
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                results['bytes'] += size
+                results['wire_bytes'] += wire_size
+                results['statuses'][status] = results['statuses'].get(status, 0) + 1
+                if status == 'error' or not status.startswith('2'):
+                    results['errors'] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    count = len(latencies)
+    return {
+        'concurrency': concurrency,
+        'requests': count,
+        'duration_s': round(wall, 3),
+        'throughput_rps': round(count / wall, 2) if wall else None,
+        'latency_ms': {
+            'mean': round(sum(latencies) / count * 1000, 2) if count else None,
+            'p50': round(percentile(latencies, 0.50) * 1000, 2) if count else None,
+            'p95': round(percentile(latencies, 0.95) * 1000, 2) if count else None,
+            'p99': round(percentile(latencies, 0.99) * 1000, 2) if count else None,
+            'max': round(latencies[-1] * 1000, 2) if count else None,
+        },
+        'errors': results['errors'],
+        'statuses': results['statuses'],
+        'bytes_per_request': round(results['bytes'] / count) if count else 0,
+        'wire_bytes_per_request': round(results['wire_bytes'] / count) if count else 0,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def configure_environment(args):
+    """Environment for the app import; must run before `import app`"""
+    os.environ['OPENAI_API_KEY'] = 'sk-bench-not-a-real-key'
+    # Only the fake OpenAI exists; a GEMINI_API_KEY from .env must not reach the real API
+    os.environ['AI_PROVIDERS'] = 'openai'
+    os.environ['GOOGLE_SHEETS_ENABLED'] = 'true'
+    os.environ['AI_CACHE_ENABLED'] = 'true' if args.cache else 'false'
+    scratch = tempfile.mkdtemp(prefix='zodiac_bench_')
+    os.environ['AI_CACHE_PATH'] = os.path.join(scratch, 'ai_cache.sqlite3')
+    os.environ['OUTBOX_PATH'] = os.path.join(scratch, 'outbox.sqlite3')
+    os.environ['JOBS_PATH'] = os.path.join(scratch, 'jobs.sqlite3')
+    os.environ['STATS_SNAPSHOT_PATH'] = os.path.join(scratch, 'submission_stats.json')
+    os.environ['CONTENT_BUNDLE_PATH'] = args.bundle or os.path.join(tempfile.gettempdir(), 'zodiac_bench_no_bundle.json')
+    os.environ['LOG_LEVEL'] = args.log_level
+    os.environ['ZODIAC_DEFER_WORKER_INIT'] = 'true'
+    os.environ.pop('METRICS_DIR', None)
+
+
+def start_app(fake_url, worksheet):
+    """Import the app wired to the fakes and serve it on a free port"""
+    from werkzeug.serving import make_server
+
+    # Relative defaults (credentials file) resolve against the repository, as when the app runs from it
+    os.chdir(REPO_ROOT)
+    import app as zodiac_app
+
+    zodiac_app.openai_provider.url = fake_url
+    zodiac_app.get_google_worksheet = lambda: worksheet
+    zodiac_app.init_worker()
+
+    # The access log would otherwise write a line per request
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, zodiac_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-http', daemon=True).start()
+    return zodiac_app, server, f'http://127.0.0.1:{server.server_port}'
+
+
+def compare(current, baseline_path):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"\nvs {baseline.get('commit')} ({baseline_path})")
+    for name, levels in current['scenarios'].items():
+        old_levels = {level['concurrency']: level for level in baseline.get('scenarios', {}).get(name, [])}
+        for level in levels:
+            old = old_levels.get(level['concurrency'])
+            if not old or not old.get('throughput_rps') or not old['latency_ms'].get('p95'):
+                continue
+            rps_change = (level['throughput_rps'] / old['throughput_rps'] - 1) * 100
+            p95_change = (level['latency_ms']['p95'] / old['latency_ms']['p95'] - 1) * 100
+            line = f"  {name:<10} c={level['concurrency']:<4} rps {rps_change:+7.1f}%   p95 {p95_change:+7.1f}%"
+            if old.get('wire_bytes_per_request'):
+                line += f"   bytes {(level['wire_bytes_per_request'] / old['wire_bytes_per_request'] - 1) * 100:+7.1f}%"
+            print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load benchmark against fake OpenAI and Sheets')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='comma-separated: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--concurrency', default='1,8,32', help='comma-separated concurrency levels')
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario and level')
+    parser.add_argument('--warmup', type=int, default=10, help='unmeasured requests before each scenario')
+    parser.add_argument('--latency-ms', type=float, default=300, help='fake OpenAI mean latency')
+    parser.add_argument('--jitter-ms', type=float, default=100, help='fake OpenAI latency std deviation')
+    parser.add_argument('--truncation-rate', type=float, default=0.0, help='share of truncated OpenAI replies')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of 429/500 OpenAI replies')
+    parser.add_argument('--sheets-latency-ms', type=float, default=150, help='fake worksheet per-call latency')
+    parser.add_argument('--cache', action='store_true', help='enable the SQLite AI cache (off by default)')
+    parser.add_argument('--bundle', help='content bundle to load (none by default)')
+    parser.add_argument('--accept-encoding', default='gzip, br',
+                        help="Accept-Encoding sent by clients ('identity' for uncompressed)")
+    parser.add_argument('--analyze-fields', help='fields= selector for /api/analyze, e.g. compatibility_analysis')
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='result file (default benchmarks/results/<commit>.json)')
+    parser.add_argument('--compare', help='earlier result file to print deltas against')
+    args = parser.parse_args(argv)
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    drivers = dict(SCENARIOS)
+    if args.analyze_fields:
+        drivers['analyze'] = functools.partial(analyze_request, path=f'/api/analyze?fields={args.analyze_fields}')
+    headers = {'Accept-Encoding': args.accept_encoding}
+
+    configure_environment(args)
+    fake_config = FakeOpenAIConfig(args.latency_ms, args.jitter_ms, args.truncation_rate, args.error_rate, seed=args.seed)
+    fake_server, fake_url = start_fake_openai(fake_config)
+    worksheet = FakeWorksheet(args.sheets_latency_ms)
+    zodiac_app, server, base_url = start_app(fake_url, worksheet)
+
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'config': {
+            'requests_per_level': args.requests,
+            'concurrency': levels,
+            'openai_latency_ms': args.latency_ms,
+            'openai_jitter_ms': args.jitter_ms,
+            'truncation_rate': args.truncation_rate,
+            'error_rate': args.error_rate,
+            'sheets_latency_ms': args.sheets_latency_ms,
+            'cache': args.cache,
+            'bundle': args.bundle,
+            'accept_encoding': args.accept_encoding,
+            'analyze_fields': args.analyze_fields,
+            'seed': args.seed,
+        },
+        'scenarios': {},
+    }
+
+    try:
+        for name in scenarios:
+            if args.warmup:
+                run_level(base_url, drivers[name], 1, args.warmup, args.seed, headers)
+            report['scenarios'][name] = []
+            for concurrency in levels:
+                summary = run_level(base_url, drivers[name], concurrency, args.requests, args.seed, headers)
+                report['scenarios'][name].append(summary)
+                latency = summary['latency_ms']
+                print(f"{name:<10} c={concurrency:<4} {summary['throughput_rps']:>9.1f} req/s   "
+                      f"p50 {latency['p50']:>8.1f} ms   p95 {latency['p95']:>8.1f} ms   "
+                      f"p99 {latency['p99']:>8.1f} ms   {summary['wire_bytes_per_request']:>7} B/resp   "
+                      f"errors {summary['errors']}")
+    finally:
+        server.shutdown()
+        zodiac_app.shutdown_worker()
+        fake_server.shutdown()
+
+    report['fake_openai'] = fake_config.stats()
+    report['fake_sheets'] = worksheet.stats()
+
+    output = args.output or os.path.join(REPO_ROOT, 'benchmarks', 'results', f'{commit}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f'\nResults written to {output}')
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Content-Encoding negotiation and compression (gzip, plus brotli when the
+optional `brotli` package is installed).
+
+Shared by the static asset cache, which compresses once at load time with
+the strongest settings, and by JSON API responses, which are compressed
+per request with cheaper ones.
+"""
+import gzip
+import re
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Per-request settings trade a little size for much less CPU than the maximum
+FAST_LEVELS = {'gzip': 6, 'br': 5}
+BEST_LEVELS = {'gzip': 9, 'br': 11}
+
+
+def available_encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def parse_accept_encoding(header):
+    """Map each acceptable coding to its q-value (q=0 entries are dropped)"""
+    accepted = {}
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        match = re.search(r'q\s*=\s*([0-9.]+)', params)
+        if match:
+            try:
+                quality = float(match.group(1))
+            except ValueError:
+                quality = 0.0
+        accepted[coding] = quality
+    return {coding: quality for coding, quality in accepted.items() if quality > 0}
+
+
+def choose_encoding(header, available):
+    """Best of br / gzip the client accepts and we have, else identity"""
+    accepted = parse_accept_encoding(header)
+    best, best_quality = 'identity', 0.0
+    for coding in ('br', 'gzip'):
+        if coding not in available:
+            continue
+        quality = accepted.get(coding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def compress(body, encoding, best=False):
+    level = (BEST_LEVELS if best else FAST_LEVELS)[encoding]
+    if encoding == 'br':
+        return brotli.compress(body, quality=level)
+    # mtime=0 makes the output depend on the body only (stable ETags across workers)
+    return gzip.compress(body, compresslevel=level, mtime=0)
@@ -21,14 +21,123 @@ class Config:
     GOOGLE_CREDENTIALS_PATH = os.environ.get('GOOGLE_CREDENTIALS_PATH') or 'google-credentials.json'
     GOOGLE_SHEET_ID = os.environ.get('GOOGLE_SHEET_ID')
     GOOGLE_SHEETS_ENABLED = os.environ.get('GOOGLE_SHEETS_ENABLED', 'True').lower() == 'true'
+    # Refresh the shared client's access token this many seconds before it expires
+    GOOGLE_TOKEN_REFRESH_MARGIN = int(os.environ.get('GOOGLE_TOKEN_REFRESH_MARGIN', '300'))
+    # Submissions are journalled to a local SQLite outbox (always - /api/stats reads it), then,
+    # with Sheets enabled, appended there in batches by size or time window; the replayer
+    # backs off up to SHEETS_RETRY_MAX seconds
+    OUTBOX_PATH = os.environ.get('OUTBOX_PATH') or 'outbox.sqlite3'
+    SHEETS_BATCH_SIZE = int(os.environ.get('SHEETS_BATCH_SIZE', '500'))
+    SHEETS_FLUSH_INTERVAL = float(os.environ.get('SHEETS_FLUSH_INTERVAL', '2.0'))
+    SHEETS_RETRY_MAX = float(os.environ.get('SHEETS_RETRY_MAX', '60'))
+    # Opt-in: delivered journal entries older than this are pruned once a stats snapshot covers them;
+    # the journal is then no longer a full history, so deleting the snapshot loses those counts (0 keeps all)
+    OUTBOX_RETENTION_SECONDS = int(os.environ.get('OUTBOX_RETENTION_SECONDS', '0'))
     
     # Horoscope System
     HOROSCOPE_SYSTEM_ENABLED = True
+    # Seconds before local midnight to prefill the next day's horoscopes
+    HOROSCOPE_WARMUP_LEAD_SECONDS = int(os.environ.get('HOROSCOPE_WARMUP_LEAD_SECONDS', '300'))
     
-    # AI Configuration
-    AI_MODEL = os.environ.get('AI_MODEL') or 'gemini-2.0-flash'
+    # AI Configuration: providers in priority order (those without an API key are skipped);
+    # each provider has its own model (the former AI_MODEL name is still read for Gemini),
+    # AI_MAX_TOKENS caps every call of either provider
+    AI_PROVIDERS = [name.strip().lower() for name in os.environ.get('AI_PROVIDERS', 'openai,gemini').split(',') if name.strip()]
+    OPENAI_MODEL = os.environ.get('OPENAI_MODEL') or 'gpt-4o'
+    GEMINI_MODEL = os.environ.get('GEMINI_MODEL') or os.environ.get('AI_MODEL') or 'gemini-2.0-flash'
     AI_TEMPERATURE = float(os.environ.get('AI_TEMPERATURE', '0.7'))
     AI_MAX_TOKENS = int(os.environ.get('AI_MAX_TOKENS', '8192'))
+    # Output budget of one full analysis, and seconds to wait for a provider's reply
+    AI_ANALYSIS_MAX_TOKENS = int(os.environ.get('AI_ANALYSIS_MAX_TOKENS', '2500'))
+    AI_REQUEST_TIMEOUT = float(os.environ.get('AI_REQUEST_TIMEOUT', '60'))
+    # Routing: latency (fastest expected provider first) or priority (AI_PROVIDERS order)
+    AI_ROUTING = os.environ.get('AI_ROUTING', 'latency').lower()
+    # Hedging: call the next provider when the first is slower than its p95 latency
+    # (never sooner than MIN_DELAY; DEFAULT_DELAY until 20 calls are measured),
+    # for at most AI_HEDGE_BUDGET of all calls
+    AI_HEDGE_ENABLED = os.environ.get('AI_HEDGE_ENABLED', 'True').lower() == 'true'
+    AI_HEDGE_QUANTILE = float(os.environ.get('AI_HEDGE_QUANTILE', '0.95'))
+    AI_HEDGE_MIN_DELAY = float(os.environ.get('AI_HEDGE_MIN_DELAY', '0.5'))
+    AI_HEDGE_DEFAULT_DELAY = float(os.environ.get('AI_HEDGE_DEFAULT_DELAY', '8.0'))
+    AI_HEDGE_BUDGET = float(os.environ.get('AI_HEDGE_BUDGET', '0.1'))
+    
+    # AI provider HTTP clients: each provider (OpenAI and Gemini) gets its own client built
+    # from these settings - connection pool, retries and circuit breaker. The former
+    # OPENAI_POOL_MAXSIZE / OPENAI_MAX_RETRIES / ... names are still read as fallbacks
+    AI_HTTP_POOL_MAXSIZE = int(os.environ.get('AI_HTTP_POOL_MAXSIZE') or os.environ.get('OPENAI_POOL_MAXSIZE', '20'))
+    AI_HTTP_MAX_RETRIES = int(os.environ.get('AI_HTTP_MAX_RETRIES') or os.environ.get('OPENAI_MAX_RETRIES', '2'))
+    AI_HTTP_BACKOFF_BASE = float(os.environ.get('AI_HTTP_BACKOFF_BASE') or os.environ.get('OPENAI_BACKOFF_BASE', '0.5'))
+    AI_HTTP_BACKOFF_MAX = float(os.environ.get('AI_HTTP_BACKOFF_MAX') or os.environ.get('OPENAI_BACKOFF_MAX', '8.0'))
+    AI_CIRCUIT_FAILURES = int(os.environ.get('AI_CIRCUIT_FAILURES') or os.environ.get('OPENAI_CIRCUIT_FAILURES', '5'))
+    AI_CIRCUIT_COOLDOWN = float(os.environ.get('AI_CIRCUIT_COOLDOWN') or os.environ.get('OPENAI_CIRCUIT_COOLDOWN', '30'))
+    
+    # AI admission control: concurrent calls, quota pacing (0 = unlimited), wait queue.
+    # Each provider is paced against its own RPM/TPM buckets (AI_RATE_LIMIT_* applies to a
+    # provider without its own setting); every gunicorn worker keeps its own buckets, so set
+    # each value to the account quota divided by GUNICORN_WORKERS
+    AI_MAX_CONCURRENT = int(os.environ.get('AI_MAX_CONCURRENT', '8'))
+    AI_RATE_LIMIT_RPM = int(os.environ.get('AI_RATE_LIMIT_RPM', '0'))
+    AI_RATE_LIMIT_TPM = int(os.environ.get('AI_RATE_LIMIT_TPM', '0'))
+    OPENAI_RATE_LIMIT_RPM = int(os.environ.get('OPENAI_RATE_LIMIT_RPM') or AI_RATE_LIMIT_RPM)
+    OPENAI_RATE_LIMIT_TPM = int(os.environ.get('OPENAI_RATE_LIMIT_TPM') or AI_RATE_LIMIT_TPM)
+    GEMINI_RATE_LIMIT_RPM = int(os.environ.get('GEMINI_RATE_LIMIT_RPM') or AI_RATE_LIMIT_RPM)
+    GEMINI_RATE_LIMIT_TPM = int(os.environ.get('GEMINI_RATE_LIMIT_TPM') or AI_RATE_LIMIT_TPM)
+    AI_ADMISSION_QUEUE = int(os.environ.get('AI_ADMISSION_QUEUE', '50'))
+    AI_ADMISSION_TIMEOUT = float(os.environ.get('AI_ADMISSION_TIMEOUT', '5'))
+    # Max seconds a request waits on an identical in-flight analysis
+    AI_SINGLEFLIGHT_TIMEOUT = float(os.environ.get('AI_SINGLEFLIGHT_TIMEOUT', '90'))
+    # OpenAI output mode: json_schema (structured outputs), json_object or off
+    AI_RESPONSE_FORMAT = os.environ.get('AI_RESPONSE_FORMAT', 'json_schema').lower()
+    # Ask once more for sections a truncated reply did not deliver
+    AI_FOLLOWUP_ENABLED = os.environ.get('AI_FOLLOWUP_ENABLED', 'True').lower() == 'true'
+    
+    # AI Result Cache (SQLite)
+    AI_CACHE_ENABLED = os.environ.get('AI_CACHE_ENABLED', 'True').lower() == 'true'
+    AI_CACHE_PATH = os.environ.get('AI_CACHE_PATH') or 'ai_cache.sqlite3'
+    AI_CACHE_MAX_ENTRIES = int(os.environ.get('AI_CACHE_MAX_ENTRIES', '2000'))
+    AI_CACHE_TTL_SECONDS = int(os.environ.get('AI_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+    
+    # Pre-generated analyses written by pregenerate.py, loaded at startup
+    CONTENT_BUNDLE_PATH = os.environ.get('CONTENT_BUNDLE_PATH') or 'content_bundle.json'
+    
+    # Asynchronous analysis jobs (POST /api/analyze?async=1); state is shared by all workers through JOBS_PATH
+    JOBS_PATH = os.environ.get('JOBS_PATH') or 'jobs.sqlite3'
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '4'))
+    JOB_TTL_SECONDS = int(os.environ.get('JOB_TTL_SECONDS', '600'))
+    JOB_MAX_PENDING = int(os.environ.get('JOB_MAX_PENDING', '100'))
+    
+    # POST /api/analyze/batch: max pairs per call, unique analyses run in parallel per call
+    ANALYSIS_BATCH_MAX_PAIRS = int(os.environ.get('ANALYSIS_BATCH_MAX_PAIRS', '500'))
+    ANALYSIS_BATCH_CONCURRENCY = int(os.environ.get('ANALYSIS_BATCH_CONCURRENCY', '4'))
+    
+    # Max birthdates per POST /api/zodiac/bulk call
+    ZODIAC_BULK_MAX_ITEMS = int(os.environ.get('ZODIAC_BULK_MAX_ITEMS', '10000'))
+    
+    # POST /api/matchmaking: roster size and list length limits
+    MATCHMAKING_MAX_PARTICIPANTS = int(os.environ.get('MATCHMAKING_MAX_PARTICIPANTS', '10000'))
+    MATCHMAKING_MAX_K = int(os.environ.get('MATCHMAKING_MAX_K', '50'))
+    
+    # GET /api/stats: counters folded from the submission journal, snapshotted to disk
+    STATS_SNAPSHOT_PATH = os.environ.get('STATS_SNAPSHOT_PATH') or 'submission_stats.json'
+    STATS_SNAPSHOT_INTERVAL = float(os.environ.get('STATS_SNAPSHOT_INTERVAL', '60'))
+    STATS_REFRESH_INTERVAL = float(os.environ.get('STATS_REFRESH_INTERVAL', '1.0'))
+    STATS_MAX_PERIODS = int(os.environ.get('STATS_MAX_PERIODS', '366'))
+    
+    # Logging: level, json | text, and the share of DEBUG lines kept (1.0 = all)
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json').lower()
+    LOG_DEBUG_SAMPLE_RATE = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', '1.0'))
+    
+    # Metrics: per-worker snapshot directory (set by gunicorn.conf.py) and write interval
+    METRICS_DIR = os.environ.get('METRICS_DIR') or None
+    METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', '5'))
+    
+    # Static assets: re-read files when they change (development), max-age for fingerprinted names
+    STATIC_RELOAD = os.environ.get('STATIC_RELOAD', 'False').lower() == 'true'
+    STATIC_MAX_AGE = int(os.environ.get('STATIC_MAX_AGE', str(365 * 24 * 3600)))
+    # gzip / brotli for JSON API responses at least this many bytes long
+    RESPONSE_COMPRESSION_ENABLED = os.environ.get('RESPONSE_COMPRESSION_ENABLED', 'True').lower() == 'true'
+    RESPONSE_COMPRESSION_MIN_SIZE = int(os.environ.get('RESPONSE_COMPRESSION_MIN_SIZE', '1024'))
     
     # Application Settings
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file upload
@@ -40,6 +149,7 @@ class DevelopmentConfig(Config):
     """Development configuration"""
     DEBUG = True
     FLASK_ENV = 'development'
+    STATIC_RELOAD = os.environ.get('STATIC_RELOAD', 'True').lower() == 'true'
 
 class ProductionConfig(Config):
     """Production configuration"""
@@ -0,0 +1,88 @@
+"""
+Gunicorn configuration for production.
+
+Usage:
+    gunicorn -c gunicorn.conf.py app:app
+
+Environment variables:
+    PORT                   Port to bind (default 5000)
+    GUNICORN_WORKERS       Number of worker processes (default 2)
+    GUNICORN_WORKER_CLASS  sync | threaded | gevent (default threaded)
+    GUNICORN_THREADS       Threads per worker for the threaded class (default 8)
+    GUNICORN_CONNECTIONS   Max concurrent connections per gevent worker (default 200)
+    GUNICORN_PRELOAD       true to import the app once in the master before forking
+    GUNICORN_TIMEOUT       Worker timeout in seconds (default 120, above the 60 s AI call)
+    METRICS_DIR            Where workers write metric snapshots for /metrics (default: temp dir)
+"""
+import os
+import sys
+import tempfile
+
+WORKER_CLASSES = {
+    'sync': 'sync',
+    'threaded': 'gthread',
+    'gthread': 'gthread',
+    'gevent': 'gevent'
+}
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('GUNICORN_WORKERS', '2'))
+worker_class = WORKER_CLASSES.get(os.environ.get('GUNICORN_WORKER_CLASS', 'threaded').lower(), 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', '8')) if worker_class == 'gthread' else 1
+worker_connections = int(os.environ.get('GUNICORN_CONNECTIONS', '200'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'false').lower() == 'true'
+
+# Recycle workers now and then to cap slow memory growth
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = 100
+
+accesslog = '-'
+errorlog = '-'
+
+if worker_class == 'gevent':
+    # gevent is optional (not in requirements.txt); say so instead of failing inside gunicorn
+    try:
+        from gevent import monkey
+    except ImportError:
+        sys.exit('GUNICORN_WORKER_CLASS=gevent needs the gevent package: pip install gevent')
+    # Patch before the app (and requests/ssl) is imported, which matters with preload
+    monkey.patch_all()
+
+# Every worker writes its metric snapshot here; /metrics sums them all
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), f'zodiac_metrics_{bind.rsplit(":", 1)[-1]}'))
+
+if preload_app:
+    # The master only imports the app; each worker initializes itself in post_fork
+    os.environ['ZODIAC_DEFER_WORKER_INIT'] = 'true'
+
+
+def on_starting(server):
+    """Drop metric snapshots left over from a previous run"""
+    import metrics
+    metrics.clear_directory(os.environ['METRICS_DIR'])
+
+
+def post_fork(server, worker):
+    """Per-worker setup: AI cache connection, Sheets client, horoscope warm-up thread"""
+    if preload_app:
+        import app as zodiac_app
+        zodiac_app.init_worker()
+
+
+def worker_exit(server, worker):
+    """Flush queued Google Sheets rows before the worker goes away"""
+    zodiac_app = sys.modules.get('app')
+    if zodiac_app is not None:
+        zodiac_app.shutdown_worker()
+
+
+def child_exit(server, worker):
+    """Fold the exited worker's metrics into the archive so counters never go backwards"""
+    import metrics
+    try:
+        metrics.archive_worker(os.environ['METRICS_DIR'], worker.pid)
+    except Exception as e:
+        server.log.warning("Could not archive metrics of worker %s: %s", worker.pid, e)
@@ -0,0 +1,274 @@
+"""
+Pooled, keep-alive HTTP client for upstream AI calls.
+
+One `requests.Session` per process with tuned connection pools, jittered
+exponential backoff that honors `Retry-After`, and a circuit breaker that
+skips upstream for a cool-down after consecutive failures. Every call is
+timed (connect, time-to-first-byte, total).
+"""
+import email.utils
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Connect time of the most recent new connection on this thread
+_connect_timing = threading.local()
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        _connect_timing.ms = (time.perf_counter() - started) * 1000
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        # Includes the TLS handshake
+        started = time.perf_counter()
+        super().connect()
+        _connect_timing.ms = (time.perf_counter() - started) * 1000
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections record how long connect/TLS took"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool
+        }
+
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker is open and upstream is skipped"""
+
+
+class CircuitBreaker:
+    """Open after N consecutive failures, allow one trial call after the cool-down"""
+
+    def __init__(self, failure_threshold=5, cooldown_seconds=30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.cooldown_seconds:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        """True if a call may go upstream now"""
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self._trial_in_flight or self.consecutive_failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    self.times_opened += 1
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+def parse_retry_after(value):
+    """Return the Retry-After delay in seconds (delta-seconds or HTTP-date), or None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at is None:
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class UpstreamClient:
+    """Process-wide pooled session with retries, backoff and a circuit breaker"""
+
+    def __init__(self, pool_connections=4, pool_maxsize=20, max_retries=2,
+                 backoff_base=0.5, backoff_max=8.0, breaker=None):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.short_circuited = 0
+        self.new_connections = 0
+        self.status_counts = {}
+        self.total_connect_ms = 0.0
+        self.total_ttfb_ms = 0.0
+        self.total_ms = 0.0
+        self.last_timing = None
+
+    @property
+    def session(self):
+        # Re-created after fork so workers never share sockets
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    session = requests.Session()
+                    adapter = TimedHTTPAdapter(
+                        pool_connections=self.pool_connections,
+                        pool_maxsize=self.pool_maxsize,
+                        max_retries=0
+                    )
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    session.headers['Connection'] = 'keep-alive'
+                    self._session = session
+                    self._pid = os.getpid()
+        return self._session
+
+    def _backoff(self, attempt, response=None):
+        """Full-jitter exponential backoff, never shorter than Retry-After"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+        return delay
+
+    def post(self, url, **kwargs):
+        """POST with retries on 429/5xx and connection errors; timing is attached to the response"""
+        if not self.breaker.allow():
+            with self._stats_lock:
+                self.short_circuited += 1
+            raise CircuitOpenError(f'Circuit open for {url}, skipping upstream call')
+
+        attempt = 0
+        while True:
+            _connect_timing.ms = None
+            started = time.perf_counter()
+            try:
+                response = self.session.post(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self._record(None, started, None)
+                if attempt < self.max_retries:
+                    delay = self._backoff(attempt)
+                    attempt += 1
+                    with self._stats_lock:
+                        self.retries += 1
+                    time.sleep(delay)
+                    continue
+                self.breaker.record_failure()
+                raise
+            except Exception:
+                self.breaker.record_failure()
+                raise
+
+            timing = self._record(response, started, _connect_timing.ms)
+            response.upstream_timing = timing
+            response.upstream_attempts = attempt + 1
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                delay = self._backoff(attempt, response)
+                if delay <= self.backoff_max:
+                    response.close()
+                    attempt += 1
+                    with self._stats_lock:
+                        self.retries += 1
+                    time.sleep(delay)
+                    continue
+
+            if response.status_code in RETRY_STATUS_CODES:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            return response
+
+    def _record(self, response, started, connect_ms):
+        total_ms = (time.perf_counter() - started) * 1000
+        ttfb_ms = response.elapsed.total_seconds() * 1000 if response is not None else None
+        timing = {
+            'connect_ms': round(connect_ms, 2) if connect_ms is not None else 0.0,
+            'reused_connection': connect_ms is None,
+            'ttfb_ms': round(ttfb_ms, 2) if ttfb_ms is not None else None,
+            'total_ms': round(total_ms, 2),
+            'status': response.status_code if response is not None else None
+        }
+        with self._stats_lock:
+            self.calls += 1
+            if response is None:
+                self.failures += 1
+            else:
+                key = str(response.status_code)
+                self.status_counts[key] = self.status_counts.get(key, 0) + 1
+                self.total_ttfb_ms += ttfb_ms
+            if connect_ms is not None:
+                self.new_connections += 1
+                self.total_connect_ms += connect_ms
+            self.total_ms += total_ms
+            self.last_timing = timing
+        return timing
+
+    def stats(self):
+        """Return call counters, average timings and breaker state"""
+        with self._stats_lock:
+            responses = sum(self.status_counts.values())
+            return {
+                'calls': self.calls,
+                'retries': self.retries,
+                'connection_failures': self.failures,
+                'short_circuited': self.short_circuited,
+                'status_counts': dict(self.status_counts),
+                'new_connections': self.new_connections,
+                'avg_connect_ms': round(self.total_connect_ms / self.new_connections, 2) if self.new_connections else None,
+                'avg_ttfb_ms': round(self.total_ttfb_ms / responses, 2) if responses else None,
+                'avg_total_ms': round(self.total_ms / self.calls, 2) if self.calls else None,
+                'last_timing': self.last_timing,
+                'circuit_state': self.breaker.state,
+                'circuit_opened': self.breaker.times_opened,
+                'consecutive_failures': self.breaker.consecutive_failures,
+                'pool_maxsize': self.pool_maxsize
+            }
@@ -0,0 +1,171 @@
+"""
+Job queue for asynchronous analysis requests.
+
+Jobs run on a bounded thread pool so the web worker that accepted the
+request returns immediately. Job state lives in a small SQLite file shared
+by every gunicorn worker on the host, so the status URL works whichever
+worker the poll lands on. Finished jobs are kept for a TTL and then
+dropped; a job whose worker died before finishing is dropped once it is
+older than the TTL.
+"""
+import contextvars
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFull(Exception):
+    """Raised when too many jobs are already queued or running"""
+
+
+class JobManager:
+    """Run callables on a bounded pool and keep their results in a shared store for a TTL"""
+
+    def __init__(self, path, max_workers=4, ttl_seconds=600, max_pending=100):
+        self.path = path
+        self.max_workers = max_workers
+        self.ttl_seconds = ttl_seconds
+        self.max_pending = max_pending
+        self._executor = None
+        self._pid = None
+        self._conn = None
+        self._conn_pid = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.rejected = 0
+
+    def _get_executor(self):
+        # Created lazily so each forked worker gets its own threads
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='analysis-job')
+            self._pid = os.getpid()
+        return self._executor
+
+    def _connect(self):
+        # A forked worker must open its own connection
+        if self._conn_pid == os.getpid():
+            return self._conn
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            ' job_id TEXT PRIMARY KEY,'
+            ' status TEXT NOT NULL,'
+            ' created_at REAL NOT NULL,'
+            ' started_at REAL,'
+            ' finished_at REAL,'
+            ' result TEXT,'
+            ' error TEXT)'
+        )
+        self._conn = conn
+        self._conn_pid = os.getpid()
+        return conn
+
+    def _expire(self, conn, now):
+        cutoff = now - self.ttl_seconds
+        conn.execute(
+            'DELETE FROM jobs WHERE finished_at < ? OR (finished_at IS NULL AND created_at < ?)',
+            (cutoff, cutoff)
+        )
+
+    def _update(self, job_id, **fields):
+        columns = ', '.join(f'{name} = ?' for name in fields)
+        with self._lock:
+            conn = self._connect()
+            return conn.execute(
+                f'UPDATE jobs SET {columns} WHERE job_id = ?', (*fields.values(), job_id)
+            ).rowcount
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) and return the new job id"""
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._expire(conn, now)
+                pending = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')"
+                ).fetchone()[0]
+                if pending >= self.max_pending:
+                    conn.execute('COMMIT')
+                    self.rejected += 1
+                    raise JobQueueFull('Too many analysis jobs in progress, please retry later')
+                conn.execute(
+                    "INSERT INTO jobs (job_id, status, created_at) VALUES (?, 'queued', ?)", (job_id, now)
+                )
+                conn.execute('COMMIT')
+            except sqlite3.Error:
+                conn.execute('ROLLBACK')
+                raise
+            self.submitted += 1
+            executor = self._get_executor()
+        # Run in a copy of the caller's context so logs keep the request's correlation id
+        executor.submit(contextvars.copy_context().run, self._run, job_id, fn, args, kwargs)
+        return job_id
+
+    def _run(self, job_id, fn, args, kwargs):
+        if not self._update(job_id, status='running', started_at=time.time()):
+            return
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            logger.exception("Error in analysis job", extra={'job_id': job_id})
+            self._update(job_id, status='failed', error=str(e), finished_at=time.time())
+            return
+        self._update(job_id, status='done', result=json.dumps(result, ensure_ascii=False), finished_at=time.time())
+
+    def get(self, job_id):
+        """Return a snapshot of the job, or None if unknown or expired"""
+        with self._lock:
+            conn = self._connect()
+            self._expire(conn, time.time())
+            row = conn.execute(
+                'SELECT status, created_at, started_at, finished_at, result, error FROM jobs WHERE job_id = ?',
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        status, created_at, started_at, finished_at, result, error = row
+        snapshot = {
+            'job_id': job_id,
+            'status': status,
+            'created_at': created_at,
+            'started_at': started_at,
+            'finished_at': finished_at,
+            'result': json.loads(result) if result is not None else None,
+            'error': error
+        }
+        for key in ('created_at', 'started_at', 'finished_at'):
+            if snapshot[key]:
+                snapshot[key] = round(snapshot[key], 3)
+        return snapshot
+
+    def stats(self):
+        """Return pool size, this worker's submit counters and job counts by status (all workers)"""
+        with self._lock:
+            conn = self._connect()
+            self._expire(conn, time.time())
+            counts = dict(conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+        return {
+            'max_workers': self.max_workers,
+            'max_pending': self.max_pending,
+            'ttl_seconds': self.ttl_seconds,
+            'submitted': self.submitted,
+            'rejected': self.rejected,
+            'jobs': counts
+        }
+
+    def shutdown(self, wait=True):
+        """Stop accepting work and optionally wait for running jobs"""
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=wait)
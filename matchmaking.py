@@ -0,0 +1,131 @@
+"""
+Group matchmaking: ranked top-k partners for every participant of a roster.
+
+Compatibility depends only on the two signs, so participants are bucketed by
+profile (sign, gender, genders sought). Partner signs are ranked once per
+sign from the 12x12 score table and each profile's candidate buckets are read
+off that order. Genders come from a small closed set, so the number of
+profiles, and the ranking work, is bounded whatever the roster size. A
+participant's list is then read off the best buckets in order: the work per
+person is O(k + buckets visited) rather than O(N), with no pairwise scoring.
+
+Within a bucket every candidate scores the same; ties go to roster order.
+`max_per_person` caps how many lists one participant may appear in, which
+spreads popular signs across the roster (lists are filled greedily in roster
+order).
+"""
+
+
+def _accepts(seeking, gender):
+    return seeking is None or gender in seeking
+
+
+def _rank_buckets(profiles, score_table, mutual, min_score):
+    """For each profile, the candidate profiles it may match, best score first"""
+    by_sign = {}
+    for profile in profiles:
+        by_sign.setdefault(profile[0], []).append(profile)
+    # Partner signs ranked once per sign from the score table; ties go to the lower sign
+    sign_order = {
+        sign: sorted(by_sign, key=lambda other, row=score_table[sign]: (-row[other], other))
+        for sign in by_sign
+    }
+    # Who may be matched depends only on (gender, seeking), not on the sign
+    eligible = {}
+    ranked = {}
+    for profile in profiles:
+        sign, gender, seeking = profile
+        accepted = eligible.get((gender, seeking))
+        if accepted is None:
+            accepted = eligible[(gender, seeking)] = {
+                candidate for candidate in profiles
+                if _accepts(seeking, candidate[1]) and (not mutual or _accepts(candidate[2], gender))
+            }
+        row = score_table[sign]
+        ranked[profile] = [
+            (candidate, row[other])
+            for other in sign_order[sign]
+            if min_score is None or row[other] >= min_score
+            for candidate in by_sign[other]
+            if candidate in accepted
+        ]
+    return ranked
+
+
+def top_k_matches(signs, genders, score_table, k=5, seeking=None, max_per_person=None,
+                  mutual=True, min_score=None):
+    """Best `k` partners for every participant
+
+    signs: sign index (0-11) per participant; genders: gender per participant;
+    score_table: 12x12 scores; seeking: per participant, a set of acceptable
+    partner genders or None for any. With `mutual`, the partner must accept
+    the participant's gender too.
+
+    Returns, per participant, a list of (partner_index, score), best first.
+    """
+    count = len(signs)
+    if seeking is None:
+        seeking = [None] * count
+    if k <= 0 or count == 0:
+        return [[] for _ in range(count)]
+
+    buckets = {}
+    profile_of = []
+    for index in range(count):
+        wanted = seeking[index]
+        profile = (signs[index], genders[index], frozenset(wanted) if wanted is not None else None)
+        members = buckets.get(profile)
+        if members is None:
+            members = buckets[profile] = []
+        members.append(index)
+        profile_of.append(profile)
+
+    ranked = _rank_buckets(list(buckets), score_table, mutual, min_score)
+
+    results = []
+    if max_per_person is None:
+        for index in range(count):
+            picks = []
+            for candidate, score in ranked[profile_of[index]]:
+                # One more than needed in case the participant is in this bucket
+                for member in buckets[candidate][:k - len(picks) + 1]:
+                    if member != index:
+                        picks.append((member, score))
+                        if len(picks) == k:
+                            break
+                if len(picks) == k:
+                    break
+            results.append(picks)
+        return results
+
+    remaining = [max_per_person] * count
+    capacity_left = max_per_person * count
+    heads = dict.fromkeys(buckets, 0)
+    for index in range(count):
+        picks = []
+        if capacity_left <= 0:
+            # Everyone has been recommended max_per_person times already
+            results.append(picks)
+            continue
+        for candidate, score in ranked[profile_of[index]]:
+            members = buckets[candidate]
+            # Members are used up in order, so exhausted ones form a prefix
+            head = heads[candidate]
+            if head == len(members):
+                continue
+            while head < len(members) and remaining[members[head]] <= 0:
+                head += 1
+            heads[candidate] = head
+            position = head
+            while position < len(members) and len(picks) < k:
+                member = members[position]
+                position += 1
+                if member == index or remaining[member] <= 0:
+                    continue
+                remaining[member] -= 1
+                capacity_left -= 1
+                picks.append((member, score))
+            if len(picks) == k:
+                break
+        results.append(picks)
+    return results
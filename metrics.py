@@ -0,0 +1,274 @@
+"""
+Minimal Prometheus-style metrics: labelled counters and histograms.
+
+Each process keeps its values in memory. When a metrics directory is set
+(always the case under gunicorn), a background thread snapshots them to
+`metrics_<pid>.json` so `/metrics`, served by whichever worker gets the
+scrape, can sum every worker's file. When a worker exits, the gunicorn
+master folds its file into `metrics_archive.json`, so counters stay
+monotonic across worker restarts.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+ARCHIVE_FILE = 'metrics_archive.json'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    def __init__(self, registry, name, documentation):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+
+    def inc(self, amount=1, **labels):
+        self.registry._inc(self.name, tuple(sorted(labels.items())), amount)
+
+
+class Histogram:
+    def __init__(self, registry, name, documentation, buckets):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        self.registry._observe(self.name, tuple(sorted(labels.items())), value, self.buckets)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the `with` block in seconds"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+
+class MetricsRegistry:
+    """Process-local metric values, optionally shared with sibling workers through files"""
+
+    def __init__(self, directory=None, flush_interval=5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._metrics = {}
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def counter(self, name, documentation):
+        metric = Counter(self, name, documentation)
+        self._metrics[name] = metric
+        return metric
+
+    def histogram(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        metric = Histogram(self, name, documentation, buckets)
+        self._metrics[name] = metric
+        return metric
+
+    def _reset_after_fork(self):
+        # A forked worker must not report the parent's values as its own
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._counters = {}
+            self._histograms = {}
+            self._thread = None
+
+    def _inc(self, name, labels, amount):
+        with self._lock:
+            self._reset_after_fork()
+            values = self._counters.setdefault(name, {})
+            values[labels] = values.get(labels, 0) + amount
+        self._ensure_flusher()
+
+    def _observe(self, name, labels, value, buckets):
+        with self._lock:
+            self._reset_after_fork()
+            values = self._histograms.setdefault(name, {})
+            state = values.get(labels)
+            if state is None:
+                state = values[labels] = [[0] * len(buckets), 0.0, 0]
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    state[0][index] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+        self._ensure_flusher()
+
+    def _ensure_flusher(self):
+        if not self.directory:
+            return
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+            self._thread.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Could not write metrics snapshot")
+
+    def _snapshot(self):
+        with self._lock:
+            self._reset_after_fork()
+            return {
+                'counters': {
+                    name: [[list(map(list, labels)), value] for labels, value in values.items()]
+                    for name, values in self._counters.items()
+                },
+                'histograms': {
+                    name: [[list(map(list, labels)), list(state[0]), state[1], state[2]]
+                           for labels, state in values.items()]
+                    for name, values in self._histograms.items()
+                }
+            }
+
+    def flush(self):
+        """Write this process's snapshot file (atomic replace)"""
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'metrics_{os.getpid()}.json')
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def _collect(self):
+        """Sum snapshots of every worker (live and archived) plus this process's live values"""
+        snapshots = [self._snapshot()]
+        if self.directory and os.path.isdir(self.directory):
+            own = f'metrics_{os.getpid()}.json'
+            for filename in os.listdir(self.directory):
+                if filename == own or not filename.endswith('.json'):
+                    continue
+                snapshot = _read_snapshot(os.path.join(self.directory, filename))
+                if snapshot:
+                    snapshots.append(snapshot)
+        return merge_snapshots(snapshots)
+
+    def render(self):
+        """Prometheus text exposition format"""
+        merged = self._collect()
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append(f'# HELP {name} {metric.documentation}')
+            if isinstance(metric, Histogram):
+                lines.append(f'# TYPE {name} histogram')
+                for labels, (bucket_counts, total, count) in sorted(merged['histograms'].get(name, {}).items()):
+                    cumulative = 0
+                    for bound, bucket_count in zip(metric.buckets, bucket_counts):
+                        cumulative += bucket_count
+                        lines.append(f'{name}_bucket{_format_labels(labels, [("le", _format_value(bound))])} {cumulative}')
+                    lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {count}')
+                    lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(round(total, 6))}')
+                    lines.append(f'{name}_count{_format_labels(labels)} {count}')
+            else:
+                lines.append(f'# TYPE {name} counter')
+                for labels, value in sorted(merged['counters'].get(name, {}).items()):
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _read_snapshot(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        # Being replaced right now, or a torn write from a killed worker
+        return None
+
+
+def merge_snapshots(snapshots):
+    """Sum counter values and histogram buckets with identical labels"""
+    counters = {}
+    histograms = {}
+    for snapshot in snapshots:
+        for name, entries in snapshot.get('counters', {}).items():
+            values = counters.setdefault(name, {})
+            for labels, value in entries:
+                key = tuple(map(tuple, labels))
+                values[key] = values.get(key, 0) + value
+        for name, entries in snapshot.get('histograms', {}).items():
+            values = histograms.setdefault(name, {})
+            for labels, bucket_counts, total, count in entries:
+                key = tuple(map(tuple, labels))
+                state = values.get(key)
+                if state is None:
+                    values[key] = (list(bucket_counts), total, count)
+                else:
+                    values[key] = ([a + b for a, b in zip(state[0], bucket_counts)], state[1] + total, state[2] + count)
+    return {'counters': counters, 'histograms': histograms}
+
+
+def _to_snapshot(merged):
+    return {
+        'counters': {
+            name: [[list(map(list, labels)), value] for labels, value in values.items()]
+            for name, values in merged['counters'].items()
+        },
+        'histograms': {
+            name: [[list(map(list, labels)), state[0], state[1], state[2]] for labels, state in values.items()]
+            for name, values in merged['histograms'].items()
+        }
+    }
+
+
+def archive_worker(directory, pid):
+    """Fold an exited worker's snapshot into the archive (gunicorn master, child_exit hook)"""
+    path = os.path.join(directory, f'metrics_{pid}.json')
+    snapshot = _read_snapshot(path)
+    if snapshot is None:
+        return
+    archive_path = os.path.join(directory, ARCHIVE_FILE)
+    merged = merge_snapshots([_read_snapshot(archive_path) or {}, snapshot])
+    tmp_path = f'{archive_path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(_to_snapshot(merged), f)
+    # Archive first, then drop the worker file: a scrape in between double-counts for an instant
+    # instead of seeing counters go backwards
+    os.replace(tmp_path, archive_path)
+    os.remove(path)
+
+
+def clear_directory(directory):
+    """Start a fresh server with empty metrics (gunicorn master, on_starting hook)"""
+    if not directory or not os.path.isdir(directory):
+        return
+    for filename in os.listdir(directory):
+        if filename.startswith('metrics_'):
+            os.remove(os.path.join(directory, filename))
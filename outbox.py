@@ -0,0 +1,330 @@
+"""
+Durable outbox for submission records bound for Google Sheets.
+
+Every submission is first appended to a local SQLite journal (WAL mode, so
+an append is a cheap sequential write that survives a process restart) and
+delivered to Sheets later by a background replayer, in batches, advancing a
+checkpoint after each successful append. Delivery is at-least-once:
+
+- a submission id (generated by the server) is journalled only once;
+- before a batch is sent its last sequence number is recorded as in flight;
+  if the process dies or the call fails after possibly reaching Sheets, the
+  next attempt first reads the ids already in the sheet and skips them.
+
+Without a deliver_rows callback (Sheets disabled) the journal only records
+submissions for the stats, and each entry counts as delivered as soon as it
+is appended.
+
+Several gunicorn workers share one journal file. Each can append, but only
+the worker holding the lease replays, and another takes over when the
+lease expires.
+
+Delivered entries older than the retention period can be pruned; sequence
+numbers are never reused, so readers that track a position in the journal
+(the submission stats) are not confused by the gap.
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SubmissionOutbox:
+    """Append-only local journal with a checkpointed replayer"""
+
+    def __init__(self, path, deliver_rows, existing_ids=None, batch_size=500, flush_interval=2.0,
+                 backoff_base=1.0, backoff_max=60.0, lease_seconds=30.0, retention_seconds=None):
+        # deliver_rows(rows) must append the whole batch or raise (None: record only);
+        # existing_ids() returns the submission ids already delivered (used after a failure)
+        self.path = path
+        self.deliver_rows = deliver_rows
+        self.existing_ids = existing_ids
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lease_seconds = lease_seconds
+        self.retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+        self._conn = None
+        self._pid = None
+        self._appended_since_flush = 0
+        self.appended = 0
+        self.duplicates = 0
+        self.delivered = 0
+        self.skipped_redelivery = 0
+        self.failures = 0
+        self.batches = 0
+        self.pruned = 0
+        self.last_error = None
+        self.last_flush_ms = None
+        self._connect()
+
+    def _connect(self):
+        # A forked worker must open its own connection
+        if self._pid == os.getpid():
+            return self._conn
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10)
+        conn.execute('PRAGMA journal_mode=WAL')
+        # Commits reach the WAL without an fsync each; SQLite syncs at WAL checkpoints
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS outbox ('
+            ' seq INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' submission_id TEXT NOT NULL UNIQUE,'
+            ' created_at REAL NOT NULL,'
+            ' payload TEXT NOT NULL)'
+        )
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS outbox_state ('
+            ' name TEXT PRIMARY KEY,'
+            ' value)'
+        )
+        for name, value in (('checkpoint', 0), ('inflight_to', None), ('lease_owner', ''), ('lease_expires', 0)):
+            conn.execute('INSERT OR IGNORE INTO outbox_state (name, value) VALUES (?, ?)', (name, value))
+        self._conn = conn
+        self._pid = os.getpid()
+        self._owner = f'{socket.gethostname()}:{self._pid}'
+        return conn
+
+    def _get_state(self, conn, name):
+        return conn.execute('SELECT value FROM outbox_state WHERE name = ?', (name,)).fetchone()[0]
+
+    def _set_state(self, conn, name, value):
+        conn.execute('UPDATE outbox_state SET value = ? WHERE name = ?', (value, name))
+
+    def append(self, submission_id, row):
+        """Journal one row; False if this submission id was already journalled"""
+        return self.append_many([(submission_id, row)]) == 1
+
+    def append_many(self, entries):
+        """Journal (submission_id, row) pairs in one transaction; returns how many were new"""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                inserted = 0
+                for submission_id, row in entries:
+                    inserted += conn.execute(
+                        'INSERT OR IGNORE INTO outbox (submission_id, created_at, payload) VALUES (?, ?, ?)',
+                        (submission_id, now, json.dumps({'row': row}, ensure_ascii=False))
+                    ).rowcount
+                if self.deliver_rows is None:
+                    # Nothing is owed anywhere; keeps the checkpoint meaningful if delivery is enabled later
+                    self._set_state(conn, 'checkpoint', conn.execute('SELECT MAX(seq) FROM outbox').fetchone()[0] or 0)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            self.appended += inserted
+            self.duplicates += len(entries) - inserted
+            self._appended_since_flush += inserted
+            if self._appended_since_flush >= self.batch_size:
+                self._wake.set()
+        if self.deliver_rows is not None and not self._stopping.is_set():
+            self._ensure_started()
+        return inserted
+
+    def start(self):
+        """Start the replayer; pending entries from a previous run are delivered first"""
+        if self.deliver_rows is None:
+            return
+        self._ensure_started()
+        self._wake.set()
+
+    def _ensure_started(self):
+        # Also started lazily so a forked worker gets its own thread
+        if self._thread and self._thread.is_alive() and self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='outbox-replayer', daemon=True)
+            self._thread.start()
+
+    def _acquire_lease(self, conn):
+        """True if this process may replay (it holds or just took the lease)"""
+        now = time.time()
+        with self._lock:
+            conn.execute('BEGIN IMMEDIATE')
+            taken = conn.execute(
+                "UPDATE outbox_state SET value = ? WHERE name = 'lease_owner' AND (value = ? OR ("
+                " SELECT value FROM outbox_state WHERE name = 'lease_expires') < ?)",
+                (self._owner, self._owner, now)
+            ).rowcount
+            if taken:
+                self._set_state(conn, 'lease_expires', now + self.lease_seconds)
+            conn.execute('COMMIT')
+        return bool(taken)
+
+    def _run(self):
+        failures = 0
+        while not self._stopping.is_set():
+            if failures:
+                delay = min(self.backoff_max, self.backoff_base * (2 ** (failures - 1)))
+            else:
+                delay = self.flush_interval
+            self._wake.wait(delay)
+            self._wake.clear()
+            try:
+                self.replay()
+                failures = 0
+            except Exception as e:
+                failures += 1
+                self.failures += 1
+                self.last_error = str(e)[:200]
+                logger.error("Outbox delivery to Google Sheets failed: %s", e, extra={'attempt': failures})
+
+    def replay(self):
+        """Deliver pending entries from the checkpoint on; raises if a batch fails"""
+        conn = self._connect()
+        if not self._acquire_lease(conn):
+            return 0
+        delivered = 0
+        while True:
+            with self._lock:
+                self._appended_since_flush = 0
+                checkpoint = self._get_state(conn, 'checkpoint')
+                inflight_to = self._get_state(conn, 'inflight_to')
+                pending = conn.execute(
+                    'SELECT seq, submission_id, payload FROM outbox WHERE seq > ? ORDER BY seq LIMIT ?',
+                    (checkpoint, self.batch_size)
+                ).fetchall()
+            if not pending:
+                break
+            last_seq = pending[-1][0]
+            entries = [(submission_id, json.loads(payload)['row']) for _, submission_id, payload in pending]
+
+            # A previous attempt may have reached Sheets without being checkpointed
+            if inflight_to is not None and self.existing_ids is not None:
+                already = self.existing_ids()
+                kept = [(submission_id, row) for submission_id, row in entries if submission_id not in already]
+                self.skipped_redelivery += len(entries) - len(kept)
+                entries = kept
+
+            with self._lock:
+                self._set_state(conn, 'inflight_to', max(last_seq, inflight_to or 0))
+            if entries:
+                started = time.perf_counter()
+                self.deliver_rows([row for _, row in entries])
+                self.last_flush_ms = round((time.perf_counter() - started) * 1000, 2)
+            with self._lock:
+                conn.execute('BEGIN IMMEDIATE')
+                self._set_state(conn, 'checkpoint', last_seq)
+                if last_seq >= (inflight_to or 0):
+                    self._set_state(conn, 'inflight_to', None)
+                conn.execute('COMMIT')
+            self.delivered += len(entries)
+            self.batches += 1
+            self.last_error = None
+            delivered += len(entries)
+            if not self._acquire_lease(conn):
+                break
+        return delivered
+
+    def read_since(self, seq, limit):
+        """Up to `limit` journal entries after `seq`, oldest first, as (seq, created_at, row)"""
+        with self._lock:
+            conn = self._connect()
+            entries = conn.execute(
+                'SELECT seq, created_at, payload FROM outbox WHERE seq > ? ORDER BY seq LIMIT ?',
+                (seq, limit)
+            ).fetchall()
+        return [(entry_seq, created_at, json.loads(payload)['row']) for entry_seq, created_at, payload in entries]
+
+    def last_seq(self):
+        """Sequence number of the newest journal entry ever appended (0 when none), pruned or not"""
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'outbox'").fetchone()
+            return row[0] if row else 0
+
+    def prune(self, upto_seq):
+        """Delete delivered entries past the retention period, up to `upto_seq`; returns how many"""
+        if not self.retention_seconds:
+            return 0
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # Entries after the checkpoint are still owed to Sheets, however old
+                upto_seq = min(upto_seq, self._get_state(conn, 'checkpoint'))
+                pruned = conn.execute(
+                    'DELETE FROM outbox WHERE seq <= ? AND created_at < ?', (upto_seq, cutoff)
+                ).rowcount
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            self.pruned += pruned
+        if pruned:
+            logger.info("Pruned delivered outbox entries", extra={'entries': pruned})
+        return pruned
+
+    def stop(self, timeout=10.0):
+        """Stop the replayer after one last delivery attempt"""
+        thread = self._thread
+        if not thread or not thread.is_alive() or self._thread_pid != os.getpid():
+            return
+        self._stopping.set()
+        self._wake.set()
+        thread.join(timeout)
+        if thread.is_alive():
+            # Still inside a delivery: a second replay here could send the same batch twice,
+            # and the lease must stay ours until that delivery has finished
+            logger.warning("Outbox replayer still busy after %ss, leaving the rest for the next start", timeout)
+            return
+        try:
+            self.replay()
+        except Exception as e:
+            logger.warning("Outbox entries left for the next start: %s", e)
+        # Let another worker take over right away
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "UPDATE outbox_state SET value = 0 WHERE name = 'lease_expires' AND ("
+                " SELECT value FROM outbox_state WHERE name = 'lease_owner') = ?",
+                (self._owner,)
+            )
+
+    def stats(self):
+        """Journal size, pending entries and delivery counters"""
+        with self._lock:
+            conn = self._connect()
+            checkpoint = self._get_state(conn, 'checkpoint')
+            pending = conn.execute('SELECT COUNT(*) FROM outbox WHERE seq > ?', (checkpoint,)).fetchone()[0]
+            total = conn.execute('SELECT COUNT(*) FROM outbox').fetchone()[0]
+            oldest = conn.execute('SELECT MIN(created_at) FROM outbox WHERE seq > ?', (checkpoint,)).fetchone()[0]
+            lease_owner = self._get_state(conn, 'lease_owner')
+        return {
+            'journal_entries': total,
+            'pending': pending,
+            'oldest_pending_age_s': round(time.time() - oldest, 1) if oldest else None,
+            'checkpoint': checkpoint,
+            'delivering': self.deliver_rows is not None,
+            'replaying': lease_owner == self._owner,
+            'appended': self.appended,
+            'duplicates_ignored': self.duplicates,
+            'delivered': self.delivered,
+            'skipped_redelivery': self.skipped_redelivery,
+            'batches': self.batches,
+            'pruned': self.pruned,
+            'retention_seconds': self.retention_seconds,
+            'failures': self.failures,
+            'last_error': self.last_error,
+            'last_flush_ms': self.last_flush_ms,
+            'batch_size': self.batch_size,
+            'flush_interval': self.flush_interval
+        }
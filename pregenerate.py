@@ -0,0 +1,199 @@
+"""
+Offline pre-generation of the full sign-pair x gender analysis corpus.
+
+Calls the AI providers once per (sign1, sign2, gender1, gender2) with bounded
+parallelism, validates each result and writes a versioned content bundle
+that app.py loads at startup, so steady-state traffic needs no upstream
+calls. Progress is appended to a work file, so an interrupted run resumes
+where it stopped and skips entries that are already done.
+
+Usage:
+    python pregenerate.py                       # full corpus, 4 parallel calls
+    python pregenerate.py --workers 8 --limit 20
+    python pregenerate.py --genders Nam,Nữ
+"""
+import argparse
+import itertools
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+# Only the analysis helpers are needed - skip per-worker services on import
+os.environ.setdefault('ZODIAC_DEFER_WORKER_INIT', 'true')
+
+import app as zodiac_app  # noqa: E402
+from ai_cache import make_cache_key  # noqa: E402
+
+DEFAULT_GENDERS = ['Nam', 'Nữ', 'Khác']
+
+# Earlier bundles were prompted with these stand-in names and scrubbed afterwards,
+# which left fragments behind; prompts now carry the placeholder tokens, and any
+# part of either name in an output fails the entry
+STAND_IN_NAMES = ['Lâm Khải Nguyên', 'Trịnh Diệp Chi']
+STAND_IN_PATTERN = re.compile(
+    r'\b(?:' + '|'.join(re.escape(part) for name in STAND_IN_NAMES for part in name.split()) + r')\b'
+)
+
+
+def validate_analysis(result):
+    """Return a list of problems with an AI result (empty when valid)"""
+    if not isinstance(result, dict):
+        return ['result is not a JSON object']
+    problems = []
+    # The page styles the result by its tier; an entry without one renders as the lowest tier
+    for key in ('compatibility_tier', 'tier_description'):
+        if not isinstance(result.get(key), str) or not result[key].strip():
+            problems.append(f'{key} missing or empty')
+    for key in zodiac_app.ANALYSIS_SECTION_KEYS:
+        value = result.get(key)
+        if key == 'product_recommendations':
+            if not isinstance(value, list) or not value:
+                problems.append(f'{key} missing or empty')
+        elif not isinstance(value, str) or not value.strip():
+            problems.append(f'{key} missing or empty')
+    leaked = sorted(set(STAND_IN_PATTERN.findall(json.dumps(result, ensure_ascii=False))))
+    if leaked:
+        problems.append(f'stand-in name fragments in output: {", ".join(leaked)}')
+    return problems
+
+
+def generate_entry(sign1, sign2, gender1, gender2):
+    """Call the AI providers for one combination; returns (cache_key, result) or raises"""
+    compatibility = zodiac_app.get_compatibility(sign1, sign2)
+    person1, person2 = zodiac_app.anonymous_people(
+        {'zodiacSign': sign1, 'gender': gender1}, {'zodiacSign': sign2, 'gender': gender2}
+    )
+    prompt = zodiac_app.build_analysis_prompt(
+        person1, person2, compatibility['tier'], compatibility['tier_description']
+    )
+    # Throughput matters here, not tail latency: no hedged second calls; --workers bounds the load
+    reply = zodiac_app.routed_completion(prompt, zodiac_app.ANALYSIS_MAX_TOKENS, hedge=False, admitted=False)
+    if reply.status != 200:
+        raise RuntimeError(f'{reply.provider} returned {reply.status}')
+    # Same shape as request_ai_analysis() caches: tier fields plus the sections
+    result = {
+        'compatibility_tier': compatibility['tier'],
+        'tier_description': compatibility['tier_description'],
+        **zodiac_app.parse_analysis_sections(reply.text)
+    }
+    problems = validate_analysis(result)
+    if problems:
+        raise ValueError('; '.join(problems))
+    key = make_cache_key(sign1, sign2, gender1, gender2, compatibility['tier'], zodiac_app.PROMPT_VERSION)
+    return key, result
+
+
+def load_progress(work_path):
+    """Read entries finished by earlier runs from the append-only work file"""
+    entries = {}
+    if not os.path.exists(work_path):
+        return entries
+    with open(work_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Torn last line from an interrupted run
+                continue
+            entries[record['key']] = record['result']
+    return entries
+
+
+def write_bundle(path, entries, genders):
+    """Atomically write the versioned content bundle"""
+    bundle = {
+        'prompt_version': zodiac_app.PROMPT_VERSION,
+        'model': zodiac_app.ai_router.configured()[0].model,
+        'generated_at': datetime.now().isoformat(),
+        'genders': genders,
+        'entry_count': len(entries),
+        'entries': entries
+    }
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(bundle, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pre-generate the AI analysis content bundle')
+    parser.add_argument('--output', default=zodiac_app.settings.CONTENT_BUNDLE_PATH,
+                        help='bundle file to write (default: CONTENT_BUNDLE_PATH)')
+    parser.add_argument('--workers', type=int, default=4, help='parallel upstream calls')
+    parser.add_argument('--genders', default=','.join(DEFAULT_GENDERS),
+                        help='comma-separated gender values the form allows')
+    parser.add_argument('--limit', type=int, default=0, help='generate at most N new entries')
+    args = parser.parse_args(argv)
+
+    if not zodiac_app.ai_router.configured():
+        print('❌ No AI provider API key configured (OPENAI_API_KEY / GEMINI_API_KEY)')
+        return 1
+
+    genders = [g.strip() for g in args.genders.split(',') if g.strip()]
+    work_path = f'{args.output}.{zodiac_app.PROMPT_VERSION}.progress.jsonl'
+    entries = load_progress(work_path)
+    # Entries from an older run that no longer pass validation are generated again
+    stale = [key for key, result in entries.items() if validate_analysis(result)]
+    for key in stale:
+        del entries[key]
+    if stale:
+        print(f'♻️ {len(stale)} saved entries fail validation and will be regenerated')
+
+    todo = []
+    for sign1, sign2, gender1, gender2 in itertools.product(
+            zodiac_app.ZODIAC_SIGNS, zodiac_app.ZODIAC_SIGNS, genders, genders):
+        tier = zodiac_app.get_compatibility(sign1, sign2)['tier']
+        key = make_cache_key(sign1, sign2, gender1, gender2, tier, zodiac_app.PROMPT_VERSION)
+        if key not in entries:
+            todo.append((sign1, sign2, gender1, gender2))
+    total = len(todo) + len(entries)
+    if args.limit:
+        todo = todo[:args.limit]
+    print(f'📦 {len(entries)}/{total} entries already generated, {len(todo)} to go ({args.workers} workers)')
+
+    write_lock = threading.Lock()
+    failures = 0
+    started = time.time()
+    with open(work_path, 'a', encoding='utf-8') as work_file, \
+            ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(generate_entry, *combo): combo for combo in todo}
+        try:
+            for done, future in enumerate(as_completed(futures), 1):
+                combo = futures[future]
+                try:
+                    key, result = future.result()
+                except Exception as e:
+                    failures += 1
+                    print(f'❌ {"/".join(combo)}: {e}')
+                    continue
+                with write_lock:
+                    work_file.write(json.dumps({'key': key, 'result': result}, ensure_ascii=False) + '\n')
+                    work_file.flush()
+                    entries[key] = result
+                print(f'✅ [{done}/{len(todo)}] {"/".join(combo)}')
+        except KeyboardInterrupt:
+            print('⏹️ Interrupted - progress saved, rerun to resume')
+            executor.shutdown(wait=False, cancel_futures=True)
+            return 130
+
+    # Entries resumed from the work file are checked again before anything ships
+    rejected = [key for key, result in entries.items() if validate_analysis(result)]
+    if rejected:
+        print(f'❌ {len(rejected)} entries failed validation, bundle not written: {", ".join(rejected[:5])}')
+        return 2
+    write_bundle(args.output, entries, genders)
+    print(f'📦 Wrote {len(entries)}/{total} entries to {args.output} '
+          f'in {time.time() - started:.1f}s ({failures} failed, rerun to retry)')
+    return 0 if failures == 0 else 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -54,7 +54,7 @@ function displayResults(data) {
     
     // Set level class based on tier
     if (tier === "Hợp duyên trời định") levelClass = 'level-perfect';
-    else if (tier === "Có duyên cần thời gian vun đắp") levelClass = 'level-high';
+    else if (tier === "Có duyên, cần thời gian vun đắp") levelClass = 'level-high';
     else if (tier === "Có duyên nhưng cần nỗ lực nhiều") levelClass = 'level-medium';
     else levelClass = 'level-low';
     
@@ -252,6 +252,141 @@ function displayResults(data) {
     `;
 }
 
+// Call the non-streaming analysis endpoint and return the parsed result
+async function fetchAnalysis(formData) {
+    const response = await fetch('/api/analyze', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(formData)
+    });
+
+    if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+    }
+
+    const result = await response.json();
+    
+    if (!result.success) {
+        throw new Error(result.error || 'Analysis failed');
+    }
+    return result;
+}
+
+// Submit the analysis as a background job and poll until it finishes
+async function fetchAnalysisJob(formData, { interval = 1500, timeout = 120000 } = {}) {
+    const response = await fetch('/api/analyze?async=1', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(formData)
+    });
+
+    if (response.status !== 202) {
+        // Job queue full or job mode unavailable: use the blocking endpoint
+        return fetchAnalysis(formData);
+    }
+
+    const job = await response.json();
+    const deadline = Date.now() + timeout;
+
+    while (Date.now() < deadline) {
+        await new Promise(resolve => setTimeout(resolve, interval));
+
+        const statusResponse = await fetch(job.status_url);
+        if (!statusResponse.ok) {
+            throw new Error(`HTTP error! status: ${statusResponse.status}`);
+        }
+
+        const status = await statusResponse.json();
+        if (status.status === 'done') {
+            return status.result;
+        }
+        if (status.status === 'failed') {
+            throw new Error(status.error || 'Analysis failed');
+        }
+    }
+    throw new Error('Analysis timed out');
+}
+
+// Stream analysis sections from /api/analyze/stream (Server-Sent Events over fetch).
+// onUpdate is called with the partial result after every event.
+// Falls back to a polled background job when streaming is not available.
+async function streamAnalysis(formData, onUpdate) {
+    let response;
+    try {
+        response = await fetch('/api/analyze/stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream'
+            },
+            body: JSON.stringify(formData)
+        });
+    } catch (error) {
+        response = null;
+    }
+
+    if (!response || !response.ok || !response.body || !window.TextDecoder) {
+        const result = await fetchAnalysisJob(formData);
+        onUpdate(result);
+        return result;
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder('utf-8');
+    const result = { success: true, compatibility_analysis: {} };
+    let buffer = '';
+    let finished = false;
+
+    const handleEvent = (event, payload) => {
+        if (event === 'meta') {
+            result.person1 = payload.person1;
+            result.person2 = payload.person2;
+            result.horoscope1 = payload.horoscope1;
+            result.horoscope2 = payload.horoscope2;
+            result.compatibility_analysis.compatibility_tier = payload.compatibility_tier;
+            result.compatibility_analysis.tier_description = payload.tier_description;
+        } else if (event === 'section') {
+            result.compatibility_analysis[payload.key] = payload.value;
+        } else if (event === 'done') {
+            result.compatibility_analysis = payload.compatibility_analysis;
+            result.timestamp = payload.timestamp;
+            finished = true;
+        } else if (event === 'error') {
+            throw new Error(payload.message || payload.error || 'Analysis failed');
+        }
+        onUpdate(result);
+    };
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const message = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let data = '';
+            message.split('\n').forEach(line => {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            });
+            if (data) handleEvent(event, JSON.parse(data));
+        }
+    }
+
+    if (!finished) {
+        throw new Error('Analysis stream ended unexpectedly');
+    }
+    return result;
+}
+
 // Event listeners
 document.addEventListener('DOMContentLoaded', function() {
     const form = document.getElementById('zodiacForm');
@@ -285,32 +420,15 @@ document.addEventListener('DOMContentLoaded', function() {
                 }
             };
 
-            // Call backend API for analysis
-            const response = await fetch('/api/analyze', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify(formData)
+            // Stream the analysis so the tier and each section render as soon as they arrive
+            await streamAnalysis(formData, (partial) => {
+                displayResults(partial);
+                if (resultsSection.style.display !== 'block') {
+                    resultsSection.style.display = 'block';
+                    resultsSection.scrollIntoView({ behavior: 'smooth' });
+                }
             });
 
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
-            }
-
-            const result = await response.json();
-            
-            if (!result.success) {
-                throw new Error(result.error || 'Analysis failed');
-            }
-
-            // Display results using backend data
-            displayResults(result);
-
-            // Show results section
-            resultsSection.style.display = 'block';
-            resultsSection.scrollIntoView({ behavior: 'smooth' });
-
         } catch (error) {
             console.error('Error during analysis:', error);
             alert('Có lỗi xảy ra trong quá trình phân tích. Vui lòng thử lại!');
@@ -0,0 +1,88 @@
+"""
+Single-flight coalescing of identical in-flight calls.
+
+The first caller for a key runs the function; concurrent callers with the
+same key wait for that result instead of starting their own. Errors and
+cancellation of the leading call are re-raised in every waiter.
+"""
+import threading
+
+
+class SingleFlightTimeout(Exception):
+    """Raised in a waiter whose deadline passed before the shared call finished"""
+
+
+class SingleFlightCancelled(Exception):
+    """Raised in waiters when the leading call was interrupted"""
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Deduplicate concurrent calls that share a key"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    def do(self, key, fn, timeout=None):
+        """Return (result, shared); shared is True when another caller's result was reused"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+                leader = True
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            if not call.done.wait(timeout):
+                with self._lock:
+                    self.timeouts += 1
+                raise SingleFlightTimeout(f'Timed out waiting for in-flight call {key}')
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            with self._lock:
+                self.errors += 1
+            raise
+        except BaseException:
+            # Leader interrupted (worker shutdown, client abort): waiters must not hang
+            call.error = SingleFlightCancelled(f'In-flight call {key} was cancelled')
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+    def stats(self):
+        """Return leader/coalesced counts and calls currently in flight"""
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'waiting': sum(call.waiters for call in self._calls.values()),
+                'leaders': self.leaders,
+                'coalesced': self.coalesced,
+                'timeouts': self.timeouts,
+                'errors': self.errors
+            }
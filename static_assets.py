@@ -0,0 +1,169 @@
+"""
+In-memory static assets with precompressed variants.
+
+index.html and the top-level CSS/JS files are read once, compressed once
+(gzip, plus brotli when the `brotli` package is installed) and served from
+memory with strong ETags and Last-Modified, answering conditional requests
+with 304. Each CSS/JS file is also reachable under a content-fingerprinted
+name (`style.<hash>.css`) that index.html is rewritten to reference, so
+browsers can cache those for a year and still pick up a new deploy. In
+development the files are re-read when they change on disk.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+
+from compression import available_encodings, choose_encoding, compress
+
+CONTENT_TYPES = {
+    '.html': 'text/html; charset=utf-8',
+    '.css': 'text/css; charset=utf-8',
+    '.js': 'application/javascript; charset=utf-8',
+}
+# Smaller than this and compression costs more than it saves
+MIN_COMPRESS_SIZE = 256
+# Revalidate plain names every time; a 304 costs one round trip and no body
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+
+class StaticAsset:
+    def __init__(self, name, body, mtime):
+        self.name = name
+        self.content_type = CONTENT_TYPES[os.path.splitext(name)[1]]
+        self.mtime = mtime
+        self.last_modified = formatdate(int(mtime), usegmt=True)
+        self.digest = hashlib.sha256(body).hexdigest()[:12]
+        root, ext = os.path.splitext(name)
+        self.fingerprinted_name = f'{root}.{self.digest}{ext}'
+        # encoding -> (body, etag); identity is always present
+        self.variants = {'identity': (body, f'"{self.digest}"')}
+        if len(body) >= MIN_COMPRESS_SIZE:
+            # Compressed once at load, so use the slowest, smallest settings
+            for encoding in available_encodings():
+                compressed = compress(body, encoding, best=True)
+                if len(compressed) < len(body):
+                    self.variants[encoding] = (compressed, f'"{self.digest}-{encoding}"')
+
+
+def _etag_matches(if_none_match, etag):
+    if if_none_match.strip() == '*':
+        return True
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def _not_modified_since(if_modified_since, mtime):
+    try:
+        return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return False
+
+
+class StaticAssetCache:
+    """Top-level index.html, *.css and *.js of `directory`, held in memory"""
+
+    def __init__(self, directory, reload=False, reload_interval=1.0, max_age=31536000):
+        self.directory = directory
+        self.reload = reload
+        self.reload_interval = reload_interval
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._assets = {}
+        self._checked_at = 0.0
+        self._signature = None
+        self.load()
+
+    def _scan(self):
+        """(name, mtime, size) of every servable file, used to detect changes"""
+        entries = []
+        for name in sorted(os.listdir(self.directory)):
+            if os.path.splitext(name)[1] not in CONTENT_TYPES:
+                continue
+            if name.endswith('.html') and name != 'index.html':
+                continue
+            stat = os.stat(os.path.join(self.directory, name))
+            entries.append((name, stat.st_mtime, stat.st_size))
+        return tuple(entries)
+
+    def load(self):
+        signature = self._scan()
+        assets = {}
+        pages = []
+        for name, mtime, _ in signature:
+            with open(os.path.join(self.directory, name), 'rb') as f:
+                body = f.read()
+            if name.endswith('.html'):
+                pages.append((name, body, mtime))
+            else:
+                assets[name] = StaticAsset(name, body, mtime)
+
+        # Point the page at fingerprinted names so those can be cached for good
+        for name, body, mtime in pages:
+            text = body.decode('utf-8')
+            for asset in assets.values():
+                text = re.sub(
+                    r'((?:href|src)=["\'])' + re.escape(asset.name) + r'(["\'])',
+                    lambda m, asset=asset: m.group(1) + asset.fingerprinted_name + m.group(2),
+                    text
+                )
+            assets[name] = StaticAsset(name, text.encode('utf-8'), max([mtime] + [a.mtime for a in assets.values()]))
+
+        by_name = dict(assets)
+        for asset in assets.values():
+            if not asset.name.endswith('.html'):
+                by_name[asset.fingerprinted_name] = asset
+        with self._lock:
+            self._assets = by_name
+            self._signature = signature
+            self._checked_at = time.monotonic()
+
+    def _maybe_reload(self):
+        if not self.reload or time.monotonic() - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = time.monotonic()
+        if self._scan() != self._signature:
+            self.load()
+
+    def get(self, name):
+        self._maybe_reload()
+        return self._assets.get(name)
+
+    def serve(self, name, headers, method='GET'):
+        """(body, status, headers) for a request; None when the asset does not exist"""
+        asset = self.get(name)
+        if asset is None:
+            return None
+
+        encoding = choose_encoding(headers.get('Accept-Encoding'), asset.variants)
+        body, etag = asset.variants[encoding]
+        fingerprinted = name == asset.fingerprinted_name
+        response_headers = {
+            'Content-Type': asset.content_type,
+            'ETag': etag,
+            'Last-Modified': asset.last_modified,
+            'Cache-Control': (f'public, max-age={self.max_age}, immutable' if fingerprinted
+                              else REVALIDATE_CACHE_CONTROL),
+            'Vary': 'Accept-Encoding',
+        }
+        if encoding != 'identity':
+            response_headers['Content-Encoding'] = encoding
+
+        # If-None-Match wins over If-Modified-Since when both are sent
+        if_none_match = headers.get('If-None-Match')
+        if if_none_match is not None:
+            not_modified = _etag_matches(if_none_match, etag)
+        else:
+            not_modified = _not_modified_since(headers.get('If-Modified-Since'), asset.mtime)
+        if not_modified and method in ('GET', 'HEAD'):
+            response_headers.pop('Content-Type')
+            return b'', 304, response_headers
+
+        return body, 200, response_headers
@@ -0,0 +1,182 @@
+"""
+Structured, non-blocking logging.
+
+Request threads only put records on an in-memory queue; a background
+listener formats them (JSON lines or plain text) and writes to stderr, so
+slow stdout never sits on the request path. Every record carries the
+current request's correlation id, known secrets and anything that looks
+like an API key are masked, and DEBUG records can be sampled.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+
+# Correlation id of the request being handled on this thread/context
+request_id_var = contextvars.ContextVar('request_id', default=None)
+
+_REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+# Key-shaped strings are masked even when they were never registered
+SECRET_PATTERNS = [
+    re.compile(r'sk-[A-Za-z0-9_-]{8,}'),
+    re.compile(r'AIza[0-9A-Za-z_-]{20,}'),
+    re.compile(r'(?i)(bearer\s+)[A-Za-z0-9._~+/=-]+'),
+    re.compile(r'-----BEGIN [A-Z ]*PRIVATE KEY-----.*?-----END [A-Z ]*PRIVATE KEY-----', re.S)
+]
+REDACTED = '[REDACTED]'
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_RECORD_ATTRS = set(logging.LogRecord('', 0, '', 0, '', None, None).__dict__) | {'message', 'request_id'}
+
+_state = {'pid': None, 'listener': None, 'handler': None}
+_secrets = set()
+
+
+def new_request_id(incoming=None):
+    """Reuse a well-formed incoming X-Request-ID, otherwise generate one"""
+    if incoming and _REQUEST_ID_PATTERN.match(incoming):
+        return incoming
+    return uuid.uuid4().hex[:16]
+
+
+def register_secret(value):
+    """Mask this exact value wherever it appears in a log line"""
+    if value and len(value) >= 8:
+        _secrets.add(value)
+
+
+def redact(text):
+    for secret in _secrets:
+        if secret in text:
+            text = text.replace(secret, REDACTED)
+    for pattern in SECRET_PATTERNS:
+        text = pattern.sub(lambda m: (m.group(1) if pattern.groups else '') + REDACTED, text)
+    return text
+
+
+class ContextFilter(logging.Filter):
+    """Tag records with the request id and drop sampled-out DEBUG records"""
+
+    def __init__(self, debug_sample_rate=1.0):
+        super().__init__()
+        self.debug_sample_rate = debug_sample_rate
+
+    def filter(self, record):
+        if record.levelno <= logging.DEBUG and self.debug_sample_rate < 1.0:
+            if random.random() >= self.debug_sample_rate:
+                return False
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; `extra` fields become top-level keys"""
+
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)) + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'pid': record.process
+        }
+        if getattr(record, 'request_id', None):
+            entry['request_id'] = record.request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return redact(json.dumps(entry, ensure_ascii=False, default=str))
+
+
+class TextFormatter(logging.Formatter):
+    """Readable single-line format for local development"""
+
+    def format(self, record):
+        fields = ' '.join(
+            f'{key}={value}' for key, value in record.__dict__.items()
+            if key not in _RECORD_ATTRS and not key.startswith('_')
+        )
+        request_id = getattr(record, 'request_id', None)
+        line = (
+            f"{time.strftime('%H:%M:%S', time.localtime(record.created))} {record.levelname:<7} "
+            f"{record.name}{f' [{request_id}]' if request_id else ''} {record.getMessage()}"
+            f"{f' {fields}' if fields else ''}"
+        )
+        if record.exc_text:
+            line += '\n' + record.exc_text
+        return redact(line)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue without ever blocking; a full queue drops the record instead"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Merge args and render the traceback now (they may change or go away),
+        # but leave JSON encoding and redaction to the listener thread
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(level='INFO', fmt='json', debug_sample_rate=1.0, queue_size=10000):
+    """Route the root logger through a queue; safe to call again after a fork"""
+    if _state['pid'] == os.getpid():
+        return
+    # A forked child inherits the handler but not the listener thread
+    root = logging.getLogger()
+    if _state['handler'] is not None:
+        root.removeHandler(_state['handler'])
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.addFilter(ContextFilter(debug_sample_rate))
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+    listener = logging.handlers.QueueListener(log_queue, output)
+    listener.start()
+
+    root.addHandler(handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    _state.update(pid=os.getpid(), listener=listener, handler=handler)
+
+
+def stop_logging():
+    """Flush queued records (called at exit)"""
+    listener = _state['listener']
+    if listener is not None and _state['pid'] == os.getpid():
+        _state['listener'] = None
+        listener.stop()
+
+
+def dropped_records():
+    handler = _state['handler']
+    return handler.dropped if handler is not None else 0
+
+
+atexit.register(stop_logging)
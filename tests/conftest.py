@@ -0,0 +1,7 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing app must not start per-worker services (outbox, stats, warm-up threads)
+os.environ['ZODIAC_DEFER_WORKER_INIT'] = 'true'
@@ -0,0 +1,127 @@
+import threading
+import time
+import types
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+from ai_providers import ProviderRouter
+
+
+class StubProvider:
+    def __init__(self, name, delay=0.0, fails=False):
+        self.name = name
+        self.model = f'{name}-model'
+        self.configured = True
+        self.delay = delay
+        self.fails = fails
+        self.client = types.SimpleNamespace(breaker=types.SimpleNamespace(state='closed'))
+
+    def available(self):
+        return True
+
+
+def start(provider):
+    time.sleep(provider.delay)
+    if provider.fails:
+        raise ConnectionError(f'{provider.name} is down')
+    return types.SimpleNamespace(ok=True, provider=provider.name, usage={'total_tokens': 10})
+
+
+def make_router(*providers, **options):
+    options.setdefault('hedge_default_delay', 0.05)
+    options.setdefault('hedge_budget', 1.0)
+    return ProviderRouter(providers, routing='priority', **options)
+
+
+def admit_hook(admission):
+    def admit(provider):
+        try:
+            return admission.acquire(100, timeout=0, provider=provider.name)
+        except AdmissionRejected:
+            return None
+    return admit
+
+
+def routed_call(router, admission):
+    """What app.py does: hold a ticket for the first attempt, let the router admit the rest"""
+    candidates = router.ranked('complete')
+    ticket = admission.acquire(100, provider=candidates[0].name)
+    try:
+        return router.call(start, 'complete', lambda reply: reply.ok, admit=admit_hook(admission), candidates=candidates)
+    finally:
+        ticket.release(10)
+
+
+def wait_for_idle(admission, deadline=2.0):
+    stop = time.monotonic() + deadline
+    while admission.in_flight and time.monotonic() < stop:
+        time.sleep(0.01)
+    return admission.in_flight
+
+
+def test_failover_win_releases_every_ticket():
+    admission = AdmissionController(max_concurrent=4)
+    router = make_router(StubProvider('primary', fails=True), StubProvider('backup'), hedge=False)
+    for _ in range(6):
+        assert routed_call(router, admission).provider == 'backup'
+        assert admission.in_flight == 0
+    assert router.failovers == 6
+    assert router.failovers_not_admitted == 0
+
+
+def test_hedge_win_releases_the_loser_ticket_when_it_finishes():
+    admission = AdmissionController(max_concurrent=4)
+    router = make_router(StubProvider('slow', delay=0.3), StubProvider('fast'))
+    assert routed_call(router, admission).provider == 'fast'
+    assert router.hedges_fired == 1
+    # The slow primary is still running on its (now extra) slot
+    assert wait_for_idle(admission) == 0
+    assert admission.admitted == 2
+
+
+def test_all_fail_releases_every_ticket():
+    admission = AdmissionController(max_concurrent=4)
+    router = make_router(StubProvider('a', fails=True), StubProvider('b', fails=True), hedge=False)
+    with pytest.raises(ConnectionError):
+        routed_call(router, admission)
+    assert admission.in_flight == 0
+    assert admission.admitted == 2
+
+
+def test_hedge_skipped_when_admission_is_full():
+    admission = AdmissionController(max_concurrent=1)
+    router = make_router(StubProvider('slow', delay=0.2), StubProvider('fast'))
+    assert routed_call(router, admission).provider == 'slow'
+    assert router.hedges_not_admitted == 1
+    assert router.hedges_fired == 0
+    assert admission.in_flight == 0
+
+
+def test_concurrent_failovers_do_not_exhaust_admission():
+    admission = AdmissionController(max_concurrent=4)
+    router = make_router(StubProvider('primary', fails=True), StubProvider('backup', delay=0.01), hedge=False)
+    results = []
+
+    def worker():
+        for _ in range(5):
+            results.append(routed_call(router, admission).provider)
+
+    threads = [threading.Thread(target=worker) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ['backup'] * 10
+    assert admission.in_flight == 0
+
+
+def test_failover_is_paced_by_its_own_provider_quota():
+    # The primary's request budget is spent; the backup has its own
+    admission = AdmissionController(max_concurrent=4, provider_limits={'primary': (1, 0), 'backup': (5, 0)})
+    router = make_router(StubProvider('primary', fails=True), StubProvider('backup'), hedge=False)
+    assert routed_call(router, admission).provider == 'backup'
+    assert router.failovers == 1
+    with pytest.raises(AdmissionRejected):
+        admission.acquire(timeout=0, provider='primary')
+    assert admission.stats()['providers']['backup']['requests_available'] == pytest.approx(4, abs=0.1)
@@ -0,0 +1,74 @@
+import os
+import re
+
+import pytest
+
+import app
+from ai_cache import PERSON1_PLACEHOLDER, PERSON2_PLACEHOLDER
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def display_results_source():
+    with open(os.path.join(REPO_ROOT, 'script.js'), 'r', encoding='utf-8') as f:
+        source = f.read()
+    start = source.index('function displayResults(')
+    end = source.find('\nfunction ', start + 1)
+    return source[start:end if end != -1 else None]
+
+
+DISPLAY_RESULTS = display_results_source()
+ANALYSIS_KEYS_READ = set(re.findall(r'compatibility\.(\w+)', DISPLAY_RESULTS))
+PRODUCT_KEYS_READ = set(re.findall(r'product\.(\w+)', DISPLAY_RESULTS))
+TIERS_STYLED = set(re.findall(r'tier === "([^"]+)"', DISPLAY_RESULTS))
+
+
+def templates_by_tier():
+    tiers = {}
+    for (sign1, sign2), template in app.FALLBACK_TEMPLATES.items():
+        tiers.setdefault(template['compatibility_tier'], []).append((sign1, sign2, template))
+    return tiers
+
+
+def test_every_tier_has_fallback_templates():
+    assert set(templates_by_tier()) == set(app.TIER_DESCRIPTIONS)
+
+
+@pytest.mark.parametrize('tier', sorted(app.TIER_DESCRIPTIONS))
+def test_every_tier_has_advice(tier):
+    for sign1, sign2, template in templates_by_tier()[tier]:
+        assert template['advice'].strip(), f'{sign1}/{sign2} has no advice'
+
+
+def test_fallback_covers_every_section_the_page_renders():
+    # description/analysis are only read as alternatives when no section is present
+    rendered = ANALYSIS_KEYS_READ - {'description', 'analysis'}
+    for (sign1, sign2), template in app.FALLBACK_TEMPLATES.items():
+        missing = [key for key in rendered if not template.get(key)]
+        assert not missing, f'{sign1}/{sign2} lacks {missing}'
+
+
+def test_fallback_has_no_key_the_page_ignores():
+    for template in app.FALLBACK_TEMPLATES.values():
+        assert set(template) <= ANALYSIS_KEYS_READ
+        for product in template['product_recommendations']:
+            assert set(product) <= PRODUCT_KEYS_READ
+            assert product['name'] and product['description']
+
+
+def test_page_styles_every_tier():
+    # The lowest tier is the page's final else branch; every other one must match exactly
+    unstyled = set(app.TIER_DESCRIPTIONS) - TIERS_STYLED
+    assert unstyled == {app.get_compatibility_tier(0)}
+
+
+def test_generated_fallback_is_personalized():
+    person1 = {'name': 'Anh Thư', 'zodiacSign': 'Leo', 'gender': 'Nữ'}
+    person2 = {'name': 'Minh', 'zodiacSign': 'aries', 'gender': 'Nam'}
+    result = app.generate_fallback_analysis(person1, person2)
+    assert 'Anh Thư' in result['personality_analysis']
+    assert 'Minh' in result['personality_analysis']
+    assert PERSON1_PLACEHOLDER not in str(result) and PERSON2_PLACEHOLDER not in str(result)
+    # The result is the caller's to mutate; the shared template must not change
+    result['product_recommendations'][0]['name'] = 'changed'
+    assert app.FALLBACK_TEMPLATES[('leo', 'aries')]['product_recommendations'][0]['name'] != 'changed'
@@ -0,0 +1,113 @@
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight, SingleFlightTimeout
+
+
+def start_waiters(flight, key, count, timeout=None):
+    """Threads calling do(key) while the leader is blocked; returns (threads, outcomes)"""
+    outcomes = []
+    lock = threading.Lock()
+
+    def waiter():
+        try:
+            outcome = flight.do(key, lambda: pytest.fail('a waiter must not run the function'), timeout=timeout)
+        except Exception as e:
+            outcome = e
+        with lock:
+            outcomes.append(outcome)
+
+    threads = [threading.Thread(target=waiter) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, outcomes
+
+
+def wait_for_waiters(flight, count, deadline=2.0):
+    stop = time.monotonic() + deadline
+    while flight.stats()['waiting'] < count and time.monotonic() < stop:
+        time.sleep(0.01)
+    assert flight.stats()['waiting'] == count
+
+
+def lead(flight, key, fn, waiters, timeout=None):
+    """Run the leading call for `key`, releasing it once `waiters` callers joined it"""
+    release = threading.Event()
+    leader = {}
+
+    def blocked():
+        release.wait(2.0)
+        return fn()
+
+    def run():
+        try:
+            leader['outcome'] = flight.do(key, blocked)
+        except Exception as e:
+            leader['outcome'] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    while not flight.stats()['in_flight']:
+        time.sleep(0.005)
+    threads, outcomes = start_waiters(flight, key, waiters, timeout)
+    wait_for_waiters(flight, waiters)
+    release.set()
+    for t in [thread, *threads]:
+        t.join()
+    return leader['outcome'], outcomes
+
+
+def test_waiters_share_the_leader_result():
+    flight = SingleFlight()
+    calls = []
+    result = {'tier': 'shared'}
+    leader, waiters = lead(flight, 'k', lambda: calls.append(1) or result, waiters=3)
+    assert leader == (result, False)
+    assert waiters == [(result, True)] * 3
+    assert len(calls) == 1
+    stats = flight.stats()
+    assert (stats['leaders'], stats['coalesced'], stats['in_flight']) == (1, 3, 0)
+
+
+def test_leader_error_is_raised_in_every_waiter():
+    flight = SingleFlight()
+    error = ConnectionError('upstream down')
+
+    def fail():
+        raise error
+
+    leader, waiters = lead(flight, 'k', fail, waiters=2)
+    assert leader is error
+    assert waiters == [error, error]
+    assert flight.stats()['errors'] == 1
+    # The failed call is not remembered; the next caller runs again
+    assert flight.do('k', lambda: 'retried') == ('retried', False)
+
+
+def test_waiter_times_out_without_cancelling_the_leader():
+    flight = SingleFlight()
+    release = threading.Event()
+    leader = {}
+
+    def run():
+        leader['outcome'] = flight.do('k', lambda: release.wait(2.0) and 'slow result')
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    while not flight.stats()['in_flight']:
+        time.sleep(0.005)
+    with pytest.raises(SingleFlightTimeout):
+        flight.do('k', lambda: 'not run', timeout=0.05)
+    assert flight.stats()['timeouts'] == 1
+    release.set()
+    thread.join()
+    assert leader['outcome'] == ('slow result', False)
+
+
+def test_distinct_keys_do_not_coalesce():
+    flight = SingleFlight()
+    assert flight.do('a', lambda: 1) == (1, False)
+    assert flight.do('b', lambda: 2) == (2, False)
+    assert flight.stats()['coalesced'] == 0